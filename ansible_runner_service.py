@@ -17,6 +17,8 @@ import yaml
 
 import runner_service.configuration as configuration
 from runner_service.app import create_app
+from runner_service.services.host_history import backfill
+from runner_service.services.jobs import remove_stale_event_files
 from runner_service.utils import (fread,
                                   create_self_signed_cert,
                                   ssh_create_key,
@@ -153,10 +155,16 @@ def remove_artifacts(scheduler, frequency):
         dir_list = os.listdir(artifacts_dir)
         time_now = time.mktime(time.localtime())
         for artifacts in dir_list:
+            if not os.path.isdir(os.path.join(artifacts_dir, artifacts)):
+                # e.g. the host history database
+                continue
             mtime = os.path.getmtime(os.path.join(artifacts_dir, artifacts))
             time_difference = datetime.timedelta(seconds=time_now - mtime)
             if time_difference.days >= configuration.settings.artifacts_remove_age:
                 shutil.rmtree(os.path.join(artifacts_dir, artifacts))
+            else:
+                # e.g. left behind by a restart within the grace period
+                remove_stale_event_files(os.path.join(artifacts_dir, artifacts))
 
     # Reschedule next self-execution:
     scheduler.enter(frequency, 0, remove_artifacts, (scheduler, frequency))
@@ -179,6 +187,14 @@ def remove_artifacts_init():
     remove_artifacts_thread.start()
 
 
+def host_history_init():
+    # record any plays that finished while the service wasn't running
+    backfill_thread = threading.Thread(target=backfill,
+                                       name="host-history-backfill",
+                                       daemon=True)
+    backfill_thread.start()
+
+
 def main(test_mode=False):
     # Setup log and ssh and other things present in all the environments
     setup_common_environment()
@@ -196,6 +212,9 @@ def main(test_mode=False):
     if configuration.settings.mode == 'prod' and configuration.settings.artifacts_remove_age > 0:
         remove_artifacts_init()
 
+    if configuration.settings.host_history:
+        host_history_init()
+
     # Start the API server
     app.run(host=configuration.settings.ip_address,
             port=configuration.settings.port,
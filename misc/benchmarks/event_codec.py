@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Compare the JSON backends of runner_service.codec on large event listings
+
+A synthetic play is written to a temporary artifacts directory, then the
+event endpoints' service calls are timed with each backend:
+
+  parse - ListEvents with a filter the index can't answer, so every event
+          file is parsed
+  list  - encoding the ListEvents response of every event
+  fetch - GetEvent of the last event, made --large bytes, plus encoding its
+          response
+
+Usage: event_codec.py [--events N] [--payload BYTES] [--large BYTES]
+                      [--rounds N]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import uuid
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "..", "..")))
+
+
+def make_event(counter, payload):
+    return {"uuid": str(uuid.uuid4()),
+            "counter": counter,
+            "event": "runner_on_ok",
+            "stdout": "ok: [host-{}]".format(counter % 100),
+            "created": "2019-01-01T00:00:00.000000",
+            "event_data": {"host": "host-{}".format(counter % 100),
+                           "task": "task-{}".format(counter // 100),
+                           "task_action": "command",
+                           "res": {"stdout_lines": ["x" * 64] * (payload // 64),
+                                   "rc": 0,
+                                   "changed": False}}}
+
+
+def build_play(root_dir, count, payload, large):
+    play_uuid = str(uuid.uuid1())
+    event_dir = os.path.join(root_dir, "artifacts", play_uuid, "job_events")
+    os.makedirs(event_dir)
+
+    for counter in range(1, count + 1):
+        event = make_event(counter, large if counter == count else payload)
+        event_file = "{}-{}.json".format(counter, event['uuid'])
+        with open(os.path.join(event_dir, event_file), 'w') as event_fd:
+            json.dump(event, event_fd)
+
+    with open(os.path.join(root_dir, "artifacts", play_uuid, "status"),
+              'w') as status_fd:
+        status_fd.write("successful")
+
+    return play_uuid, event_file[:-5]
+
+
+def best_of(rounds, func):
+    times = []
+    for _ctr in range(rounds):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--payload", type=int, default=4096)
+    parser.add_argument("--large", type=int, default=4 * 1024 * 1024)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    # the service's debug logging would otherwise dominate the timings
+    logging.disable(logging.INFO)
+
+    # run from an empty directory, so no local config.yaml is picked up
+    root_dir = tempfile.mkdtemp()
+    os.chdir(root_dir)
+
+    from runner_service import configuration, codec
+    configuration.init("dev")
+    configuration.settings.playbooks_root_dir = root_dir
+
+    from runner_service.services.jobs import get_events, get_event
+
+    play_uuid, event_id = build_play(root_dir, args.events, args.payload,
+                                     args.large)
+    listing = get_events(play_uuid, {}).__dict__
+
+    benchmarks = [
+        ("parse", lambda: get_events(play_uuid, {"task_action": "command"})),
+        ("list", lambda: codec.dumps_bytes(listing)),
+        ("fetch", lambda: codec.dumps_bytes(
+            get_event(play_uuid, event_id).__dict__)),
+    ]
+
+    fast = codec.orjson
+    backends = [("json", None)] + ([("orjson", fast)] if fast else [])
+
+    print("{} events, ~{} bytes each, best of {} rounds".format(
+        args.events, args.payload, args.rounds))
+    header = "".join("{:>10}".format(name) for name, _m in backends)
+    print("{:<8}{}".format("", header))
+    try:
+        for label, func in benchmarks:
+            timings = []
+            for _name, module in backends:
+                codec.orjson = module
+                timings.append(best_of(args.rounds, func))
+            row = "".join("{:>8.1f}ms".format(t * 1000) for t in timings)
+            print("{:<8}{}".format(label, row))
+    finally:
+        codec.orjson = fast
+        shutil.rmtree(root_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,10 @@ from .controllers import (ListPlaybooks,
                           API,
                           ListEvents,
                           GetEvent,
+                          GetEventBatch,
+                          StreamEvents,
+                          JobStdout,
+                          JobProfile,
                           ListGroups,
                           ManageGroups,
                           Hosts,
@@ -17,9 +21,11 @@ from .controllers import (ListPlaybooks,
                           HostVars,
                           GroupVars,
                           HostDetails,
+                          HostHistory,
                           PrometheusMetrics
                           )
 
+from .controllers.utils import output_json
 from runner_service import configuration
 
 import logging
@@ -34,6 +40,7 @@ def create_app():
     app.config.from_object(configuration.settings)
 
     api = Api(app)
+    api.representation('application/json')(output_json)
 
     api.add_resource(ListPlaybooks, "/api/v1/playbooks")
     api.add_resource(StartPlaybook, "/api/v1/playbooks/<playbook_name>")
@@ -42,6 +49,10 @@ def create_app():
 
     api.add_resource(ListEvents, "/api/v1/jobs/<play_uuid>/events")
     api.add_resource(GetEvent, "/api/v1/jobs/<play_uuid>/events/<event_uuid>")
+    api.add_resource(StreamEvents, "/api/v1/jobs/<play_uuid>/events/stream")
+    api.add_resource(GetEventBatch, "/api/v1/jobs/<play_uuid>/events:batch")
+    api.add_resource(JobStdout, "/api/v1/jobs/<play_uuid>/stdout")
+    api.add_resource(JobProfile, "/api/v1/jobs/<play_uuid>/profile")
 
     api.add_resource(ListGroups, "/api/v1/groups")
     api.add_resource(ManageGroups, "/api/v1/groups/<group_name>")
@@ -49,6 +60,7 @@ def create_app():
     api.add_resource(Hosts, "/api/v1/hosts")
     api.add_resource(HostDetails, "/api/v1/hosts/<host_name>")
     api.add_resource(HostMgmt, "/api/v1/hosts/<host_name>/groups/<group_name>")
+    api.add_resource(HostHistory, "/api/v1/hosts/<host_name>/history")
 
     api.add_resource(HostVars, "/api/v1/hostvars/<host_name>/groups/<group_name>")   # noqa: E501
     api.add_resource(GroupVars, "/api/v1/groupvars/<group_name>")   # noqa: E501
@@ -1,4 +1,16 @@
-from collections import defaultdict
+import sys
+import bisect
+import datetime
+import threading
+from collections import defaultdict, OrderedDict
+
+from runner_service import configuration
+from .services.event_index import (EventRecord,
+                                   Postings,
+                                   INDEXED_KEYS,
+                                   STORAGE_FILES,
+                                   STORAGE_LOG,
+                                   narrow)
 
 # define dict based variables to act as caches across other modules
 
@@ -21,8 +33,222 @@ class RunnerStats(object):
         "async_ok": 0,
         "async_poll": 0}
 
+    # time from launching a playbook to its first event - the cost of
+    # starting ansible-playbook, loading its plugins, the inventory and the
+    # playbook
+    job_startup = {
+        "count": 0,
+        "total_secs": 0.0,
+        "last_secs": 0.0,
+        "max_secs": 0.0}
+
+
+def sizeof(obj):
+    """ Estimate the memory used by an object, including its contents """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sizeof(k) + sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(sizeof(item) for item in obj)
+    return size
+
+
+class JobEvents(object):
+    """ Events received for a play, held as EventRecords in counter order
+
+    Waiters (e.g. event streams) block on the condition until a new event
+    arrives or the play finishes, so they only ever process new events. The
+    postings of the events are maintained as they arrive, for filtering.
+    """
+
+    def __init__(self, pb_path, storage=STORAGE_FILES):
+        self.pb_path = pb_path
+        self.storage = storage
+        self.time = datetime.datetime.now()
+        self.finished = None
+        self.evicted = False
+        self.nbytes = 0
+        self.cond = threading.Condition()
+        self.postings = Postings()
+        self._counters = []
+        self._by_counter = {}
+        self._by_uuid = {}
+        self._latest = None
+
+    def __len__(self):
+        return len(self._counters)
+
+    def __contains__(self, event_uuid):
+        return event_uuid in self._by_uuid
+
+    def get(self, event_uuid, default=None):
+        return self._by_uuid.get(event_uuid, default)
+
+    def get_counter(self, counter, default=None):
+        return self._by_counter.get(counter, default)
+
+    def add(self, event_data, offset=None, length=None):
+        """ Add an event, returning the change in the size of the play
+
+        :param event_data: dict/json of the job event
+        :param offset: offset of the event within the play's event log
+        :param length: size of the event within the play's event log
+        """
+        record = EventRecord(event_data, self.pb_path, offset, length)
+        counter = record.counter
+        size = sizeof(record)
+        with self.cond:
+            if counter not in self._by_counter:
+                # events normally arrive in order, so this is an append
+                bisect.insort(self._counters, counter)
+            else:
+                size -= sizeof(self._by_counter[counter])
+            if self.storage == STORAGE_LOG:
+                # already in the log, so readers don't need the event itself
+                record.release()
+            elif self._latest is not None:
+                # the runner has written the previous event's file by now
+                self._latest.release()
+            if self.storage != STORAGE_LOG:
+                self._latest = record
+            self.nbytes += size
+            self._by_counter[counter] = record
+            self._by_uuid[record.uuid] = record
+            self.postings.add(counter, {key: getattr(record, key)
+                                        for key in INDEXED_KEYS})
+            self.cond.notify_all()
+        return size
+
+    def since(self, counter=0):
+        """ Return the events with a counter above the one given, in order """
+        with self.cond:
+            pos = bisect.bisect_right(self._counters, counter)
+            return [self._by_counter[c] for c in self._counters[pos:]]
+
+    def select(self, filter, ignored_events, since=0):
+        """ Return the events that may match a filter, in counter order
+
+        When the filter's key/value pairs only use indexed keys the postings
+        are used to find the events, otherwise every event after since is a
+        candidate. The candidates are then narrowed by any query conditions
+        on the fields the records hold.
+        """
+        if len(filter) and all(key in INDEXED_KEYS for key in filter):
+            with self.cond:
+                counters = self.postings.lookup(filter, ignored_events)
+                events = [self._by_counter[c] for c in sorted(counters)
+                          if c > since]
+        else:
+            events = self.since(since)
+
+        return narrow(events, filter)
+
+    def finish(self, status):
+        with self.cond:
+            if self._latest is not None:
+                self._latest.release()
+                self._latest = None
+            self.finished = status
+            self.cond.notify_all()
+
+    def evict(self):
+        with self.cond:
+            self.evicted = True
+            self.cond.notify_all()
+
+    def wait(self, counter, timeout):
+        """ Wait for events after the given counter, or the end of the play
+
+        :param counter: last event counter the caller has seen
+        :param timeout: max time in seconds to wait for a new event
+        :return: tuple of (list of new events, finished status or None)
+        """
+        with self.cond:
+            events = self.since(counter)
+            if not events and self.finished is None and not self.evicted:
+                self.cond.wait(timeout)
+                events = self.since(counter)
+            return events, self.finished
+
+
+class EventCache(object):
+    """ LRU cache of the JobEvents of recent plays
+
+    The cache is bounded by the estimated size of the events it holds
+    (event_cache_max_bytes) as well as by the number of plays
+    (event_cache_size). Reads and new events both make a play the most
+    recently used, and the least recently used plays are evicted first.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._plays = OrderedDict()
+
+    def __contains__(self, play_uuid):
+        return play_uuid in self._plays
+
+    def __len__(self):
+        return len(self._plays)
+
+    def get(self, play_uuid):
+        """ Return the JobEvents of a play, or None if it isn't cached """
+        with self.lock:
+            job_events = self._plays.get(play_uuid)
+            if job_events is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._plays.move_to_end(play_uuid)
+            return job_events
+
+    def peek(self, play_uuid):
+        """ Return the JobEvents of a play, without affecting the LRU """
+        return self._plays.get(play_uuid)
+
+    def add(self, play_uuid, job_events):
+        with self.lock:
+            if play_uuid in self._plays:
+                self._remove(play_uuid)
+            self._plays[play_uuid] = job_events
+            self.nbytes += job_events.nbytes
+            self._trim()
+
+    def add_event(self, play_uuid, event_data, offset=None, length=None):
+        """ Add an event to a cached play, ignoring plays not in the cache """
+        with self.lock:
+            job_events = self._plays.get(play_uuid)
+            if job_events is None:
+                return
+            self.nbytes += job_events.add(event_data, offset, length)
+            self._plays.move_to_end(play_uuid)
+            self._trim()
+
+    def _remove(self, play_uuid):
+        job_events = self._plays.pop(play_uuid)
+        self.nbytes -= job_events.nbytes
+        return job_events
+
+    def _trim(self):
+        max_plays = configuration.settings.event_cache_size
+        max_bytes = configuration.settings.event_cache_max_bytes
+
+        while self._plays:
+            if len(self._plays) <= max_plays and self.nbytes <= max_bytes:
+                break
+            play_uuid, job_events = self._plays.popitem(last=False)
+            self.nbytes -= job_events.nbytes
+            self.evictions += 1
+            job_events.evict()
+
+
+event_cache = EventCache()
 
-event_cache = {}
+# event indexes of completed plays, loaded from their artifacts
+index_cache = OrderedDict()
 
 runner_cache = defaultdict(dict)
 
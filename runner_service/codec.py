@@ -0,0 +1,60 @@
+""" JSON encoding and decoding of job events and API responses
+
+orjson is used when it's installed, since parsing and serializing events is
+the main cost of the event endpoints. Otherwise, or for any document orjson
+won't handle (e.g. integers beyond 64 bits, or NaN), the stdlib json module
+is used.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+backend = "orjson" if orjson else "json"
+
+if orjson:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def loads(data):
+    """ Decode a JSON document
+
+    :param data: str, bytes or memoryview holding the JSON
+    :return: decoded object (ValueError if the JSON is invalid)
+    """
+    if orjson:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # fall through, for anything valid to the stdlib decoder
+            pass
+
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def dumps_bytes(obj, pretty=False):
+    """ Encode an object as JSON
+
+    :param obj: object to encode
+    :param pretty: indent the JSON, for readability
+    :return: UTF-8 encoded JSON, as bytes
+    """
+    if orjson:
+        options = _ORJSON_OPTIONS
+        if pretty:
+            options |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, option=options)
+        except orjson.JSONEncodeError:
+            pass
+
+    return json.dumps(obj, indent=4 if pretty else None).encode('utf-8')
+
+
+def dumps(obj, pretty=False):
+    """ Encode an object as JSON, returning a str """
+    return dumps_bytes(obj, pretty).decode('utf-8')
@@ -46,7 +46,11 @@ class Config(object):
         self.log_path = Config.MODES[mode].get('log_path', None)
         self.config_file = Config.MODES[mode].get('config_file', None)
         self.config_dir = os.path.dirname(self.config_file)
-        self.event_cache_size = 3
+        # the event_cache holds the events of recent plays in memory, limited
+        # by the number of plays and by their estimated size in bytes
+        self.event_cache_size = 20
+        self.event_cache_max_bytes = 128 * 1024 * 1024
+        self.index_cache_size = 10
         self.runner_cache_size = 5
         self.debug = Config.MODES[mode].get("debug", True)
 
@@ -60,6 +64,32 @@ class Config(object):
         # set to 0 to disable the automatic removal of old artifact folders
         self.artifacts_remove_age = 7
 
+        # how the events of a running play are stored - 'files' lets
+        # ansible_runner write a file per event, 'log' appends them to a
+        # single log file per play
+        self.event_storage = 'files'
+
+        # pack the event files of a finished play into a single compressed
+        # segment, removing the individual files
+        self.compact_artifacts = True
+
+        # seconds the event files of a compacted play are kept for, so readers
+        # part way through them can finish (0 removes them straight away)
+        self.event_files_grace = 300
+
+        # number of playbooks that may run at the same time, across all the
+        # service's processes. Further runs are queued until one finishes (0
+        # removes the limit)
+        self.max_concurrent_jobs = os.cpu_count() or 1
+
+        # record the outcome of each play for each host in a database in the
+        # artifacts directory, for the hosts/<host>/history endpoint
+        self.host_history = True
+
+        # max age, in seconds, that clients and proxies may cache the state
+        # of a finished playbook run for
+        self.status_max_age = 3600
+
         # how frequently the old artifacts should be removed in days
         self.artifacts_remove_frequency = 1
 
@@ -70,8 +100,16 @@ class Config(object):
         self.ssh_timeout = 2
 
         # event_threads controls how many event files are scanned concurrently
+        # the threads are shared by all requests
         self.event_threads = 10
 
+        # number of processes used to decode event files, instead of the
+        # event_threads themselves (0 disables the process pool)
+        self.event_scan_processes = 0
+
+        # seconds between keepalive messages on an idle event stream
+        self.event_stream_keepalive = 15
+
         self.port = 5001
         self.ip_address = '0.0.0.0'
         self.loglevel = logging.DEBUG
@@ -4,8 +4,16 @@ from .playbooks import (ListPlaybooks,              # noqa: F401
                         StartPlaybook,
                         StartTaggedPlaybook)
 from .api import API                                # noqa: F401
-from .hosts import Hosts, HostMgmt, HostDetails     # noqa: F401
-from .jobs import ListEvents, GetEvent              # noqa: F401
+from .hosts import (Hosts,                          # noqa: F401
+                    HostMgmt,
+                    HostDetails,
+                    HostHistory)
+from .jobs import (ListEvents,                      # noqa: F401
+                   GetEvent,
+                   GetEventBatch,
+                   StreamEvents,
+                   JobStdout,
+                   JobProfile)
 from .groups import ListGroups, ManageGroups        # noqa: F401
 from .metrics import PrometheusMetrics              # noqa: F401
 from .vars import HostVars, GroupVars               # noqa: F401
@@ -7,6 +7,7 @@ from ..services.hosts import (get_hosts,
                               remove_host,
                               get_host_membership
                               )
+from ..services.host_history import get_host_history
 from ..services.utils import APIResponse
 
 import logging
@@ -241,3 +242,65 @@ class HostMgmt(BaseResource):
 
         response = remove_host(host_name, group_name)
         return response.__dict__, self.state_to_http[response.status]
+
+
+class HostHistory(BaseResource):
+    """Show the playbook runs (jobs) that have targeted a given host"""
+
+    @log_request(logger)
+    def get(self, host_name):
+        """
+        GET {host_name}/history[?playbook=name&outcome=failed&limit=N]
+        Return the most recent playbook runs against the host, newest first, with the outcome of each run for the
+        host - failed, unreachable, changed, ok or skipped. Runs may be filtered by playbook and outcome, and limit
+        (default 20) sets the number of runs returned.
+
+        Example.
+
+        ```
+        $ curl -k -i --key ./client.key --cert ./client.crt "https://localhost:5001/api/v1/hosts/con-1/history?playbook=probe-disks.yml&outcome=failed&limit=1" -X GET
+        HTTP/1.0 200 OK
+        Content-Type: application/json
+        Content-Length: 218
+        Server: Werkzeug/0.14.1 Python/3.6.6
+        Date: Wed, 05 Sep 2018 04:59:05 GMT
+
+        {
+            "status": "OK",
+            "msg": "",
+            "data": {
+                "history": [
+                    {
+                        "play_uuid": "53b955f2-b79a-11e8-8be9-c85b7671906d",
+                        "playbook": "probe-disks.yml",
+                        "outcome": "failed",
+                        "status": "failed",
+                        "finished": "2018-09-13T21:16:55.644643"
+                    }
+                ],
+                "total_plays": 1
+            }
+        }
+        ```
+        """ # noqa
+
+        r = APIResponse()
+        args = request.args.to_dict()
+
+        if not all(key in ['playbook', 'outcome', 'limit'] for key in args):
+            r.status, r.msg = "INVALID", \
+                              "Supported parameters are playbook, outcome " \
+                              "and limit"
+            return r.__dict__, self.state_to_http[r.status]
+
+        limit = args.get('limit', '20')
+        if not limit.isdigit() or int(limit) < 1:
+            r.status, r.msg = "INVALID", "limit must be a positive number"
+            return r.__dict__, self.state_to_http[r.status]
+
+        response = get_host_history(host_name,
+                                    playbook=args.get('playbook'),
+                                    outcome=args.get('outcome'),
+                                    limit=int(limit))
+
+        return response.__dict__, self.state_to_http[response.status]
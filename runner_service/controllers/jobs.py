@@ -1,16 +1,75 @@
 # from flask import request
+from flask import Response, stream_with_context
 from flask_restful import request
 # import logging
-from .utils import log_request
+from .utils import (log_request,
+                    file_chunks,
+                    raw_json_response,
+                    streamed_json_response,
+                    etag_headers,
+                    not_modified)
 from .base import BaseResource
 
-from ..services.jobs import get_events, get_event
+from ..services.jobs import (list_events,
+                             events_page_chunks,
+                             get_raw_event,
+                             get_event,
+                             get_event_batch,
+                             open_stdout,
+                             event_stream,
+                             job_exists,
+                             job_etag,
+                             decode_cursor)
+from ..services.event_query import parse_query
+from ..services.profile import get_profile
+from ..services.shards import is_sharded, list_sharded_events
 from ..services.utils import APIResponse
 
 import logging
 logger = logging.getLogger(__name__)
 
 
+def _paging_args(args):
+    """ Remove the paging parameters from the request args
+
+    :param args: dict of the request's query parameters
+    :return: tuple of (since, limit)
+    :raises ValueError: if the parameters are not valid
+    """
+    since = args.pop('since', '0')
+    limit = args.pop('limit', None)
+    cursor = args.pop('next', None)
+
+    # the cursor from a previous page takes precedence
+    since = decode_cursor(cursor) if cursor else int(since)
+    if since < 0:
+        raise ValueError("since must not be negative")
+
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError("limit must be a positive number")
+
+    return since, limit
+
+
+def _fields_arg(args):
+    """ Remove the fields parameter from the request args
+
+    :param args: dict of the request's query parameters
+    :return: list of field names, or None when all the fields are wanted
+    :raises ValueError: if the parameter is not valid
+    """
+    fields = args.pop('fields', None)
+    if fields is None:
+        return None
+
+    fields = [field.strip() for field in fields.split(',')]
+    if not all(fields):
+        raise ValueError("fields must be a comma separated list of names")
+    return fields
+
+
 class ListEvents(BaseResource):
     """Return a list of events within a given playbook run (job) """
 
@@ -19,55 +78,36 @@ class ListEvents(BaseResource):
         """
         GET {play_uuid}/events
         Return a list of the event uuid's for the given job(play_uuid). Filtering is also supported, using the
-        ?varname=value&varname=value syntax
+        ?varname=value&varname=value syntax. Besides '=', a field may be compared using >=, <=, >, <, != or ~= (a regular
+        expression search) e.g. ?counter>=500&created<2018-09-10T20:04:00&task~=^Install&event!=runner_on_skipped.
+        Numbers are compared as numbers, and anything else (including the 'created' timestamp) as a string
+
+        The list may be paged with ?limit=N, in which case a 'next' cursor is returned while more events are available.
+        Pass it back as ?next=cursor to get the following page. ?since=counter returns only the events after a given
+        event counter, allowing incremental polling of a running job.
+
+        ?fields=name,name returns the given fields of each event instead of its summary. A field may be a dotted path
+        into the event, e.g. ?fields=counter,host,event_data.res.rc
+
+        The events of a sharded job are listed shard by shard, each naming the play_uuid of its shard. They can't be
+        paged as a whole, but each shard's events may be paged as a job of its own.
+
+        The response is sent in chunks (Transfer-Encoding: chunked) as the events are matched, so the first events
+        arrive before the whole job has been read. Events that can't be read before the response starts return a 500;
+        once it has started, a read failure cuts the transfer short, so the client never sees a partial page as
+        complete.
 
         Example.
 
         ```
         $ curl -k -i --key ./client.key --cert ./client.crt https://localhost:5001/api/v1/jobs/9c1714aa-b534-11e8-8c14-aced5c652dd1/events -X GET
-        HTTP/1.0 200 OK
+        HTTP/1.1 200 OK
         Content-Type: application/json
-        Content-Length: 1142
+        Transfer-Encoding: chunked
         Server: Werkzeug/0.14.1 Python/3.6.5
         Date: Mon, 10 Sep 2018 20:04:53 GMT
 
-        {
-            "status": "OK",
-            "msg": "",
-            "data": {
-                "events": {
-                    "2-0eaf70cd-0d86-4209-a3ca-73c0633afa27": {
-                        "event": "playbook_on_start"
-                    },
-                    "3-aced5c65-2dd1-7634-7812-00000000000b": {
-                        "event": "playbook_on_play_start"
-                    },
-                    "4-aced5c65-2dd1-7634-7812-00000000000d": {
-                        "event": "playbook_on_task_start",
-                        "task": "Step 1"
-                    },
-                    "5-3f6d4b83-df90-401c-9fd7-2b646f00ccfe": {
-                        "event": "runner_on_ok",
-                        "host": "localhost",
-                        "task": "Step 1"
-                    },
-                    "6-aced5c65-2dd1-7634-7812-00000000000e": {
-                        "event": "playbook_on_task_start",
-                        "task": "Step 2"
-                    },
-                    "7-ca1c5d3a-218f-487e-97ec-be5751ac5b40": {
-                        "event": "runner_on_ok",
-                        "host": "localhost",
-                        "task": "Step 2"
-                    },
-                    "8-7c68cc25-9ccc-4b5c-b4b3-fddaf297e7de": {
-                        "event": "playbook_on_stats"
-                    }
-                },
-                "total_events": 7
-            }
-        }
-
+        {"status": "OK", "msg": "", "data": {"events": {"2-0eaf70cd-0d86-4209-a3ca-73c0633afa27": {"event": "playbook_on_start"}, "3-aced5c65-2dd1-7634-7812-00000000000b": {"event": "playbook_on_play_start"}, "4-aced5c65-2dd1-7634-7812-00000000000d": {"event": "playbook_on_task_start", "task": "Step 1"}, "5-3f6d4b83-df90-401c-9fd7-2b646f00ccfe": {"event": "runner_on_ok", "host": "localhost", "task": "Step 1"}, "6-aced5c65-2dd1-7634-7812-00000000000e": {"event": "playbook_on_task_start", "task": "Step 2"}, "7-ca1c5d3a-218f-487e-97ec-be5751ac5b40": {"event": "runner_on_ok", "host": "localhost", "task": "Step 2"}, "8-7c68cc25-9ccc-4b5c-b4b3-fddaf297e7de": {"event": "playbook_on_stats"}}, "total_events": 7}}
 
         ```
         """
@@ -80,9 +120,53 @@ class ListEvents(BaseResource):
             _e.status, _e.msg = "INVALID", "playbook uuid missing"
             return _e.__dict__, self.state_to_http[_e.status]
 
-        response = get_events(play_uuid, filter)
+        try:
+            since, limit = _paging_args(filter)
+        except ValueError as err:
+            _e.status, _e.msg = "INVALID", "Invalid paging parameter: {}".format(err)
+            return _e.__dict__, self.state_to_http[_e.status]
 
-        return response.__dict__, self.state_to_http[response.status]
+        try:
+            fields = _fields_arg(filter)
+        except ValueError as err:
+            _e.status, _e.msg = "INVALID", "Invalid fields parameter: {}".format(err)
+            return _e.__dict__, self.state_to_http[_e.status]
+
+        try:
+            filter = parse_query(filter)
+        except ValueError as err:
+            _e.status, _e.msg = "INVALID", "Invalid query: {}".format(err)
+            return _e.__dict__, self.state_to_http[_e.status]
+
+        if is_sharded(play_uuid):
+            # the events of each shard are paged by their own counters
+            if since or limit is not None:
+                _e.status, _e.msg = "INVALID", "Invalid paging parameter: the events of a sharded job are paged " \
+                                               "through each of its shards"
+                return _e.__dict__, self.state_to_http[_e.status]
+
+            response = list_sharded_events(play_uuid, filter, fields)
+            return streamed_json_response(response,
+                                          self.state_to_http[response.status],
+                                          events_page_chunks(response.data, None))
+
+        # a finished job's events don't change, so the client's copy may
+        # still be current
+        etag = job_etag(play_uuid, request.full_path)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+
+        response = list_events(play_uuid, filter, since, limit, fields)
+        if response.status != "OK":
+            return response.__dict__, self.state_to_http[response.status]
+
+        # the events are sent as they're matched, in a chunked response
+        resp = streamed_json_response(response,
+                                      self.state_to_http[response.status],
+                                      events_page_chunks(response.data, limit))
+        resp.headers.extend(etag_headers(etag))
+        return resp
 
 
 class GetEvent(BaseResource):
@@ -92,7 +176,10 @@ class GetEvent(BaseResource):
     def get(self, play_uuid, event_uuid):
         """
         GET {play_uuid, event_uuid}
-        Return the json job event data for a given event uuid within a job
+        Return the json job event data for a given event uuid within a job. The event is returned exactly as it's
+        held in the job's artifacts, without being decoded and re-encoded by the service
+
+        ?fields=name,name returns only the given fields of the event, using the same syntax as the event list
 
         Example.
 
@@ -104,28 +191,235 @@ class GetEvent(BaseResource):
         Server: Werkzeug/0.14.1 Python/3.6.5
         Date: Mon, 10 Sep 2018 20:12:03 GMT
 
-        {
-            "status": "OK",
-            "msg": "",
-            "data": {
-                "uuid": "0eaf70cd-0d86-4209-a3ca-73c0633afa27",
-                "counter": 2,
-                "stdout": "",
-                "start_line": 1,
-                "end_line": 1,
-                "created": "2018-09-10T20:03:40.145870",
-                "pid": 27875,
-                "event_data": {
-                    "pid": 27875,
-                    "playbook_uuid": "0eaf70cd-0d86-4209-a3ca-73c0633afa27",
-                    "playbook": "test.yml"
-                },
-                "event": "playbook_on_start"
-            }
-        }
+        {"status": "OK", "msg": "", "data": {"uuid": "0eaf70cd-0d86-4209-a3ca-73c0633afa27", "counter": 2, "stdout": "", "start_line": 1, "end_line": 1, "created": "2018-09-10T20:03:40.145870", "pid": 27875, "event_data": {"pid": 27875, "playbook_uuid": "0eaf70cd-0d86-4209-a3ca-73c0633afa27", "playbook": "test.yml"}, "event": "playbook_on_start"}}
+        ```
+        """
+
+        _e = APIResponse()
+
+        try:
+            fields = _fields_arg(request.args.to_dict())
+        except ValueError as err:
+            _e.status, _e.msg = "INVALID", "Invalid fields parameter: {}".format(err)
+            return _e.__dict__, self.state_to_http[_e.status]
+
+        etag = job_etag(play_uuid, request.full_path)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+
+        if fields is not None:
+            # the event has to be decoded to pick out the fields
+            response = get_event(play_uuid, event_uuid, fields)
+            return (response.__dict__, self.state_to_http[response.status],
+                    etag_headers(etag))
+
+        response = get_raw_event(play_uuid, event_uuid)
+        if response.status != "OK":
+            return response.__dict__, self.state_to_http[response.status]
+
+        # the event's JSON is passed through, without being decoded
+        resp = raw_json_response(response, self.state_to_http[response.status])
+        resp.headers.extend(etag_headers(etag))
+        return resp
+
+
+class GetEventBatch(BaseResource):
+    """Return a set of events within a playbook run (job) in one request"""
+
+    @log_request(logger)
+    def post(self, play_uuid):
+        """
+        POST {play_uuid}/events:batch
+        Return the events given by a list of event ids or event counters, sent as json in the form
+        {"events": [id_or_counter, ...]}. The events are returned in counter order, and any that couldn't be found are
+        listed in 'missing'. ?fields= may be used to return only some fields of each event, as for the event list.
+
+        Example.
+
+        ```
+        $ curl -k -i --key ./client.key --cert ./client.crt -H "Content-Type: application/json" --data '{"events": [5, "7-ca1c5d3a-218f-487e-97ec-be5751ac5b40", 99]}' "https://localhost:5001/api/v1/jobs/9c1714aa-b534-11e8-8c14-aced5c652dd1/events:batch?fields=host,event_data.res.msg" -X POST
+        HTTP/1.0 200 OK
+        Content-Type: application/json
+        Content-Length: 238
+        Server: Werkzeug/0.14.1 Python/3.6.5
+        Date: Mon, 10 Sep 2018 20:12:03 GMT
+
+        {"status": "OK", "msg": "", "data": {"events": {"5-3f6d4b83-df90-401c-9fd7-2b646f00ccfe": {"host": "localhost", "event_data.res.msg": "Step 1"}, "7-ca1c5d3a-218f-487e-97ec-be5751ac5b40": {"host": "localhost", "event_data.res.msg": "Step 2"}}, "total_events": 2, "missing": [99]}}
+        ```
+        """
+        r = APIResponse()
+
+        if not request.content_type or \
+                not request.content_type.startswith('application/json'):
+            r.status, r.msg = "UNSUPPORTED", \
+                              "Invalid content-type({}). Use application/" \
+                              "json".format(request.content_type)
+            return r.__dict__, self.state_to_http[r.status]
+
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or \
+                not isinstance(payload.get('events'), list):
+            r.status, r.msg = "INVALID", \
+                              "Expected a json object holding a list of events"
+            return r.__dict__, self.state_to_http[r.status]
+
+        try:
+            fields = _fields_arg(request.args.to_dict())
+        except ValueError as err:
+            r.status, r.msg = "INVALID", "Invalid fields parameter: {}".format(err)
+            return r.__dict__, self.state_to_http[r.status]
+
+        response = get_event_batch(play_uuid, payload['events'], fields)
+
+        return response.__dict__, self.state_to_http[response.status]
+
+
+class StreamEvents(BaseResource):
+    """Stream the events of a playbook run (job) as they happen"""
+
+    @log_request(logger)
+    def get(self, play_uuid):
+        """
+        GET {play_uuid}/events/stream
+        Return a Server-Sent Events stream of the job's events. Each event is pushed as soon as the service receives
+        it, using the event counter as the message id, and the stream ends with an 'end' message holding the final
+        status of the job. Reconnecting clients may send a Last-Event-ID header to resume from a given event counter.
+        Filtering is supported using the same query syntax as the event list, as is ?fields=
+
+        Example.
+
+        ```
+        $ curl -k -i -N --key ./client.key --cert ./client.crt https://localhost:5001/api/v1/jobs/9c1714aa-b534-11e8-8c14-aced5c652dd1/events/stream -H "Last-Event-ID: 5" -X GET
+        HTTP/1.0 200 OK
+        Content-Type: text/event-stream; charset=utf-8
+        Cache-Control: no-cache
+        Server: Werkzeug/0.14.1 Python/3.6.5
+        Date: Mon, 10 Sep 2018 20:04:53 GMT
+
+        retry: 15000
+
+        id: 6
+        data: {"6-aced5c65-2dd1-7634-7812-00000000000e": {"event": "playbook_on_task_start", "task": "Step 2"}}
+
+        id: 7
+        data: {"7-ca1c5d3a-218f-487e-97ec-be5751ac5b40": {"event": "runner_on_ok", "host": "localhost", "task": "Step 2"}}
+
+        id: 8
+        data: {"8-7c68cc25-9ccc-4b5c-b4b3-fddaf297e7de": {"event": "playbook_on_stats"}}
+
+        event: end
+        data: {"status": "successful"}
+
+        ```
+        """
+        filter = request.args.to_dict()
+
+        _e = APIResponse()
+
+        try:
+            fields = _fields_arg(filter)
+            filter = parse_query(filter)
+        except ValueError as err:
+            _e.status, _e.msg = "INVALID", "Invalid query: {}".format(err)
+            return _e.__dict__, self.state_to_http[_e.status]
+
+        last_event_id = request.headers.get('Last-Event-ID', '0')
+        if not last_event_id.isdigit():
+            _e.status, _e.msg = "INVALID", "Last-Event-ID must be an event counter"
+            return _e.__dict__, self.state_to_http[_e.status]
+
+        if not job_exists(play_uuid):
+            _e.status, _e.msg = "NOTFOUND", "playbook uuid given does not exist"
+            return _e.__dict__, self.state_to_http[_e.status]
+
+        stream = event_stream(play_uuid, filter, int(last_event_id), fields)
+        return Response(stream_with_context(stream),
+                        mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache",
+                                 "X-Accel-Buffering": "no"})
+
+
+class JobStdout(BaseResource):
+    """Return the output of a playbook run (job)"""
+
+    @log_request(logger)
+    def get(self, play_uuid):
+        """
+        GET {play_uuid}/stdout
+        Return the output of the job as text, exactly as ansible displayed it. Use ?offset=N to only fetch the output
+        after a given byte offset, so a client following a running job just receives the output it hasn't seen - the
+        next offset is the one given plus the Content-Length of the response.
+
+        Example.
+
+        ```
+        $ curl -k -i --key ./client.key --cert ./client.crt https://localhost:5001/api/v1/jobs/9c1714aa-b534-11e8-8c14-aced5c652dd1/stdout?offset=421 -X GET
+        HTTP/1.0 200 OK
+        Content-Type: text/plain; charset=utf-8
+        Content-Length: 177
+        Cache-Control: no-cache
+        Server: Werkzeug/0.14.1 Python/3.6.5
+        Date: Mon, 10 Sep 2018 20:04:53 GMT
+
+        ok: [localhost]
+
+        PLAY RECAP *********************************************************************
+        localhost                  : ok=2    changed=0    unreachable=0    failed=0
+
+        ```
+        """
+        _e = APIResponse()
+
+        offset = request.args.get('offset', '0')
+        if not offset.isdigit():
+            _e.status, _e.msg = "INVALID", "offset must be a byte offset"
+            return _e.__dict__, self.state_to_http[_e.status]
+
+        response = open_stdout(play_uuid, int(offset))
+        if response.status != "OK":
+            return response.__dict__, self.state_to_http[response.status]
+
+        stdout_fd, length = response.data
+        chunks = file_chunks(stdout_fd, length=length) if stdout_fd else []
+        resp = Response(chunks, self.state_to_http[response.status],
+                        mimetype='text/plain',
+                        headers={"Cache-Control": "no-cache"})
+        resp.headers['Content-Length'] = length
+        return resp
+
+
+class JobProfile(BaseResource):
+    """Return the timing profile of a playbook run (job)"""
+
+    @log_request(logger)
+    def get(self, play_uuid):
+        """
+        GET {play_uuid}/profile[?top=N]
+        Return the time taken by the job's tasks and hosts, listing the top N (default 10) slowest of each, and the
+        critical path - the slowest host of each task, which the job waited on. Durations are in seconds, and are
+        taken from the events' timestamps as they arrive, so a running job may be profiled too.
+
+        Example.
+
+        ```
+        $ curl -k -i --key ./client.key --cert ./client.crt https://localhost:5001/api/v1/jobs/9c1714aa-b534-11e8-8c14-aced5c652dd1/profile?top=1 -X GET
+        HTTP/1.0 200 OK
+        Content-Type: application/json
+        Content-Length: 377
+        Server: Werkzeug/0.14.1 Python/3.6.5
+        Date: Mon, 10 Sep 2018 20:12:03 GMT
+
+        {"status": "OK", "msg": "", "data": {"duration": 4.682, "tasks": [{"task": "Step 1", "start": "2018-09-10T20:03:40.165521", "duration": 2.51, "hosts": 1}], "hosts": [{"host": "localhost", "duration": 4.615}], "critical_path": [{"task": "Step 1", "host": "localhost", "duration": 2.51}, {"task": "Step 2", "host": "localhost", "duration": 2.105}]}}
         ```
         """
+        _e = APIResponse()
+
+        top = request.args.get('top', '10')
+        if not top.isdigit() or int(top) < 1:
+            _e.status, _e.msg = "INVALID", "top must be a positive number"
+            return _e.__dict__, self.state_to_http[_e.status]
 
-        response = get_event(play_uuid, event_uuid)
+        response = get_profile(play_uuid, int(top))
 
         return response.__dict__, self.state_to_http[response.status]
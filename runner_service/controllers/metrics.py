@@ -30,6 +30,62 @@ class PrometheusMetrics(BaseResource):
         runner_service_event_status{hostname="rh460p",event_status="async_failed"} 0
         runner_service_event_status{hostname="rh460p",event_status="async_ok"} 0
         runner_service_event_status{hostname="rh460p",event_status="async_poll"} 0
+        #HELP: runner_service_event_cache_bytes - estimated size of the event cache in bytes
+        #TYPE: runner_service_event_cache_bytes - gauge
+        runner_service_event_cache_bytes{hostname="rh460p"} 48213
+        #HELP: runner_service_event_cache_evictions - plays evicted from the event cache
+        #TYPE: runner_service_event_cache_evictions - count
+        runner_service_event_cache_evictions{hostname="rh460p"} 0
+        #HELP: runner_service_event_cache_hits - event cache lookups that found the play
+        #TYPE: runner_service_event_cache_hits - count
+        runner_service_event_cache_hits{hostname="rh460p"} 4
+        #HELP: runner_service_event_cache_misses - event cache lookups that missed the play
+        #TYPE: runner_service_event_cache_misses - count
+        runner_service_event_cache_misses{hostname="rh460p"} 2
+        #HELP: runner_service_event_cache_plays - number of plays in the event cache
+        #TYPE: runner_service_event_cache_plays - gauge
+        runner_service_event_cache_plays{hostname="rh460p"} 1
+        #HELP: runner_service_event_scan_processes - number of processes decoding job events
+        #TYPE: runner_service_event_scan_processes - gauge
+        runner_service_event_scan_processes{hostname="rh460p"} 0
+        #HELP: runner_service_event_scan_threads - number of threads scanning job events
+        #TYPE: runner_service_event_scan_threads - gauge
+        runner_service_event_scan_threads{hostname="rh460p"} 10
+        #HELP: runner_service_event_scan_threads_busy - number of event scan threads currently busy
+        #TYPE: runner_service_event_scan_threads_busy - gauge
+        runner_service_event_scan_threads_busy{hostname="rh460p"} 0
+        #HELP: runner_service_event_scans_pending - number of event scans waiting for a thread
+        #TYPE: runner_service_event_scans_pending - gauge
+        runner_service_event_scans_pending{hostname="rh460p"} 0
+        #HELP: runner_service_job_queue_depth - number of playbooks queued, waiting to run
+        #TYPE: runner_service_job_queue_depth - gauge
+        runner_service_job_queue_depth{hostname="rh460p",priority="high"} 0
+        runner_service_job_queue_depth{hostname="rh460p",priority="normal"} 2
+        runner_service_job_queue_depth{hostname="rh460p",priority="low"} 5
+        #HELP: runner_service_job_queue_oldest_wait_secs - seconds the oldest queued playbook has waited
+        #TYPE: runner_service_job_queue_oldest_wait_secs - gauge
+        runner_service_job_queue_oldest_wait_secs{hostname="rh460p"} 41.207
+        #HELP: runner_service_job_queue_wait_secs - total seconds the launched playbooks spent queued
+        #TYPE: runner_service_job_queue_wait_secs - count
+        runner_service_job_queue_wait_secs{hostname="rh460p"} 96.514
+        #HELP: runner_service_job_startup_last_secs - seconds the latest playbook took to start
+        #TYPE: runner_service_job_startup_last_secs - gauge
+        runner_service_job_startup_last_secs{hostname="rh460p"} 0.734
+        #HELP: runner_service_job_startup_max_secs - longest time a playbook took to start, in seconds
+        #TYPE: runner_service_job_startup_max_secs - gauge
+        runner_service_job_startup_max_secs{hostname="rh460p"} 1.205
+        #HELP: runner_service_job_startup_secs - total seconds from launching playbooks to their first event
+        #TYPE: runner_service_job_startup_secs - count
+        runner_service_job_startup_secs{hostname="rh460p"} 2.712
+        #HELP: runner_service_job_startups - playbooks whose startup time has been measured
+        #TYPE: runner_service_job_startups - count
+        runner_service_job_startups{hostname="rh460p"} 3
+        #HELP: runner_service_jobs_launched - playbooks launched by the job scheduler
+        #TYPE: runner_service_jobs_launched - count
+        runner_service_jobs_launched{hostname="rh460p"} 11
+        #HELP: runner_service_jobs_max_concurrent - number of playbooks that may run at the same time (0 is unlimited)
+        #TYPE: runner_service_jobs_max_concurrent - gauge
+        runner_service_jobs_max_concurrent{hostname="rh460p"} 4
         #HELP: runner_service_playbook_count - number of playbooks known to the service
         #TYPE: runner_service_playbook_count - gauge
         runner_service_playbook_count{hostname="rh460p"} 3
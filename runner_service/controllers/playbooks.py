@@ -5,7 +5,11 @@ import logging
 import re
 
 from .base import BaseResource
-from .utils import log_request
+from .utils import (log_request,
+                    etag_headers,
+                    body_etag,
+                    not_modified,
+                    client_id)
 
 from ..services.playbook import (list_playbooks,
                                  get_status,
@@ -13,12 +17,21 @@ from ..services.playbook import (list_playbooks,
                                  stop_playbook)
 
 from ..services.utils import playbook_exists, APIResponse
+from ..services.scheduler import PRIORITIES, DEFAULT_PRIORITY
+from ..services.shards import (is_sharded,
+                               get_sharded_status,
+                               start_sharded_playbook,
+                               stop_sharded_playbook)
 from ..inventory import AnsibleInventory
 from runner_service.cache import runner_cache
+from runner_service import configuration
 
 logger = logging.getLogger(__name__)
 file_mutex = threading.Lock()
 
+# states of a playbook run that has ended
+finished_states = ['successful', 'failed', 'canceled', 'timeout']
+
 
 class ListPlaybooks(BaseResource):
     """ Return the names of all available playbooks """
@@ -65,7 +78,8 @@ class PlaybookState(BaseResource):
     def get(self, play_uuid):
         """
         GET {play_uuid}
-        Return the given playbooks current state
+        Return the given playbooks current state. A playbook waiting for one of the max_concurrent_jobs slots is
+        'queued', and the data shows its position in the queue
 
         Example.
 
@@ -88,9 +102,24 @@ class PlaybookState(BaseResource):
         ```
         """
 
-        response = get_status(play_uuid)
-
-        return response.__dict__, self.state_to_http[response.status]
+        if is_sharded(play_uuid):
+            response = get_sharded_status(play_uuid)
+        else:
+            response = get_status(play_uuid)
+        if response.status != "OK" or response.msg not in finished_states:
+            return response.__dict__, self.state_to_http[response.status], \
+                {"Cache-Control": "no-cache"}
+
+        # the state of a finished run doesn't change, so clients and proxies
+        # may cache it
+        etag = body_etag(response.__dict__)
+        headers = etag_headers(etag, "max-age={}".format(
+            configuration.settings.status_max_age))
+        unchanged = not_modified(etag, headers)
+        if unchanged:
+            return unchanged
+
+        return response.__dict__, self.state_to_http[response.status], headers
 
     @log_request(logger)
     def delete(self, play_uuid):
@@ -116,6 +145,17 @@ class PlaybookState(BaseResource):
         ```
         """
         r = APIResponse()
+        if is_sharded(play_uuid):
+            canceled = stop_sharded_playbook(play_uuid)
+            if not canceled:
+                r.status, r.msg = "NOT ACTIVE", \
+                                  "playbook with uuid {} has no active " \
+                                  "shards".format(play_uuid)
+                return r.__dict__, 404
+            r.status, r.msg = 'OK', "Cancel request issued to {} " \
+                                    "shards".format(canceled)
+            return r.__dict__, 200
+
         if play_uuid not in runner_cache.keys():
             # play_uuid may be valie but it's not actually running
             r.status, r.msg = "NOT ACTIVE", \
@@ -134,7 +174,7 @@ def _run_playbook(playbook_name, tags=None):
     # TODO Move this function to the service package (services.playbook)
 
     # TODO We should use a list like this to restrict the query we support
-    valid_filter = ['limit', 'check']
+    valid_filter = ['limit', 'check', 'priority', 'shards', 'shard_group']
 
     r = APIResponse()
 
@@ -157,6 +197,18 @@ def _run_playbook(playbook_name, tags=None):
                           "filters are: {}".format(','.join(valid_filter))
         return r
 
+    if filter.get('priority', DEFAULT_PRIORITY) not in PRIORITIES:
+        r.status, r.msg = "INVALID", "Bad request, supported " \
+                          "priorities are: {}".format(','.join(PRIORITIES))
+        return r
+
+    shards = filter.get('shards', '1')
+    if not shards.isdigit() or int(shards) < 1:
+        r.status, r.msg = "INVALID", "shards must be a positive number"
+        return r
+    shards = int(shards)
+
+    target_hosts = []
     if 'limit' in filter:
 
         target_hosts = filter['limit'].split(',')
@@ -172,9 +224,39 @@ def _run_playbook(playbook_name, tags=None):
                               "Host(s) provided not in Ansible inventory"
             return r
 
+    if 'shard_group' in filter:
+        if shards < 2:
+            r.status, r.msg = "INVALID", "shard_group needs shards > 1"
+            return r
+
+        inventory = AnsibleInventory()
+        group = filter['shard_group']
+        if group not in inventory.groups:
+            r.status, r.msg = "INVALID", \
+                              "Group {} not in Ansible inventory".format(group)
+            return r
+
+        # a limit narrows the group, it doesn't add hosts outside it
+        group_hosts = inventory.group_show(group)
+        if target_hosts:
+            target_hosts = [_h for _h in group_hosts if _h in target_hosts]
+        else:
+            target_hosts = list(group_hosts)
+
+    elif shards > 1 and 'limit' not in filter:
+        # the inventory as a whole may hold hosts the playbook never
+        # targets, so the hosts to shard must be named
+        r.status, r.msg = "INVALID", "shards needs a limit or a shard_group"
+        return r
+
+    if shards > 1 and not target_hosts:
+        r.status, r.msg = "INVALID", "No hosts to shard"
+        return r
+
+    client = client_id()
     logger.info("Playbook run request for {}, from {}, "
                 "parameters: {}".format(playbook_name,
-                                        request.remote_addr,
+                                        client,
                                         vars))
 
     # does the playbook exist?
@@ -182,7 +264,12 @@ def _run_playbook(playbook_name, tags=None):
         r.status, r.msg = "NOTFOUND", "playbook file not found"
         return r
 
-    response = start_playbook(playbook_name, vars, filter, tags)
+    if shards > 1:
+        # spread the hosts across several runs of the playbook
+        response = start_sharded_playbook(playbook_name, target_hosts, shards,
+                                          vars, filter, tags, client)
+    else:
+        response = start_playbook(playbook_name, vars, filter, tags, client)
 
     play_uuid = response.data.get('play_uuid', None)
     status = response.data.get('status', None)
@@ -191,13 +278,20 @@ def _run_playbook(playbook_name, tags=None):
                                play_uuid,
                                status))
 
-    if status in ['started', 'starting', 'running', 'successful']:
+    if status in ['queued', 'started', 'starting', 'running', 'successful']:
         logger.info(msg)
     else:
         logger.error(msg)
 
+    if response.status == "TIMEOUT":
+        r.status, r.msg = response.status, response.msg
+        r.data = {"play_uuid": play_uuid}
+        return r
+
     if play_uuid:
         r.status, r.msg, r.data = "STARTED", status, {"play_uuid": play_uuid}
+        if 'shards' in response.data:
+            r.data['shards'] = response.data['shards']
         return r
     else:
         r.status, r.msg = "FAILED", "Runner thread failed to start"
@@ -215,7 +309,12 @@ class StartPlaybook(BaseResource):
         Example 1.
 
         Start a given playbook, passing a set of variables as json to use for
-        the run
+        the run. When max_concurrent_jobs playbooks are already running, the
+        run is queued and the msg is 'queued'. The queue is shared fairly
+        between clients (by certificate CN, or address), and a run may be
+        given a priority of high, normal (the default) or low. A run that
+        ansible_runner doesn't start within a few seconds returns a 504,
+        with the play_uuid of the run, which may still start
 
         ```
         $ curl -k -i --key ./client.key --cert ./client.crt -H "Content-Type: application/json" --data '{"time_delay":20}' https://localhost:5001/api/v1/playbooks/test.yml -X POST
@@ -279,6 +378,55 @@ class StartPlaybook(BaseResource):
 
         ```
 
+        Example 4:
+
+        Spreading the run across 3 playbook runs (shards), each limited to a third of the members of the shard_group
+        group (narrowed by limit, when given), or of the hosts in the limit list. The shards run in parallel, within
+        max_concurrent_jobs, and the play_uuid returned is their parent, whose state and events cover all the shards
+
+        ```
+        $ curl -k -i --key ./client.key --cert ./client.crt -H "Content-Type: application/json" --data '{"time_delay":20}' https://192.168.121.1:5001/api/v1/playbooks/test.yml?shards=3&shard_group=webservers -X POST
+        HTTP/1.1 202 ACCEPTED
+        Server: nginx/1.12.2
+        Date: Wed, 12 Jun 2019 10:02:31 GMT
+        Content-Type: application/json
+        Content-Length: 246
+        Connection: keep-alive
+
+        {
+            "status": "STARTED",
+            "msg": "running",
+            "data": {"play_uuid": "2d4a0c3e-8cf9-11e9-9154-2016b900e38f",
+                     "shards": ["2d4b1a8c-8cf9-11e9-9154-2016b900e38f",
+                                "2d4c3f02-8cf9-11e9-9154-2016b900e38f",
+                                "2d4d6a96-8cf9-11e9-9154-2016b900e38f"]
+            }
+        }
+
+        ```
+
+        Example 5:
+
+        Running a playbook ahead of the other queued runs, when the service is busy.
+
+        ```
+        $ curl -k -i --key ./client.key --cert ./client.crt -H "Content-Type: application/json" --data '{"time_delay":20}' https://192.168.121.1:5001/api/v1/playbooks/test.yml?priority=high -X POST
+        HTTP/1.1 202 ACCEPTED
+        Server: nginx/1.12.2
+        Date: Wed, 12 Jun 2019 10:04:12 GMT
+        Content-Type: application/json
+        Content-Length: 103
+        Connection: keep-alive
+
+        {
+            "status": "STARTED",
+            "msg": "queued",
+            "data": {"play_uuid": "7ab2d5a4-8cf9-11e9-9154-2016b900e38f"
+            }
+        }
+
+        ```
+
         """
 
         response = _run_playbook(playbook_name)
@@ -1,12 +1,164 @@
+import os
+import re
+import hashlib
+import itertools
 from functools import wraps
-from flask import request
+from werkzeug.http import quote_etag
+from flask import (request,
+                   make_response,
+                   current_app,
+                   stream_with_context,
+                   Response)
 from ..services.utils import APIResponse
 from .base import BaseResource
-from runner_service import configuration
+from runner_service import configuration, codec
 
 import logging
 logger = logging.getLogger(__name__)
 
+def output_json(data, code, headers=None):
+    """ Make a response with a JSON encoded body, using the codec module
+
+    Replaces flask_restful's own representation, which uses the stdlib json
+    module
+    """
+    # always end the JSON with a new line, as flask_restful does
+    dumped = codec.dumps_bytes(data, pretty=current_app.debug) + b"\n"
+
+    resp = make_response(dumped, code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+def file_chunks(file_obj, chunk_size=64 * 1024, length=None):
+    """ Read a file in chunks, closing it once it's been read
+
+    :param file_obj: open (binary) file, read from its current position
+    :param chunk_size: max size of each chunk
+    :param length: stop after this many bytes, even if the file has grown
+    """
+    try:
+        while length is None or length > 0:
+            size = chunk_size if length is None else min(chunk_size, length)
+            chunk = file_obj.read(size)
+            if not chunk:
+                break
+            if length is not None:
+                length -= len(chunk)
+            yield chunk
+    finally:
+        file_obj.close()
+
+
+def envelope(response):
+    """ Return the JSON before and after the data of an APIResponse """
+    prefix = b'{"status": ' + codec.dumps_bytes(response.status) + \
+        b', "msg": ' + codec.dumps_bytes(response.msg) + b', "data": '
+    return prefix, b'}\n'
+
+
+def raw_json_response(response, code):
+    """ Make a response from an APIResponse whose data is already JSON
+
+    The data (bytes, or an open binary file) is placed in the usual
+    status/msg/data envelope as is, rather than being decoded and encoded
+    again. A file is read in chunks, so it's never held in memory as a whole.
+    """
+    prefix, suffix = envelope(response)
+
+    if isinstance(response.data, bytes):
+        data = [response.data]
+        length = len(response.data)
+    else:
+        length = os.fstat(response.data.fileno()).st_size
+        data = file_chunks(response.data)
+
+    resp = Response(itertools.chain([prefix], data, [suffix]), code,
+                    mimetype='application/json')
+    resp.headers['Content-Length'] = len(prefix) + length + len(suffix)
+    return resp
+
+
+def buffer_chunks(chunks, buffer_size):
+    """ Join small chunks of output together, up to around buffer_size """
+    buffered, size = [], 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            yield b''.join(buffered)
+            buffered, size = [], 0
+    if buffered:
+        yield b''.join(buffered)
+
+
+def streamed_json_response(response, code, data_chunks,
+                           buffer_size=16 * 1024):
+    """ Make a chunked response, generating the data of an APIResponse
+
+    The data's JSON is sent as it's generated, so the response is never held
+    in memory as a whole
+
+    :param response: APIResponse providing the status and msg
+    :param code: HTTP status code
+    :param data_chunks: generator of the data's JSON, as bytes fragments
+    :param buffer_size: fragments are sent in chunks of around this size
+    """
+    prefix, suffix = envelope(response)
+
+    body = buffer_chunks(itertools.chain([prefix], data_chunks, [suffix]),
+                         buffer_size)
+    return Response(stream_with_context(body), code,
+                    mimetype='application/json')
+
+
+def etag_headers(etag, cache_control=None):
+    """ Return the headers for a response with an ETag """
+    headers = {}
+    if etag is not None:
+        headers['ETag'] = quote_etag(etag)
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+    return headers
+
+
+def body_etag(data):
+    """ Return a strong ETag for a response's JSON body """
+    return hashlib.sha1(codec.dumps_bytes(data)).hexdigest()
+
+
+def not_modified(etag, headers=None):
+    """ Check the request's If-None-Match against the current ETag
+
+    :param etag: current ETag of the resource (unquoted), or None
+    :param headers: headers to send with the 304 response
+    :return: 304 response when the client's copy is current, otherwise None
+    """
+    if etag is None or not request.if_none_match.contains(etag):
+        return None
+
+    resp = Response(status=304)
+    resp.headers.extend(headers or etag_headers(etag))
+    return resp
+
+
+def client_id():
+    """ Return the identity of the client making the request
+
+    Behind the nginx front end, the subject of the client's certificate is
+    passed on in SSL_CLIENT_S_DN, and its common name identifies the client.
+    Otherwise the client is known by its address.
+    """
+    subject = request.environ.get('SSL_CLIENT_S_DN', '')
+    # nginx gives the subject as 'CN=name,O=org' (RFC 2253), or as
+    # '/O=org/CN=name' in older releases
+    for rdn in re.split(r'(?<!\\)[,/]', subject):
+        key, _sep, value = rdn.strip().partition('=')
+        if key.upper() == 'CN' and value:
+            return value
+    return request.remote_addr
+
+
 def log_request(logger):
     '''
     wrapper function for HTTP request logging
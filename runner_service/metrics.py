@@ -3,7 +3,9 @@ import time
 import glob
 import socket
 
-from .cache import runner_stats, runner_cache
+from .cache import runner_stats, runner_cache, event_cache
+from .services.scanner import event_scanner
+from .services.scheduler import job_scheduler
 from runner_service import configuration
 
 
@@ -34,6 +36,10 @@ class PrometheusStats(object):
         self._get_playbook_count()
         self._get_playbooks_active()
         self._get_playbooks_status()
+        self._get_event_scanner()
+        self._get_event_cache()
+        self._get_job_scheduler()
+        self._get_job_startup()
 
         # insert the get calls here
         etime = int(time.time())
@@ -98,3 +104,93 @@ class PrometheusStats(object):
             labels = {"hostname": self.hostname, "event_status": status}
             _m.add(labels, runner_stats.event_stats[status])
         self.metrics['runner_service_event_status'] = _m
+
+    def _get_event_scanner(self):
+        labels = {"hostname": self.hostname}
+
+        _m = Metric("number of threads scanning job events", "gauge")
+        _m.add(labels, len(event_scanner.threads))
+        self.metrics['runner_service_event_scan_threads'] = _m
+
+        _m = Metric("number of event scan threads currently busy", "gauge")
+        _m.add(labels, event_scanner.busy)
+        self.metrics['runner_service_event_scan_threads_busy'] = _m
+
+        _m = Metric("number of processes decoding job events", "gauge")
+        _m.add(labels, event_scanner.process_count)
+        self.metrics['runner_service_event_scan_processes'] = _m
+
+        _m = Metric("number of event scans waiting for a thread", "gauge")
+        _m.add(labels, event_scanner.pending)
+        self.metrics['runner_service_event_scans_pending'] = _m
+
+    def _get_event_cache(self):
+        labels = {"hostname": self.hostname}
+
+        _m = Metric("event cache lookups that found the play", "count")
+        _m.add(labels, event_cache.hits)
+        self.metrics['runner_service_event_cache_hits'] = _m
+
+        _m = Metric("event cache lookups that missed the play", "count")
+        _m.add(labels, event_cache.misses)
+        self.metrics['runner_service_event_cache_misses'] = _m
+
+        _m = Metric("plays evicted from the event cache", "count")
+        _m.add(labels, event_cache.evictions)
+        self.metrics['runner_service_event_cache_evictions'] = _m
+
+        _m = Metric("number of plays in the event cache", "gauge")
+        _m.add(labels, len(event_cache))
+        self.metrics['runner_service_event_cache_plays'] = _m
+
+        _m = Metric("estimated size of the event cache in bytes", "gauge")
+        _m.add(labels, event_cache.nbytes)
+        self.metrics['runner_service_event_cache_bytes'] = _m
+
+    def _get_job_scheduler(self):
+        labels = {"hostname": self.hostname}
+
+        _m = Metric("number of playbooks that may run at the same time "
+                    "(0 is unlimited)", "gauge")
+        _m.add(labels, configuration.settings.max_concurrent_jobs)
+        self.metrics['runner_service_jobs_max_concurrent'] = _m
+
+        _m = Metric("number of playbooks queued, waiting to run", "gauge")
+        for priority, depth in job_scheduler.depth_by_priority().items():
+            _m.add({"hostname": self.hostname, "priority": priority}, depth)
+        self.metrics['runner_service_job_queue_depth'] = _m
+
+        _m = Metric("seconds the oldest queued playbook has waited", "gauge")
+        _m.add(labels, round(job_scheduler.oldest_wait, 3))
+        self.metrics['runner_service_job_queue_oldest_wait_secs'] = _m
+
+        _m = Metric("playbooks launched by the job scheduler", "count")
+        _m.add(labels, job_scheduler.started)
+        self.metrics['runner_service_jobs_launched'] = _m
+
+        _m = Metric("total seconds the launched playbooks spent queued",
+                    "count")
+        _m.add(labels, round(job_scheduler.total_wait, 3))
+        self.metrics['runner_service_job_queue_wait_secs'] = _m
+
+    def _get_job_startup(self):
+        labels = {"hostname": self.hostname}
+        startup = runner_stats.job_startup
+
+        _m = Metric("playbooks whose startup time has been measured", "count")
+        _m.add(labels, startup['count'])
+        self.metrics['runner_service_job_startups'] = _m
+
+        _m = Metric("total seconds from launching playbooks to their first "
+                    "event", "count")
+        _m.add(labels, round(startup['total_secs'], 3))
+        self.metrics['runner_service_job_startup_secs'] = _m
+
+        _m = Metric("seconds the latest playbook took to start", "gauge")
+        _m.add(labels, round(startup['last_secs'], 3))
+        self.metrics['runner_service_job_startup_last_secs'] = _m
+
+        _m = Metric("longest time a playbook took to start, in seconds",
+                    "gauge")
+        _m.add(labels, round(startup['max_secs'], 3))
+        self.metrics['runner_service_job_startup_max_secs'] = _m
@@ -0,0 +1,376 @@
+import os
+import sys
+import bisect
+import tempfile
+from collections import namedtuple, defaultdict
+
+from .. import codec
+
+import logging
+logger = logging.getLogger(__name__)
+
+# name of the per job index file, held in the artifacts directory of the play
+INDEX_FILE = "job_events.idx"
+
+# name of the compacted event store of a finished play, held in the artifacts
+# directory of the play alongside the event index
+SEGMENT_FILE = "job_events.seg"
+
+# bump the version whenever the layout of an index record changes, so any
+# existing index files are treated as stale and rebuilt on demand
+INDEX_VERSION = 3
+
+# where the events themselves are held - one file per event in job_events/,
+# appended to the play's event log, or packed into a compressed segment once
+# the play has finished
+STORAGE_FILES = "files"
+STORAGE_LOG = "log"
+STORAGE_SEGMENT = "segment"
+
+# fields that the index can answer a filter or summary request for, without
+# needing to parse the event file itself
+INDEXED_KEYS = ['host', 'task', 'role', 'event']
+
+# fields held by every index entry, so a projection (fields=) or query
+# condition using only these is answered without reading the events
+ENTRY_KEYS = ['counter', 'uuid', 'created'] + INDEXED_KEYS
+
+IndexEntry = namedtuple('IndexEntry', ['counter', 'uuid', 'event', 'host',
+                                       'task', 'role', 'created', 'offset',
+                                       'length'])
+
+
+def index_path(pb_path):
+    return os.path.join(pb_path, INDEX_FILE)
+
+
+def segment_path(pb_path):
+    return os.path.join(pb_path, SEGMENT_FILE)
+
+
+def superseded(pb_path, storage):
+    """ Return True if an index of the given storage is out of date, because
+    the play's event files have since been compacted into a segment """
+    return storage == STORAGE_FILES and os.path.exists(segment_path(pb_path))
+
+
+def event_file_path(pb_path, event_id):
+    return os.path.join(pb_path, "job_events", "{}.json".format(event_id))
+
+
+def indexed_values(event_info):
+    """ Return the values of the INDEXED_KEYS for a job event
+
+    :param event_info: dict/json of a job event
+    :return: dict of key/value pairs, holding None for a missing key
+    """
+    event_data = event_info.get('event_data', {})
+
+    values = {}
+    for key in INDEXED_KEYS:
+        # event_data takes precedence, mirroring event_summary
+        if key in event_data:
+            values[key] = event_data[key]
+        else:
+            values[key] = event_info.get(key, None)
+    return values
+
+
+def make_entry(event_info, offset, length):
+    """ Create an index entry from a job event
+
+    :param event_info: dict/json of a job event
+    :param offset: byte offset of the event within its storage
+    :param length: size of the event in bytes
+    :return: IndexEntry for the event
+    """
+    return IndexEntry(counter=event_info['counter'],
+                      uuid=event_info['uuid'],
+                      created=event_info.get('created'),
+                      offset=offset,
+                      length=length,
+                      **indexed_values(event_info))
+
+
+def entry_id(entry):
+    """ Return the event id (counter-uuid) of an index entry """
+    return "{}-{}".format(entry.counter, entry.uuid)
+
+
+def entry_summary(entry):
+    """ Provide the same summary as event_summary, from the index alone """
+    summary = getattr(entry, 'summary', None)
+    if summary is not None:
+        # precomputed when the record was created, so must not be modified
+        return summary
+
+    summary = {}
+    for key in ['event', 'host', 'task', 'role']:
+        value = getattr(entry, key)
+        if value is not None:
+            summary[key] = value
+    return summary
+
+
+def entry_projection(entry, fields):
+    """ Provide the same projection as project_event, from the index alone """
+    projection = {}
+    for field in fields:
+        value = getattr(entry, field)
+        if value is not None:
+            projection[field] = value
+    return projection
+
+
+def can_project(fields):
+    """ Determine whether the index alone can satisfy a given projection """
+    return fields is None or all(field in ENTRY_KEYS for field in fields)
+
+
+def entry_conditions(filter):
+    """ Return the conditions of a query (see event_query.Query) that the
+    index entries can answer """
+    return [condition for condition in getattr(filter, 'conditions', [])
+            if condition.field in ENTRY_KEYS]
+
+
+def can_filter(filter):
+    """ Determine whether the index alone can satisfy a given filter """
+    return all(key in INDEXED_KEYS for key in filter) and \
+        len(entry_conditions(filter)) == len(getattr(filter, 'conditions', []))
+
+
+def entry_matches(entry, filter, ignored_events):
+    """ Apply a filter (see jobs.filter_event) to an index entry """
+    if not filter:
+        return True
+
+    if entry.event in ignored_events:
+        return False
+
+    return all(getattr(entry, key) == filter[key] for key in filter) and \
+        all(condition.matches_entry(entry)
+            for condition in getattr(filter, 'conditions', []))
+
+
+def narrow(entries, filter):
+    """ Drop the entries failing any condition the index can answer
+
+    :param entries: list of IndexEntry or EventRecord objects
+    :param filter: dict of key/value pairs, or an event_query.Query
+    :return: list of the entries that may match the filter
+    """
+    conditions = entry_conditions(filter)
+    if not conditions:
+        return entries
+
+    return [entry for entry in entries
+            if all(condition.matches_entry(entry)
+                   for condition in conditions)]
+
+
+class EventRecord(object):
+    """ Compact, in memory form of a job event
+
+    A record only holds the fields used to filter and summarise an event, and
+    behaves like an IndexEntry. The full event is read from the artifacts
+    directory when it's needed.
+
+    ansible_runner writes the event file once the event handler has returned,
+    so the most recent record of a play keeps the event itself, until the
+    next event arrives (or the play finishes) and release() is called.
+
+    The summary of the event is built once, as the event is received, and
+    shared by every request listing the event. When the event is held in the
+    play's event log, the record also holds its offset and length.
+    """
+
+    __slots__ = ('counter', 'uuid', 'event', 'host', 'task', 'role',
+                 'created', 'summary', 'offset', 'length', 'pb_path', 'data')
+
+    def __init__(self, event_info, pb_path, offset=None, length=None):
+        self.counter = event_info['counter']
+        self.uuid = event_info['uuid']
+        self.created = event_info.get('created')
+        for key, value in indexed_values(event_info).items():
+            setattr(self, key, value)
+        self.summary = entry_summary(self)
+        self.offset = offset
+        self.length = length
+        self.pb_path = pb_path
+        self.data = event_info
+
+    def __sizeof__(self):
+        # the artifacts path is shared by all the records of a play, and the
+        # event itself is only held until the event file exists
+        return object.__sizeof__(self) + \
+            sum(sys.getsizeof(getattr(self, key))
+                for key in ['uuid', 'event', 'host', 'task', 'role',
+                            'created']) + \
+            sys.getsizeof(self.summary)
+
+    def release(self):
+        """ Drop the event, once it's been written to its event file """
+        self.data = None
+
+
+class Postings(object):
+    """ Inverted index of the INDEXED_KEYS values of a play's events
+
+    Each (key, value) pair maps to the set of event counters holding it, so a
+    filter on the indexed keys is resolved by intersecting sets rather than
+    by checking every event
+    """
+
+    def __init__(self):
+        self.lists = defaultdict(set)
+
+    def add(self, counter, values):
+        """ Add an event, given its counter and indexed_values """
+        for key, value in values.items():
+            if value is None:
+                continue
+            try:
+                self.lists[(key, value)].add(counter)
+            except TypeError:
+                # unhashable value, so it can't be indexed
+                continue
+
+    def lookup(self, filter, ignored_events):
+        """ Return the counters of the events matching a filter
+
+        :param filter: dict of key/value pairs, using only INDEXED_KEYS
+        :param ignored_events: event types that never match a filter
+        :return: set of event counters
+        """
+        # start from the shortest list, to keep the intersections small
+        keys = sorted(filter,
+                      key=lambda k: len(self.lists.get((k, filter[k]), ())))
+
+        matched = None
+        for key in keys:
+            posting = self.lists.get((key, filter[key]))
+            if not posting:
+                return set()
+            matched = set(posting) if matched is None else matched & posting
+
+        for event_type in ignored_events:
+            matched -= self.lists.get(('event', event_type), set())
+
+        return matched
+
+
+class EventIndex(object):
+    """ In memory form of a play's event index """
+
+    def __init__(self, entries, storage=STORAGE_FILES):
+        self.storage = storage
+        self.entries = sorted(entries, key=lambda e: e.counter)
+        self.counters = [entry.counter for entry in self.entries]
+        self.by_counter = dict(zip(self.counters, self.entries))
+        self.postings = Postings()
+        for entry in self.entries:
+            self.postings.add(entry.counter,
+                              {key: getattr(entry, key) for key in INDEXED_KEYS})
+
+    def __len__(self):
+        return len(self.entries)
+
+    def since(self, counter=0):
+        """ Return the entries with a counter above the one given, in order """
+        pos = bisect.bisect_right(self.counters, counter)
+        return self.entries[pos:]
+
+    def select(self, filter, ignored_events, since=0):
+        """ Return the entries that may match a filter, in counter order
+
+        When the filter's key/value pairs only use INDEXED_KEYS the postings
+        are used, otherwise every entry after since is a candidate. The
+        candidates are then narrowed by any query conditions on the fields
+        the entries hold.
+        """
+        if len(filter) and all(key in INDEXED_KEYS for key in filter):
+            counters = self.postings.lookup(filter, ignored_events)
+            entries = [self.by_counter[c] for c in sorted(counters)
+                       if c > since]
+        else:
+            entries = self.since(since)
+
+        return narrow(entries, filter)
+
+
+def load_index(pb_path):
+    """ Read the event index for a given play
+
+    :param pb_path: artifacts directory of the play
+    :return: EventIndex, or None if the index is missing, from a different
+             version or unreadable
+    """
+    idx_file = index_path(pb_path)
+    if not os.path.exists(idx_file):
+        return None
+
+    entries = []
+    try:
+        with open(idx_file, 'r') as idx_fd:
+            header = codec.loads(idx_fd.readline())
+            if header.get('version') != INDEX_VERSION:
+                logger.info("Event index for {} is at version {}, ignoring "
+                            "it".format(pb_path, header.get('version')))
+                return None
+            storage = header.get('storage', STORAGE_FILES)
+            if superseded(pb_path, storage):
+                # written by a reader racing the play's compaction
+                logger.info("Event index for {} predates its segment, "
+                            "ignoring it".format(pb_path))
+                return None
+
+            for line in idx_fd:
+                entries.append(IndexEntry(*codec.loads(line)))
+    except (IOError, OSError, ValueError, TypeError) as err:
+        logger.warning("Unable to use event index for {}: "
+                       "{}".format(pb_path, err))
+        return None
+
+    return EventIndex(entries, storage)
+
+
+def write_index(pb_path, entries, storage=STORAGE_FILES):
+    """ Persist the event index for a play
+
+    The index is written to a temporary file first, and renamed into place so
+    readers never see a partial index
+
+    :param pb_path: artifacts directory of the play
+    :param entries: list of IndexEntry objects
+    :param storage: where the events are held (STORAGE_FILES/STORAGE_SEGMENT)
+    :return: True if the index was written, False otherwise
+    """
+    idx_file = index_path(pb_path)
+
+    if superseded(pb_path, storage):
+        # the segment is written before its index, so this would replace
+        # (or pre-empt) the segment's index
+        logger.debug("Not writing a {} index for {}, as its events have been "
+                     "compacted".format(storage, pb_path))
+        return False
+
+    try:
+        tmp_fd, tmp_file = tempfile.mkstemp(dir=pb_path, suffix='.tmp')
+        with os.fdopen(tmp_fd, 'w') as idx_fd:
+            idx_fd.write(codec.dumps({"version": INDEX_VERSION,
+                                      "storage": storage,
+                                      "fields": list(IndexEntry._fields)}))
+            idx_fd.write('\n')
+            for entry in sorted(entries, key=lambda e: e.counter):
+                idx_fd.write(codec.dumps(list(entry)))
+                idx_fd.write('\n')
+        os.rename(tmp_file, idx_file)
+    except (IOError, OSError) as err:
+        logger.error("Unable to write event index for {}: "
+                     "{}".format(pb_path, err))
+        return False
+
+    logger.debug("Event index for {} written with {} "
+                 "entries".format(pb_path, len(entries)))
+    return True
@@ -0,0 +1,167 @@
+""" Query syntax of the event endpoints
+
+Besides key=value, the terms of an event query may compare a field using
+>=, <=, >, <, != or ~= (a regular expression search), e.g.
+
+  ?counter>=500&created<2018-09-13T21:16:55&task~=^Install&event!=runner_on_ok
+
+The terms are compiled once per request into a Query, which the event index
+and filter_event evaluate against each event
+"""
+import re
+import operator
+
+# comparison operators of a condition, other than '~=' which is a regex search
+COMPARISONS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '>': operator.gt,
+    '<': operator.lt,
+    '!=': operator.ne
+}
+
+# placeholder for a field the event doesn't have
+MISSING = object()
+
+
+def parse_number(text):
+    """ Return the number held in a string, or None """
+    for number_type in (int, float):
+        try:
+            return number_type(text)
+        except ValueError:
+            pass
+    return None
+
+
+def event_value(event_info, field):
+    """ Return the value of a field of a job event
+
+    :param event_info: dict/json of a job event
+    :param field: a dotted name is a path into the event (e.g.
+                  event_data.res.rc), while a plain name is checked in the
+                  event_data namespace, at the outer level and in the task
+                  result, as filter_event does
+    :return: the field's value, or MISSING
+    """
+    if '.' in field:
+        value = event_info
+        for key in field.split('.'):
+            if not isinstance(value, dict) or key not in value:
+                return MISSING
+            value = value[key]
+        return value
+
+    event_data = event_info.get('event_data') or {}
+    for namespace in (event_data, event_info, event_data.get('res')):
+        if isinstance(namespace, dict) and field in namespace:
+            return namespace[field]
+    return MISSING
+
+
+class Condition(object):
+    """ Comparison of an event's field against a value, e.g. counter>=500
+
+    Numbers are compared as numbers when the event holds a number, anything
+    else is compared as a string - so ISO 8601 timestamps like 'created'
+    compare in time order. A missing field only satisfies '!='.
+    """
+
+    def __init__(self, field, op, value):
+        self.field = field
+        self.op = op
+        self.value = value
+        self.number = parse_number(value)
+        if op == '~=':
+            try:
+                self.pattern = re.compile(value)
+            except re.error as err:
+                raise ValueError("invalid pattern for {}: {}".format(field,
+                                                                     err))
+
+    def __repr__(self):
+        return "{}{}{}".format(self.field, self.op, self.value)
+
+    def test(self, value):
+        """ Apply the condition to a field's value (None or MISSING if the
+        event doesn't have the field) """
+        if value is None or value is MISSING:
+            return self.op == '!='
+
+        if self.op == '~=':
+            return self.pattern.search(str(value)) is not None
+
+        if self.number is not None and \
+                isinstance(value, (int, float)) and \
+                not isinstance(value, bool):
+            return COMPARISONS[self.op](value, self.number)
+
+        return COMPARISONS[self.op](str(value), self.value)
+
+    def matches_event(self, event_info):
+        return self.test(event_value(event_info, self.field))
+
+    def matches_entry(self, entry):
+        """ Apply the condition to an IndexEntry or EventRecord, which must
+        hold the field (see event_index.ENTRY_KEYS) """
+        return self.test(getattr(entry, self.field))
+
+
+class Query(dict):
+    """ Compiled event query
+
+    The dict holds the key=value terms, which are matched as a plain filter
+    (see filter_event), while the terms using other operators are held as
+    conditions. A query with only conditions is still a filter, so its truth
+    reflects both.
+    """
+
+    def __init__(self, terms=None, conditions=None):
+        super(Query, self).__init__(terms or {})
+        self.conditions = conditions or []
+
+    def __bool__(self):
+        return len(self) > 0 or len(self.conditions) > 0
+
+
+def split_term(key, value):
+    """ Split a query parameter into its field, operator and value
+
+    The query string is split at the first '=', so 'counter>=5' arrives as
+    the key 'counter>' with a value of '5', while 'counter>5' is a key
+    without a value
+
+    :return: tuple of (field, operator, value)
+    """
+    if key[-1:] in ('>', '<', '!', '~'):
+        return key[:-1], key[-1] + '=', value
+
+    for op in ('>', '<'):
+        if op in key:
+            field, _op, rest = key.partition(op)
+            return field, op, rest + ('=' + value if value else '')
+
+    return key, '=', value
+
+
+def parse_query(args):
+    """ Compile the filter parameters of a request
+
+    :param args: dict of the request's query parameters, without the ones the
+                 endpoint reserves (e.g. since, limit)
+    :return: Query
+    :raises ValueError: if a term isn't valid
+    """
+    terms, conditions = {}, []
+
+    for key, value in args.items():
+        field, op, value = split_term(key, value)
+        if not field:
+            raise ValueError("{} has no field name".format(key))
+
+        if op == '=':
+            terms[field] = value
+        else:
+            conditions.append(Condition(field, op, value))
+
+    return Query(terms, conditions)
@@ -0,0 +1,185 @@
+import os
+import mmap
+import zlib
+import struct
+import tempfile
+
+from .event_index import STORAGE_SEGMENT, segment_path
+from .. import codec
+
+import logging
+logger = logging.getLogger(__name__)
+
+# name of the event log written while a play runs, when event_storage is set
+# to 'log' instead of letting ansible_runner create a file per event
+LOG_FILE = "job_events.log"
+
+# each event in a segment or log is a JSON document (zlib compressed in a
+# segment), preceded by its length so the file can be read back without the
+# index
+LENGTH_PREFIX = struct.Struct(">I")
+
+
+def log_path(pb_path):
+    return os.path.join(pb_path, LOG_FILE)
+
+
+def _iter_records(path, decode):
+    with open(path, 'rb') as store_fd:
+        while True:
+            prefix = store_fd.read(LENGTH_PREFIX.size)
+            if len(prefix) < LENGTH_PREFIX.size:
+                return
+            length, = LENGTH_PREFIX.unpack(prefix)
+            offset = store_fd.tell()
+            blob = store_fd.read(length)
+            if len(blob) < length:
+                # the last event of a log is still being written
+                return
+            yield offset, length, codec.loads(decode(blob))
+
+
+def iter_segment(pb_path):
+    """ Read every event held in a segment, in the order they were written
+
+    :param pb_path: artifacts directory of the play
+    :return: generator of (offset, length, event_info) tuples
+    """
+    return _iter_records(segment_path(pb_path), zlib.decompress)
+
+
+def iter_log(pb_path):
+    """ Read every event held in a play's log, in the order they were written
+
+    :param pb_path: artifacts directory of the play
+    :return: generator of (offset, length, event_info) tuples
+    """
+    return _iter_records(log_path(pb_path), bytes)
+
+
+def read_segment(pb_path, entries):
+    """ Read the (uncompressed) JSON of events held in a segment
+
+    :param pb_path: artifacts directory of the play
+    :param entries: list of IndexEntry objects locating the events
+    :return: generator of the events' JSON, as bytes
+    """
+    with open(segment_path(pb_path), 'rb') as seg_fd:
+        for entry in entries:
+            seg_fd.seek(entry.offset)
+            yield zlib.decompress(seg_fd.read(entry.length))
+
+
+def read_log(pb_path, entries):
+    """ Read the JSON of events held in a play's log
+
+    The log is memory mapped, so each event is a slice of the mapping rather
+    than a seek and read of the file
+
+    :param pb_path: artifacts directory of the play
+    :param entries: list of IndexEntry or EventRecord objects locating the
+                    events
+    :return: generator of the events' JSON, as bytes
+    """
+    if not entries:
+        return
+
+    with open(log_path(pb_path), 'rb') as log_fd:
+        with mmap.mmap(log_fd.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            for entry in entries:
+                yield log_map[entry.offset:entry.offset + entry.length]
+
+
+def read_blobs(pb_path, storage, entries):
+    """ Read the JSON of events held in a play's segment or log
+
+    :param pb_path: artifacts directory of the play
+    :param storage: STORAGE_SEGMENT or STORAGE_LOG
+    :param entries: list of objects holding the offset and length of events
+    :return: generator of the events' JSON, as bytes
+    """
+    reader = read_segment if storage == STORAGE_SEGMENT else read_log
+    return reader(pb_path, entries)
+
+
+def read_events(pb_path, storage, entries):
+    """ Read events held in a play's segment or log
+
+    :param pb_path: artifacts directory of the play
+    :param storage: STORAGE_SEGMENT or STORAGE_LOG
+    :param entries: list of objects holding the offset and length of events
+    :return: generator of (entry, event_info) tuples
+    """
+    for entry, blob in zip(entries, read_blobs(pb_path, storage, entries)):
+        yield entry, codec.loads(blob)
+
+
+class EventLog(object):
+    """ Append-only log of the events of a running play
+
+    Each event is written as a length prefix followed by its JSON, and the
+    log is flushed after every event so readers (see read_log) see complete
+    events. A log only has a single writer, the play's event handler.
+    """
+
+    def __init__(self, pb_path):
+        self.path = log_path(pb_path)
+        self.log_fd = open(self.path, 'ab')
+        self.size = self.log_fd.tell()
+
+    def append(self, event_info):
+        """ Add an event to the log
+
+        :param event_info: dict/json of the job event
+        :return: tuple of (offset, length) of the event's JSON within the log
+        """
+        blob = codec.dumps_bytes(event_info)
+        self.log_fd.write(LENGTH_PREFIX.pack(len(blob)) + blob)
+        self.log_fd.flush()
+
+        offset = self.size + LENGTH_PREFIX.size
+        self.size = offset + len(blob)
+        return offset, len(blob)
+
+    def close(self):
+        self.log_fd.close()
+
+
+def write_segment(pb_path, entries, blobs):
+    """ Pack a play's events into a compressed segment
+
+    The segment is written to a temporary file first, and renamed into place
+    so readers never see a partial segment
+
+    :param pb_path: artifacts directory of the play
+    :param entries: list of IndexEntry objects, in counter order
+    :param blobs: iterable of the JSON of each entry's event, as bytes
+    :return: list of IndexEntry objects locating the events in the segment,
+             or None if the segment couldn't be written
+    """
+    seg_entries = []
+    tmp_file = None
+
+    try:
+        tmp_fd, tmp_file = tempfile.mkstemp(dir=pb_path, suffix='.tmp')
+        with os.fdopen(tmp_fd, 'wb') as seg_fd:
+            for entry, blob in zip(entries, blobs):
+                blob = zlib.compress(blob)
+                seg_fd.write(LENGTH_PREFIX.pack(len(blob)))
+                seg_entries.append(entry._replace(offset=seg_fd.tell(),
+                                                  length=len(blob)))
+                seg_fd.write(blob)
+        os.rename(tmp_file, segment_path(pb_path))
+    except (IOError, OSError) as err:
+        logger.error("Unable to write event segment for {}: "
+                     "{}".format(pb_path, err))
+        if tmp_file is not None:
+            try:
+                os.unlink(tmp_file)
+            except OSError:
+                pass
+        return None
+
+    logger.debug("Event segment for {} written with {} "
+                 "events".format(pb_path, len(seg_entries)))
+    return seg_entries
@@ -0,0 +1,212 @@
+import os
+import sqlite3
+import datetime
+from contextlib import closing
+
+from .utils import APIResponse, build_pb_path
+from .event_index import entry_id
+from .jobs import get_event_index, get_event
+from ..utils import fread
+from runner_service import configuration
+
+import logging
+logger = logging.getLogger(__name__)
+
+# name of the service-wide history database, held in the artifacts directory
+HISTORY_DB = "host_history.db"
+
+# outcome of a play for a host, taken from the play's stats. The first of
+# these keys holding a count for the host decides its outcome
+OUTCOMES = [('failures', 'failed'),
+            ('dark', 'unreachable'),
+            ('changed', 'changed'),
+            ('ok', 'ok'),
+            ('skipped', 'skipped')]
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS plays ("
+    "play_uuid TEXT PRIMARY KEY, playbook TEXT, status TEXT, finished TEXT)",
+    "CREATE TABLE IF NOT EXISTS host_history ("
+    "host TEXT NOT NULL, play_uuid TEXT NOT NULL, playbook TEXT, "
+    "outcome TEXT NOT NULL, status TEXT, finished TEXT, "
+    "PRIMARY KEY (host, play_uuid))",
+    "CREATE INDEX IF NOT EXISTS host_finished "
+    "ON host_history (host, finished)"
+]
+
+
+def history_path():
+    return os.path.join(configuration.settings.playbooks_root_dir,
+                        "artifacts",
+                        HISTORY_DB)
+
+
+def connect():
+    """ Open the history database, creating it if necessary
+
+    A connection is opened for each use, so the database may be used from
+    any thread, and sqlite handles the locking between them. The schema is
+    checked on every connect, as another process or thread may have created
+    the file without finishing the schema yet
+    """
+    conn = sqlite3.connect(history_path(), timeout=10)
+    with conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+    return conn
+
+
+def host_outcomes(stats):
+    """ Return the outcome of a play for each host, from its stats
+
+    :param stats: event_data of the play's playbook_on_stats event
+    :return: dict of outcomes, indexed by host name
+    """
+    outcomes = {}
+    for key, outcome in OUTCOMES:
+        for host, count in (stats.get(key) or {}).items():
+            if count and host not in outcomes:
+                outcomes[host] = outcome
+
+    # a host may have been processed without any task running against it
+    for host in stats.get('processed') or {}:
+        outcomes.setdefault(host, 'ok')
+
+    return outcomes
+
+
+def play_stats(play_uuid, pb_path):
+    """ Return the playbook_on_stats event of a play, or None """
+    index = get_event_index(pb_path)
+    for entry in reversed(index.entries):
+        if entry.event == 'playbook_on_stats':
+            response = get_event(play_uuid, entry_id(entry))
+            if response.status == "OK":
+                return response.data
+            break
+    return None
+
+
+def record_play(play_uuid):
+    """ Add the outcome of a finished play to the host history
+
+    :param play_uuid: play to record
+    :return: True if the play was recorded, False if it hasn't finished or
+             couldn't be recorded
+    """
+    if not configuration.settings.host_history:
+        return False
+
+    pb_path = build_pb_path(play_uuid)
+    status_path = os.path.join(pb_path, "status")
+    if not os.path.exists(status_path):
+        return False
+
+    status = fread(status_path)
+    playbook, finished, outcomes = None, None, {}
+
+    stats = play_stats(play_uuid, pb_path)
+    if stats is not None:
+        event_data = stats.get('event_data', {})
+        playbook = event_data.get('playbook')
+        finished = stats.get('created')
+        outcomes = host_outcomes(event_data)
+
+    if finished is None:
+        finished = datetime.datetime.utcfromtimestamp(
+            os.path.getmtime(status_path)).isoformat()
+
+    try:
+        with closing(connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO plays VALUES (?, ?, ?, ?)",
+                         (play_uuid, playbook, status, finished))
+            conn.executemany("INSERT OR REPLACE INTO host_history "
+                             "VALUES (?, ?, ?, ?, ?, ?)",
+                             [(host, play_uuid, playbook, outcome, status,
+                               finished)
+                              for host, outcome in outcomes.items()])
+    except sqlite3.Error as err:
+        logger.error("Unable to record play {} in the host history: "
+                     "{}".format(play_uuid, err))
+        return False
+
+    logger.debug("Host history updated with play {}, for {} "
+                 "hosts".format(play_uuid, len(outcomes)))
+    return True
+
+
+def backfill():
+    """ Record any finished plays in the artifacts directory that the history
+    doesn't hold yet
+
+    :return: number of plays recorded
+    """
+    if not configuration.settings.host_history:
+        return 0
+
+    artifacts_dir = os.path.join(configuration.settings.playbooks_root_dir,
+                                 "artifacts")
+    if not os.path.isdir(artifacts_dir):
+        return 0
+
+    try:
+        with closing(connect()) as conn:
+            known = {row[0] for row in
+                     conn.execute("SELECT play_uuid FROM plays")}
+    except sqlite3.Error as err:
+        logger.error("Unable to read the host history: {}".format(err))
+        return 0
+
+    recorded = 0
+    for play_uuid in os.listdir(artifacts_dir):
+        if play_uuid in known or not os.path.isdir(build_pb_path(play_uuid)):
+            continue
+        if record_play(play_uuid):
+            recorded += 1
+
+    logger.info("Host history backfilled with {} plays".format(recorded))
+    return recorded
+
+
+def get_host_history(host_name, playbook=None, outcome=None, limit=20):
+    """ Return the most recent plays run against a host
+
+    :param host_name: host to look for
+    :param playbook: only return the plays of this playbook
+    :param outcome: only return the plays with this outcome for the host
+    :param limit: max number of plays to return
+    :return: APIResponse
+    """
+    r = APIResponse()
+
+    if not configuration.settings.host_history:
+        r.status, r.msg = "UNKNOWN", "Host history is not enabled"
+        return r
+
+    query = "SELECT play_uuid, playbook, outcome, status, finished " \
+            "FROM host_history WHERE host = ?"
+    parms = [host_name]
+    if playbook is not None:
+        query += " AND playbook = ?"
+        parms.append(playbook)
+    if outcome is not None:
+        query += " AND outcome = ?"
+        parms.append(outcome)
+    query += " ORDER BY finished DESC LIMIT ?"
+    parms.append(limit)
+
+    try:
+        with closing(connect()) as conn:
+            rows = conn.execute(query, parms).fetchall()
+    except sqlite3.Error as err:
+        logger.error("Unable to read the host history: {}".format(err))
+        r.status, r.msg = "FAILED", "Unable to read the host history"
+        return r
+
+    history = [dict(zip(['play_uuid', 'playbook', 'outcome', 'status',
+                         'finished'], row))
+               for row in rows]
+
+    r.status, r.data = "OK", {"history": history,
+                              "total_plays": len(history)}
+    return r
@@ -1,24 +1,58 @@
 
 import os
-import glob
-import json
+import re
+import time
+import base64
+import hashlib
+import binascii
+import functools
+import itertools
 import threading
-import datetime
-
-# conditional import for python 2.7 and python3.6 support
-try:
-    import Queue as queue
-except ImportError:
-    import queue
+from collections import OrderedDict
 
 from .utils import APIResponse, build_pb_path
-from ..utils import fread
-from runner_service import configuration
-from ..cache import event_cache
+from .event_index import (EventIndex,
+                          make_entry,
+                          entry_id,
+                          entry_summary,
+                          entry_projection,
+                          entry_matches,
+                          event_file_path,
+                          can_filter,
+                          can_project,
+                          load_index,
+                          superseded,
+                          write_index,
+                          STORAGE_FILES,
+                          STORAGE_LOG,
+                          STORAGE_SEGMENT)
+from .event_store import (segment_path,
+                          log_path,
+                          iter_segment,
+                          iter_log,
+                          read_log,
+                          read_blobs,
+                          read_events,
+                          write_segment)
+from .scanner import event_scanner, ScanError
+from ..utils import fread, rm_r
+from runner_service import configuration, codec
+from ..cache import event_cache, index_cache
 
 import logging
 logger = logging.getLogger(__name__)
 
+# event ids are the event's counter and uuid, which are also used to name the
+# event's file
+EVENT_ID = re.compile(r'^[0-9]+-[0-9a-fA-F-]+$')
+
+# number of events read at a time, when applying a filter that the event index
+# can't answer. A multiple of the scanner's CHUNK_SIZE keeps its threads busy
+MATCH_BATCH_SIZE = 500
+
+# max number of events that may be fetched by a single batch request
+EVENT_BATCH_MAX = 1000
+
 ignored_events = [
     'playbook_on_play_start',
     'playbook_on_start',
@@ -34,11 +68,11 @@ def get_event_info(event_path):
         logger.debug("Skipping partial event file: {}".format(event_fname))
         return None
 
-    with open(event_path, 'r') as event_fd:
+    with open(event_path, 'rb') as event_fd:
         try:
-            event_info = json.loads(event_fd.read())
+            event_info = codec.loads(event_fd.read())
             return event_info
-        except json.JSONDecodeError as err:
+        except ValueError as err:
             logger.warning("Invalid JSON within {}..."
                            "skipping".format(event_fname))
             return None
@@ -76,15 +110,22 @@ def filter_event(event_info, filter):
                 match = False
                 break
 
-        if match:
-            logger.debug("[{}] Filter matched against {}".format(tname,
-                                                                 event_fname))
-            return event_info
-        else:
+        if not match:
             logger.debug("[{}] Skipping {} due to filter "
                          "mismatch ".format(tname, event_fname))
             return None
 
+    # conditions of a query (see event_query.Query)
+    for condition in getattr(filter, 'conditions', []):
+        if not condition.matches_event(event_info):
+            logger.debug("[{}] Skipping {} due to condition "
+                         "{}".format(tname, event_fname, condition))
+            return None
+
+    if 'event_data' in event_info:
+        logger.debug("[{}] Filter matched against {}".format(tname,
+                                                             event_fname))
+
     # the default is to return the event_info
     return event_info
 
@@ -116,116 +157,941 @@ def event_summary(event_info, summary_keys=['host', 'task', 'role', 'event']):
         return event_info
 
 
-def scan_event_data(work_queue, filter, matched_events):
+def project_event(event_info, fields):
+    """ Pick the given fields out of a job event
 
-    tname = threading.current_thread().name
-    logger.debug("[{}] Event scanner started".format(tname))
-    ctr = 0
+    :param event_info: dict/json of a job event
+    :param fields: list of field names. A dotted name is a path into the
+                   event (e.g. event_data.res.rc), while a plain name is
+                   checked in the event_data namespace and then at the outer
+                   level, as event_summary does
+    :return: dict of the fields present in the event, keyed by field name
+    """
+    projection = {}
+    event_data = event_info.get('event_data', {})
 
-    while True:
-        try:
-            event_path = work_queue.get(block=False)
-        except queue.Empty:
-            break
+    for field in fields:
+        if '.' not in field:
+            if field in event_data:
+                projection[field] = event_data[field]
+            elif field in event_info:
+                projection[field] = event_info[field]
+            continue
+
+        value = event_info
+        for key in field.split('.'):
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
         else:
-            event_filename = os.path.basename(event_path)
-            logger.debug("[{}] Checking {}".format(tname, event_filename))
-            event_info = get_event_info(event_path)
-            event_info = filter_event(event_info, filter)
-            if event_info:
-                matched_events[event_filename] = event_summary(event_info)
-            ctr += 1
-            work_queue.task_done()
+            projection[field] = value
+
+    return projection
+
+
+def scan_event_files(event_paths, parser):
+    """ Parse a chunk of event files
+
+    :param event_paths: list of event file paths to process
+    :param parser: function called with the path and content of each event,
+                   returning the value to keep for the event or None to
+                   discard it
+    :return: dict of results, indexed by event id (counter-uuid)
+    """
+    tname = threading.current_thread().name
+    results = {}
+
+    for event_path in event_paths:
+        event_filename = os.path.basename(event_path)
+        logger.debug("[{}] Checking {}".format(tname, event_filename))
+        event_info = get_event_info(event_path)
+        if event_info:
+            result = parser(event_path, event_info)
+            if result is not None:
+                results[event_filename[:-5]] = result
+
+    return results
+
+
+def scan_events(event_paths, parser):
+    """ Parse a set of event files concurrently, using the event_scanner
+
+    :param event_paths: list of event file paths to process
+    :param parser: module level function, called with the path and content of
+                   each event, returning the value to keep for the event or
+                   None to discard it. Use functools.partial to pass any other
+                   arguments, so the parser can be sent to a process pool
+    :return: dict of results, indexed by event id (counter-uuid)
+    """
+    return event_scanner.scan(functools.partial(scan_event_files,
+                                                parser=parser),
+                              event_paths)
+
+
+def scan_stored_events(entries, pb_path, storage, parser):
+    """ Parse a chunk of the events held in a play's segment or log
+
+    :param entries: list of objects holding the offset and length of events
+    :param pb_path: artifacts directory of the play
+    :param storage: STORAGE_SEGMENT or STORAGE_LOG
+    :param parser: as for scan_event_files, called with a path of None
+    :return: dict of results, indexed by event id (counter-uuid)
+    """
+    results = {}
+
+    for entry, event_info in read_events(pb_path, storage, entries):
+        result = parser(None, event_info)
+        if result is not None:
+            results[entry_id(entry)] = result
+
+    return results
+
+
+def index_parser(event_path, event_info):
+    return make_entry(event_info, 0, os.path.getsize(event_path))
+
+
+def event_parser(fields, event_path, event_info):
+    if fields is not None:
+        return project_event(event_info, fields)
+    return event_info
+
+
+def summary_parser(filter, fields, event_path, event_info):
+    event_info = filter_event(event_info, filter)
+    if not event_info:
+        return None
+    if fields is not None:
+        # projected within the scanner, so only the fields asked for are
+        # kept (or passed back from a process pool)
+        return project_event(event_info, fields)
+    return event_summary(event_info)
+
+
+def build_event_index(pb_path):
+    """ Build the event index for a play from the events themselves
+
+    The events are read from the play's segment if it has been compacted, or
+    from its event log, otherwise its job_events directory is scanned
+
+    :param pb_path: artifacts directory of the play
+    :return: EventIndex
+    """
+    if os.path.exists(segment_path(pb_path)):
+        logger.debug("Building event index for {} from its "
+                     "segment".format(pb_path))
+        return EventIndex([make_entry(event_info, offset, length)
+                           for offset, length, event_info
+                           in iter_segment(pb_path)],
+                          STORAGE_SEGMENT)
+
+    if os.path.exists(log_path(pb_path)):
+        logger.debug("Building event index for {} from its "
+                     "log".format(pb_path))
+        return EventIndex([make_entry(event_info, offset, length)
+                           for offset, length, event_info
+                           in iter_log(pb_path)],
+                          STORAGE_LOG)
+
+    event_dir = os.path.join(pb_path, "job_events")
+    if not os.path.isdir(event_dir):
+        return EventIndex([])
+
+    event_paths = [os.path.join(event_dir, event_file)
+                   for event_file in os.listdir(event_dir)]
+    logger.debug("Building event index for {} from {} "
+                 "files".format(pb_path, len(event_paths)))
+
+    entries = scan_events(event_paths, index_parser)
+
+    return EventIndex(entries.values())
+
+
+def raw_events(pb_path, index):
+    """ Return the JSON of each event in a play's index, as bytes """
+    if index.storage == STORAGE_LOG:
+        return read_log(pb_path, index.entries)
+
+    return (fread_bytes(event_file_path(pb_path, entry_id(entry)))
+            for entry in index.entries)
+
+
+def fread_bytes(file_path):
+    with open(file_path, 'rb') as file_fd:
+        return file_fd.read()
+
+
+def cache_index(pb_path, index):
+    index_cache[pb_path] = index
+    index_cache.move_to_end(pb_path)
+    #  limit index cache size
+    while len(index_cache) > configuration.settings.index_cache_size:
+        index_cache.popitem(last=False)
+
+
+def index_job_events(pb_path):
+    """ Write the event index for a play that has finished
+
+    When compact_artifacts is set, the event files (or log) are packed into a
+    compressed segment first, and the index records where each event is
+    held within it. The event files are left in place, for any reader
+    that's part way through using them - see defer_event_files_removal.
+
+    :param pb_path: artifacts directory of the play
+    :return: EventIndex that was written, or None
+    """
+    try:
+        index = build_event_index(pb_path)
+    except ScanError as err:
+        logger.error("Unable to index the events of {}: {}".format(pb_path,
+                                                                   err))
+        return None
+
+    if index.storage != STORAGE_SEGMENT and index.entries and \
+            configuration.settings.compact_artifacts:
+        entries = write_segment(pb_path,
+                                index.entries,
+                                raw_events(pb_path, index))
+        if entries is not None:
+            index = EventIndex(entries, STORAGE_SEGMENT)
+
+    if not write_index(pb_path, index.entries, index.storage):
+        return None
+
+    cache_index(pb_path, index)
+    return index
+
+
+def remove_event_files(pb_path):
+    """ Remove the event files (and log) of a play that has been compacted """
+    if not os.path.exists(segment_path(pb_path)):
+        return
+    logger.debug("Removing event files of {}".format(pb_path))
+    rm_r(os.path.join(pb_path, "job_events"))
+    rm_r(log_path(pb_path))
+
+
+def defer_event_files_removal(pb_path):
+    """ Remove the event files (and log) of a play that has just been
+    compacted, once event_files_grace seconds have passed
+
+    Readers that started on the play's cached records before it finished
+    (e.g. a chunked event list) still read the event files, so they're given
+    time to finish. Files left behind by a restart are removed by
+    remove_stale_event_files.
+
+    :param pb_path: artifacts directory of the play
+    """
+    grace = configuration.settings.event_files_grace
+    if grace <= 0:
+        remove_event_files(pb_path)
+        return
+
+    timer = threading.Timer(grace, remove_event_files, args=(pb_path,))
+    timer.daemon = True
+    timer.start()
+
+
+def remove_stale_event_files(pb_path):
+    """ Remove the event files of a compacted play, once they're older than
+    event_files_grace seconds """
+    seg_path = segment_path(pb_path)
+    try:
+        age = time.time() - os.path.getmtime(seg_path)
+    except OSError:
+        return
+    if age >= configuration.settings.event_files_grace:
+        remove_event_files(pb_path)
+
+
+def get_event_index_since(pb_path, since=0):
+    """ Return the event index of a play, or an index of its events after a
+    given counter
+
+    The index of a running play isn't persisted, so instead of indexing every
+    event file on each request, only the files whose name holds a counter
+    above since are read
+
+    :param pb_path: artifacts directory of the play
+    :param since: counter of the last event the caller has seen
+    :return: EventIndex, which may only hold the events after since
+    """
+    event_dir = os.path.join(pb_path, "job_events")
+    if not since or pb_path in index_cache or \
+            os.path.exists(os.path.join(pb_path, "status")) or \
+            os.path.exists(log_path(pb_path)) or \
+            not os.path.isdir(event_dir):
+        return get_event_index(pb_path)
+
+    event_paths = [os.path.join(event_dir, event_file)
+                   for event_file in os.listdir(event_dir)
+                   if file_counter(event_file) > since]
+    logger.debug("Indexing {} event files of {}, after event "
+                 "{}".format(len(event_paths), pb_path, since))
+
+    return EventIndex(scan_events(event_paths, index_parser).values())
+
+
+def file_counter(event_file):
+    """ Return the counter of the event held in an event file, from its name
+    (counter-uuid.json) """
+    try:
+        return int(event_file.split('-', 1)[0])
+    except ValueError:
+        return 0
+
+
+def get_event_index(pb_path):
+    """ Return the event index of a play, building it if necessary
+
+    Artifacts from before the index existed have their index created on
+    first use, by index_job_events once the play has completed - the event
+    list of a running play is still growing, so its index isn't persisted.
+    Persisted indexes are kept in the index_cache.
+
+    An index of the event files is dropped once the play has been compacted
+    (e.g. by another process), as the files are removed soon after.
+
+    :param pb_path: artifacts directory of the play
+    :return: EventIndex
+    """
+    index = index_cache.get(pb_path)
+    if index is not None:
+        if not superseded(pb_path, index.storage):
+            index_cache.move_to_end(pb_path)
+            return index
+        index_cache.pop(pb_path, None)
+
+    index = load_index(pb_path)
+    if index is not None:
+        cache_index(pb_path, index)
+        return index
+
+    if os.path.exists(os.path.join(pb_path, "status")):
+        index = index_job_events(pb_path)
+        if index is not None:
+            return index
+
+    return build_event_index(pb_path)
+
+
+def read_stored_json(pb_path, storage, entry):
+    """ Read the JSON of an index entry's (or record's) event, as bytes """
+    for blob in read_blobs(pb_path, storage, [entry]):
+        return bytes(blob)
+
+
+def open_event(pb_path, event_id):
+    """ Find a single event of a play, from its event file, log or segment
+
+    The event isn't decoded, so it can be passed on as is
+
+    :param pb_path: artifacts directory of the play
+    :param event_id: event id (counter-uuid)
+    :return: the event's JSON - bytes, or an open (binary) file when the
+             event has its own file. None if the event doesn't exist
+    """
+    if not EVENT_ID.match(event_id):
+        return None
+
+    try:
+        return open(event_file_path(pb_path, event_id), 'rb')
+    except FileNotFoundError:
+        pass
+
+    if not os.path.exists(pb_path):
+        return None
+
+    counter, event_uuid = event_id.split('-', 1)
+    index = get_event_index(pb_path)
+    entry = index.by_counter.get(int(counter))
+    if index.storage == STORAGE_FILES or entry is None or \
+            entry.uuid != event_uuid:
+        return None
+
+    return read_stored_json(pb_path, index.storage, entry)
+
+
+def read_batch(pb_path, entries, parser, storage=STORAGE_FILES):
+    """ Read and parse the events of a set of entries, using the event_scanner
+
+    Event files are read in parallel, while the events of a segment or log are
+    read in a single pass over each chunk of entries
+
+    :param pb_path: artifacts directory of the play
+    :param entries: list of IndexEntry or EventRecord objects, in counter order
+    :param parser: as for scan_events
+    :param storage: where the events are held
+    :return: dict of results, indexed by event id (counter-uuid)
+    """
+    if storage != STORAGE_FILES:
+        results = event_scanner.scan(functools.partial(scan_stored_events,
+                                                       pb_path=pb_path,
+                                                       storage=storage,
+                                                       parser=parser),
+                                     entries)
+    else:
+        # a cached record may still hold its event, before the file is
+        # written
+        held = {}
+        for entry in entries:
+            event_info = getattr(entry, 'data', None)
+            if event_info is not None:
+                held[entry_id(entry)] = event_info
+
+        results = scan_events([event_file_path(pb_path, entry_id(entry))
+                               for entry in entries
+                               if entry_id(entry) not in held],
+                              parser)
+        for event_id, event_info in held.items():
+            result = parser(None, event_info)
+            if result is not None:
+                results[event_id] = result
+
+    return results
+
+
+def match_batch(pb_path, entries, filter, storage=STORAGE_FILES,
+                fields=None):
+    """ Apply a filter (or projection) the entries can't answer, by reading
+    their events
+
+    :param pb_path: artifacts directory of the play
+    :param entries: list of IndexEntry or EventRecord objects, in counter order
+    :param filter: dict of key/value pairs an event must match
+    :param storage: where the events are held
+    :param fields: list of fields to return for each event, instead of its
+                   summary
+    :return: list of (event id, event summary) tuples in counter order
+    """
+    results = read_batch(pb_path, entries,
+                         functools.partial(summary_parser, filter, fields),
+                         storage)
+
+    # the entries are already in counter order
+    return [(entry_id(entry), results[entry_id(entry)])
+            for entry in entries
+            if entry_id(entry) in results]
+
+
+def iter_matches(pb_path, entries, filter, storage=STORAGE_FILES,
+                 fields=None):
+    """ Generate the events matching a filter, from the index entries (or
+    cached records) of a play
+
+    When the events need to be read to apply the filter, they're read
+    MATCH_BATCH_SIZE at a time, so only a batch is held in memory and the
+    reading stops once the caller has all the events it wants
+
+    :param pb_path: artifacts directory of the play
+    :param entries: list of IndexEntry or EventRecord objects, in counter order
+    :param filter: dict of key/value pairs an event must match
+    :param storage: where the events are held, when they need to be read
+    :param fields: list of fields to return for each event, instead of its
+                   summary
+    :return: generator of (event id, event summary) tuples in counter order
+    """
+    if can_filter(filter) and can_project(fields):
+        # the entries hold everything needed to match and summarise
+        for entry in entries:
+            if entry_matches(entry, filter, ignored_events):
+                if fields is None:
+                    yield entry_id(entry), entry_summary(entry)
+                else:
+                    yield entry_id(entry), entry_projection(entry, fields)
+        return
+
+    for pos in range(0, len(entries), MATCH_BATCH_SIZE):
+        for match in match_batch(pb_path,
+                                 entries[pos:pos + MATCH_BATCH_SIZE],
+                                 filter,
+                                 storage,
+                                 fields):
+            yield match
+
+
+def match_entries(pb_path, entries, filter, limit=None,
+                  storage=STORAGE_FILES, fields=None):
+    """ Apply a filter to the index entries (or cached records) of a play
+
+    :param pb_path: artifacts directory of the play
+    :param entries: list of IndexEntry or EventRecord objects, in counter order
+    :param filter: dict of key/value pairs an event must match
+    :param limit: stop once this many events have matched
+    :param storage: where the events are held, when they need to be read
+    :param fields: list of fields to return for each event, instead of its
+                   summary
+    :return: list of (event id, event summary) tuples in counter order
+    """
+    return list(itertools.islice(iter_matches(pb_path, entries, filter,
+                                              storage, fields),
+                                 limit))
+
+
+def encode_cursor(counter):
+    """ Return the opaque cursor used to fetch events after a counter """
+    return base64.urlsafe_b64encode(str(counter).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """ Return the event counter held by a cursor (ValueError if invalid) """
+    try:
+        counter = base64.urlsafe_b64decode(str(cursor)).decode()
+    except (TypeError, binascii.Error, UnicodeDecodeError):
+        raise ValueError("invalid cursor")
+    return int(counter)
 
-    logger.debug("[{}] Event scanner ended. Processed "
-                 "{} files".format(tname, ctr))
 
+def events_page(matched_events, limit):
+    """ Build the ListEvents payload for a page of matched events
 
-def get_events(play_uuid, filter):
+    :param matched_events: list of (event id, summary) tuples, holding up to
+                           limit + 1 items so the presence of more events is
+                           known without another lookup
+    :param limit: max number of events in the page (None for all)
+    :return: dict for the response's data
+    """
+    more = limit is not None and len(matched_events) > limit
+    if more:
+        matched_events = matched_events[:limit]
+
+    data = {"events": OrderedDict(matched_events),
+            "total_events": len(matched_events)}
+    if more:
+        last_counter = matched_events[-1][0].split('-', 1)[0]
+        data['next'] = encode_cursor(last_counter)
+    return data
+
+
+def events_page_chunks(matched_events, limit):
+    """ Generate the JSON of a ListEvents page, as the events are matched
+
+    The page matches the one events_page builds, without holding the
+    events in memory
+
+    :param matched_events: iterable of (event id, summary) tuples, holding up
+                           to limit + 1 items
+    :param limit: max number of events in the page (None for all)
+    :return: generator of JSON fragments, as bytes
+    """
+    yield b'{"events": {'
+
+    count = 0
+    more = False
+    last_id = None
+    try:
+        for event_id, summary in matched_events:
+            if limit is not None and count == limit:
+                more = True
+                break
+            yield b''.join([b', ' if count else b'',
+                            codec.dumps_bytes(event_id),
+                            b': ',
+                            codec.dumps_bytes(summary)])
+            count += 1
+            last_id = event_id
+    except ScanError as err:
+        # the response has started, so it can only be cut short - the client
+        # sees an incomplete transfer rather than a short page
+        logger.error("Event list cut short after {} events: "
+                     "{}".format(count, err))
+        raise
+
+    yield '}}, "total_events": {}'.format(count).encode('utf-8')
+    if more:
+        last_counter = last_id.split('-', 1)[0]
+        yield b', "next": ' + codec.dumps_bytes(encode_cursor(last_counter))
+    yield b'}'
+
+
+def list_events(play_uuid, filter, since=0, limit=None, fields=None):
+    """ Find the events of a play that match a filter, lazily
+
+    :param play_uuid: play to look at
+    :param filter: dict of key/value pairs an event must match
+    :param since: only events with a counter above this are returned
+    :param limit: max number of events wanted. One more event is generated
+                  when available, so the caller knows there are more
+    :param fields: list of fields to return for each event (see
+                   project_event), instead of its summary
+    :return: APIResponse, with data holding a generator of (event id, summary)
+             tuples in counter order. The generator raises ScanError if the
+             events after the first batch can't be read
+    """
 
     r = APIResponse()
-    matched_events = {}
-
-    #  use cache if possible
-    if play_uuid in event_cache:
-        local_cache = event_cache.copy()
-        events = list(local_cache[play_uuid].values())
-        logger.debug("Job events for play {}: {}".format(play_uuid,
-                                                         len(events) - 1))
-        logger.debug("Active filter is :{}".format(filter))
-
-        for event_info in events:
-            if type(event_info) is not datetime.datetime:
-                event_info = filter_event(event_info, filter)
-                if event_info:
-                    event_filename = str(event_info['counter']) + '-' + event_info['uuid']
-                    matched_events[event_filename] = event_summary(event_info)
-
-        # sort the keys into numeric order
-        srtd_keys = sorted(matched_events, key=lambda x: int(x.split('-')[0]))
-        r.status, r.data = "OK", {"events": {k: matched_events[k]
-                                             for k in srtd_keys},
-                                  "total_events": len(srtd_keys)}
+    fetch = limit + 1 if limit is not None else None
+
+    #  use cache if possible. Once the play has finished its events may have
+    #  been compacted, so only the cached summaries are used
+    job_events = event_cache.get(play_uuid)
+    indexed = can_filter(filter) and can_project(fields)
+    if job_events is not None and (job_events.finished is None or indexed):
+        pb_path, storage = job_events.pb_path, job_events.storage
+        entries = job_events.select(filter, ignored_events, since)
+    else:
+        #  revert to io
+        pb_path = build_pb_path(play_uuid)
 
+        if not os.path.exists(pb_path):
+            r.status, r.msg = "NOTFOUND", "playbook uuid given does not exist"
+            return r
+
+        try:
+            index = get_event_index_since(pb_path, since)
+        except ScanError as err:
+            logger.error("Unable to index the events of play {}: "
+                         "{}".format(play_uuid, err))
+            r.status, r.msg = "FAILED", "Unable to read the events of the play"
+            return r
+        storage = index.storage
+        entries = index.select(filter, ignored_events, since)
+
+    logger.debug("Candidate events for play {} after {}: "
+                 "{}".format(play_uuid, since, len(entries)))
+    logger.debug("Active filter is :{}".format(filter))
+
+    matches = itertools.islice(iter_matches(pb_path, entries, filter,
+                                            storage, fields),
+                               fetch)
+
+    # the first batch of events is read before the caller starts a response,
+    # so a failure to read them is still reported as an error
+    try:
+        first = next(matches, None)
+    except ScanError as err:
+        logger.error("Unable to read the events of play {}: "
+                     "{}".format(play_uuid, err))
+        r.status, r.msg = "FAILED", "Unable to read the events of the play"
         return r
 
-    #  revert to io
+    r.status = "OK"
+    r.data = matches if first is None else itertools.chain([first], matches)
+    return r
+
+
+def get_events(play_uuid, filter, since=0, limit=None, fields=None):
+    """ Return the summary of a play's events that match a filter
+
+    :param play_uuid: play to look at
+    :param filter: dict of key/value pairs an event must match
+    :param since: only events with a counter above this are returned
+    :param limit: max number of events to return. When more events match, a
+                  'next' cursor is returned to fetch the following page
+    :param fields: list of fields to return for each event, instead of its
+                   summary
+    :return: APIResponse
+    """
+
+    r = list_events(play_uuid, filter, since, limit, fields)
+    if r.status == "OK":
+        try:
+            r.data = events_page(list(r.data), limit)
+        except ScanError as err:
+            logger.error("Unable to read the events of play {}: "
+                         "{}".format(play_uuid, err))
+            r.status, r.msg, r.data = "FAILED", \
+                "Unable to read the events of the play", {}
+
+    return r
+
+
+def job_etag(play_uuid, variant):
+    """ Return a strong ETag for a response about a finished play
+
+    The events of a finished play never change, so the ETag is derived from
+    the play's final status and event count, without reading the events.
+
+    :param play_uuid: play the response is about
+    :param variant: identifies the response, e.g. the request's path and query
+    :return: ETag (unquoted), or None if the play hasn't finished
+    """
     pb_path = build_pb_path(play_uuid)
+    status_path = os.path.join(pb_path, "status")
+    try:
+        status = fread(status_path)
+        status_mtime = os.stat(status_path).st_mtime_ns
+    except (IOError, OSError):
+        return None
 
-    if not os.path.exists(pb_path):
-        r.status, r.msg = "NOTFOUND", "playbook uuid given does not exist"
+    tag = "{}:{}:{}:{}:{}:{}".format(play_uuid,
+                                     status,
+                                     status_mtime,
+                                     len(get_event_index(pb_path)),
+                                     codec.backend,
+                                     variant)
+    return hashlib.sha1(tag.encode('utf-8')).hexdigest()
+
+
+def job_exists(play_uuid):
+    return play_uuid in event_cache or \
+        os.path.exists(build_pb_path(play_uuid))
+
+
+def sse_message(data, event_type=None, event_counter=None):
+    """ Format a Server-Sent Events message """
+    msg = ''
+    if event_counter is not None:
+        msg += "id: {}\n".format(event_counter)
+    if event_type:
+        msg += "event: {}\n".format(event_type)
+    msg += "data: {}\n\n".format(codec.dumps(data))
+    return msg
+
+
+def event_stream(play_uuid, filter, last_counter=0, fields=None):
+    """ Generate a Server-Sent Events stream of a play's events
+
+    Events are pushed as they're received by cb_event_handler, using the
+    event_cache entry of the play, so a stream only ever handles new events.
+    Plays that are no longer in the cache are served from the artifacts
+    directory; if the play is still running the stream is then closed, and
+    the client reconnects using the Last-Event-ID to resume.
+
+    :param play_uuid: play to follow
+    :param filter: dict of key/value pairs an event must match
+    :param last_counter: counter of the last event the client has seen
+    :param fields: list of fields to send for each event, instead of its
+                   summary
+    :return: generator of SSE formatted messages
+    """
+    keepalive = configuration.settings.event_stream_keepalive
+
+    yield "retry: {}\n\n".format(keepalive * 1000)
+
+    while True:
+        job_events = event_cache.get(play_uuid)
+        if job_events is None:
+            break
+
+        events, finished = job_events.wait(last_counter, keepalive)
+        if finished and not (can_filter(filter) and can_project(fields)):
+            # the event files may have been compacted, so use the index
+            break
+
+        for event_id, summary in match_entries(job_events.pb_path, events,
+                                               filter,
+                                               storage=job_events.storage,
+                                               fields=fields):
+            yield sse_message({event_id: summary},
+                              event_counter=event_id.split('-', 1)[0])
+        if events:
+            last_counter = events[-1].counter
+        elif finished:
+            yield sse_message({"status": finished}, event_type="end")
+            return
+        else:
+            yield ": keepalive\n\n"
+
+    # play isn't (or is no longer) cached, so use the artifacts
+    pb_path = build_pb_path(play_uuid)
+    index = get_event_index_since(pb_path, last_counter)
+    for event_id, summary in match_entries(pb_path,
+                                           index.since(last_counter),
+                                           filter,
+                                           storage=index.storage,
+                                           fields=fields):
+        yield sse_message({event_id: summary},
+                          event_counter=event_id.split('-', 1)[0])
+
+    status_path = os.path.join(pb_path, "status")
+    if os.path.exists(status_path):
+        yield sse_message({"status": fread(status_path)}, event_type="end")
+
+
+def open_stdout(play_uuid, offset=0):
+    """ Open the output of a play, from a given byte offset
+
+    ansible_runner writes the output to the stdout file in the play's
+    artifacts directory as the play runs, so the file serves both running and
+    finished plays
+
+    :param play_uuid: play to look at
+    :param offset: byte offset to start from
+    :return: APIResponse, with the data holding a tuple of the open (binary)
+             file positioned at the offset (None if there's no output yet),
+             and the number of bytes available after the offset. The caller
+             must close the file
+    """
+    r = APIResponse()
+
+    pb_path = build_pb_path(play_uuid)
+    try:
+        stdout_fd = open(os.path.join(pb_path, "stdout"), 'rb')
+    except FileNotFoundError:
+        if not os.path.exists(pb_path):
+            r.status, r.msg = "NOTFOUND", "playbook uuid given does not exist"
+        elif offset:
+            r.status, r.msg = "INVALID", "offset is beyond the end of the output"
+        else:
+            r.status, r.data = "OK", (None, 0)
         return r
 
-    event_dir = os.path.join(pb_path, "job_events")
-    play_uuid = os.path.basename(pb_path)
-    _events = os.listdir(event_dir)
-    logger.debug("Job events for play {}: {}".format(play_uuid,
-                                                     len(_events)))
-    logger.debug("Active filter is :{}".format(filter))
-    work_queue = queue.Queue()
-    for event_file in _events:
-        event_path = os.path.join(event_dir, event_file)
-        work_queue.put(event_path)
-
-    threads = []
-    for ctr in range(0, configuration.settings.event_threads):
-        _t = threading.Thread(target=scan_event_data,
-                              args=(work_queue, filter, matched_events,))
-        _t.daemon = True
-        threads.append(_t)
-        _t.start()
-
-    # Wait for the queue to signal all items have been processed
-    work_queue.join()
-
-    # sort the keys into numeric order
-    srtd_keys = sorted(matched_events, key=lambda x: int(x.split('-')[0]))
-    r.status, r.data = "OK", {"events": {k[:-5]: matched_events[k]
-                                         for k in srtd_keys},
-                              "total_events": len(srtd_keys)}
+    size = os.fstat(stdout_fd.fileno()).st_size
+    if offset > size:
+        stdout_fd.close()
+        r.status, r.msg = "INVALID", "offset is beyond the end of the output"
+        return r
 
+    stdout_fd.seek(offset)
+    r.status, r.data = "OK", (stdout_fd, size - offset)
     return r
 
 
-def get_event(play_uuid, event_uuid):
+def get_raw_event(play_uuid, event_uuid):
+    """ Return a single event of a play, without decoding it
+
+    :param play_uuid: play to look at
+    :param event_uuid: event id (counter-uuid)
+    :return: APIResponse, with the data holding the event's JSON as bytes or
+             an open (binary) file, which the caller must close
+    """
     r = APIResponse()
 
-    #  try to use cache first
-    cut_event_uuid = event_uuid.split('-', 1)[1]
-    if play_uuid in event_cache:
-        if cut_event_uuid in event_cache[play_uuid]:
-            r.status, r.data = "OK", event_cache[play_uuid][cut_event_uuid]
-            return r
+    try:
+        #  try to use cache first
+        event_json = None
+        cut_event_uuid = event_uuid.split('-', 1)[-1]
+        job_events = event_cache.get(play_uuid)
+        record = job_events.get(cut_event_uuid) if job_events else None
+        if record and record.data is not None:
+            event_json = codec.dumps_bytes(record.data)
+        elif record and job_events.storage == STORAGE_LOG and \
+                job_events.finished is None:
+            # the play is running, so its event log is still in place
+            event_json = read_stored_json(job_events.pb_path, STORAGE_LOG,
+                                          record)
 
-    #  revert to io
-    pb_path = build_pb_path(play_uuid)
-    event_path = glob.glob(os.path.join(pb_path,
-                                        "job_events",
-                                        "{}.json".format(event_uuid)))
+        #  revert to io
+        if event_json is None:
+            event_json = open_event(build_pb_path(play_uuid), event_uuid)
+    except (IOError, OSError, ValueError) as err:
+        logger.warning("Unable to read event {} for play {}: "
+                       "{}".format(event_uuid, play_uuid, err))
+        event_json = None
 
-    if event_path:
-        r.status, r.data = "OK", json.loads(fread(event_path[0]))
-        return r
+    if event_json is not None:
+        r.status, r.data = "OK", event_json
     else:
         r.status, r.msg = "NOTFOUND", "Event not found"
+    return r
+
+
+def parse_event_ref(ref):
+    """ Return the counter and uuid of an event requested in a batch
+
+    :param ref: event id (counter-uuid), or event counter
+    :return: tuple of (counter, uuid), with a uuid of None when only the
+             counter is given
+    :raises ValueError: if the reference isn't an event id or counter
+    """
+    if isinstance(ref, int) and not isinstance(ref, bool):
+        return ref, None
+    if isinstance(ref, str):
+        if ref.isdigit():
+            return int(ref), None
+        if EVENT_ID.match(ref):
+            counter, event_uuid = ref.split('-', 1)
+            return int(counter), event_uuid
+    raise ValueError("{} is not an event id or counter".format(ref))
+
+
+def get_event_batch(play_uuid, event_refs, fields=None):
+    """ Return a set of events of a play, in a single request
+
+    :param play_uuid: play to look at
+    :param event_refs: list of event ids (counter-uuid) or event counters
+    :param fields: list of fields to return for each event (see
+                   project_event), instead of the whole event
+    :return: APIResponse, with data holding the events found in counter order,
+             and the references that couldn't be found
+    """
+    r = APIResponse()
+
+    if len(event_refs) > EVENT_BATCH_MAX:
+        r.status, r.msg = "INVALID", \
+            "A batch is limited to {} events".format(EVENT_BATCH_MAX)
+        return r
+
+    try:
+        wanted = [(ref, parse_event_ref(ref)) for ref in event_refs]
+    except ValueError as err:
+        r.status, r.msg = "INVALID", str(err)
         return r
+
+    #  use cache if the play is running, since its events aren't indexed yet
+    job_events = event_cache.get(play_uuid)
+    if job_events is not None and job_events.finished is None:
+        pb_path, storage = job_events.pb_path, job_events.storage
+        lookup = job_events.get_counter
+    else:
+        pb_path = build_pb_path(play_uuid)
+        if not os.path.exists(pb_path):
+            r.status, r.msg = "NOTFOUND", "playbook uuid given does not exist"
+            return r
+
+        index = get_event_index(pb_path)
+        storage, lookup = index.storage, index.by_counter.get
+
+    entries, refs, missing = {}, {}, []
+    for ref, (counter, event_uuid) in wanted:
+        entry = lookup(counter)
+        if entry is None or (event_uuid and entry.uuid != event_uuid):
+            missing.append(ref)
+        else:
+            entries[counter] = entry
+            refs[counter] = ref
+
+    # events that can't be decoded are reported as missing, while a failure
+    # to read them fails the request
+    try:
+        results = read_batch(pb_path,
+                             [entries[counter] for counter in sorted(entries)],
+                             functools.partial(event_parser, fields),
+                             storage)
+    except ScanError as err:
+        logger.error("Unable to read a batch of events of play {}: "
+                     "{}".format(play_uuid, err))
+        r.status, r.msg = "FAILED", "Unable to read the events of the play"
+        return r
+
+    events = OrderedDict()
+    for counter in sorted(entries):
+        event_id = entry_id(entries[counter])
+        if event_id in results:
+            events[event_id] = results[event_id]
+        else:
+            missing.append(refs[counter])
+
+    r.status = "OK"
+    r.data = {"events": events,
+              "total_events": len(events),
+              "missing": missing}
+    return r
+
+
+def get_event(play_uuid, event_uuid, fields=None):
+    """ Return a single event of a play
+
+    :param play_uuid: play to look at
+    :param event_uuid: event id (counter-uuid)
+    :param fields: list of fields to return (see project_event), instead of
+                   the whole event
+    :return: APIResponse
+    """
+    r = get_raw_event(play_uuid, event_uuid)
+
+    if r.status == "OK" and not isinstance(r.data, bytes):
+        with r.data as event_fd:
+            r.data = event_fd.read()
+    if r.status == "OK":
+        try:
+            r.data = codec.loads(r.data)
+        except ValueError as err:
+            logger.warning("Invalid JSON within event {} for play {}: "
+                           "{}".format(event_uuid, play_uuid, err))
+            r.status, r.msg, r.data = "NOTFOUND", "Event not found", {}
+    if r.status == "OK" and fields is not None:
+        r.data = project_event(r.data, fields)
+
+    return r
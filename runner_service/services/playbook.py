@@ -3,21 +3,37 @@ import os
 import glob
 import uuid
 import time
-import datetime
 import getpass
+import threading
+from functools import partial
 
 from ansible_runner import run_async
 from ansible_runner.exceptions import AnsibleRunnerException
 from runner_service import configuration
 from runner_service.cache import runner_cache, runner_stats
-from .utils import APIResponse
+from .utils import APIResponse, build_pb_path
+from .jobs import index_job_events, defer_event_files_removal
+from .host_history import record_play, play_stats
+from .scheduler import job_scheduler, DEFAULT_PRIORITY
+from .profile import PlayProfile, play_profiles, save_profile
+from .event_index import (STORAGE_FILES,
+                          STORAGE_LOG,
+                          STORAGE_SEGMENT,
+                          indexed_values)
+from .event_store import EventLog
 from ..utils import fread
 
-from ..cache import event_cache
+from ..cache import event_cache, JobEvents
 
 import logging
 logger = logging.getLogger(__name__)
 
+# event logs of the running plays, when event_storage is 'log'
+event_logs = {}
+
+# seconds a playbook start request waits for ansible_runner to start the play
+START_TIMEOUT = 5
+
 
 def get_status(play_uuid):
     r = APIResponse()
@@ -25,6 +41,15 @@ def get_status(play_uuid):
     if play_uuid in runner_cache:
         # this is an active playbook, so just use the cache to indicate state
         runner = runner_cache[play_uuid]['runner']
+        if runner is None:
+            # the play hasn't been launched by the job scheduler yet
+            r.status, r.msg = "OK", runner_cache[play_uuid]['status']
+            r.data = {
+                "queue_position": job_scheduler.position(play_uuid),
+                "priority": runner_cache[play_uuid]['priority']
+            }
+            return r
+
         r.status, r.msg = "OK", runner.status
 
         r.data = {
@@ -88,11 +113,59 @@ def list_playbooks():
 
 def stop_playbook(play_uuid):
     logger.info("Cancel request for {} issued".format(play_uuid))
+    if job_scheduler.cancel(play_uuid):
+        # still queued, so there's no ansible-playbook process to stop
+        end_unlaunched(play_uuid, "canceled")
+        return
+
     _runner = runner_cache[play_uuid].get('runner')
-    _runner.canceled = True
+    if _runner is not None:
+        _runner.canceled = True
     return
 
 
+def end_unlaunched(play_uuid, status):
+    """ Tidy up after a play that ansible_runner never ran
+
+    The play was canceled while queued, or failed to launch. The status file
+    is written in ansible_runner's place, so the play's state is still known
+    once it has left the runner_cache
+
+    :param play_uuid: play that has ended
+    :param status: final state of the play
+    """
+    logger.info("Play {} ended before it was launched, "
+                "status={}".format(play_uuid, status))
+
+    status_path = os.path.join(build_pb_path(play_uuid), "status")
+    try:
+        with open(status_path, "w") as status_fd:
+            status_fd.write(status)
+    except (IOError, OSError) as err:
+        logger.error("Unable to write the status of play {}: "
+                     "{}".format(play_uuid, err))
+
+    if status in runner_stats.playbook_status:
+        runner_stats.playbook_status[status] += 1
+    else:
+        runner_stats.playbook_status[status] = 1
+
+    runner_cache[play_uuid]['status'] = status
+    runner_cache[play_uuid]['started'].set()
+
+    event_log = event_logs.pop(play_uuid, None)
+    if event_log is not None:
+        event_log.close()
+    play_profiles.pop(play_uuid, None)
+
+    job_events = event_cache.peek(play_uuid)
+    if job_events is not None:
+        job_events.finish(status)
+
+    job_scheduler.finished(play_uuid)
+    prune_runner_cache(play_uuid)
+
+
 def cb_playbook_finished(runner):
     """ Report on playbook end state
 
@@ -108,14 +181,6 @@ def cb_playbook_finished(runner):
                                    runner.config.ident,
                                    runner.status))
 
-    try:
-        stats = runner.stats
-    except AnsibleRunnerException as err:
-        stats = err
-    finally:
-        logger.info("Playbook {} Stats: {}".format(runner.config.playbook,
-                                                   stats))
-
     if runner.status in runner_stats.playbook_status:
         runner_stats.playbook_status[runner.status] += 1
     else:
@@ -123,9 +188,59 @@ def cb_playbook_finished(runner):
 
     runner_cache[runner.config.ident]['status'] = runner.status
 
+    # the ansible-playbook process has ended, so its slot can go to the next
+    # queued play before the artifacts are tidied up
+    job_scheduler.finished(runner.config.ident)
+
+    event_log = event_logs.pop(runner.config.ident, None)
+    if event_log is not None:
+        event_log.close()
+
+    # all the job events are on disk now, so index (and compact) them for
+    # later queries
+    index = index_job_events(runner.config.artifact_dir)
+    save_profile(runner.config.ident, runner.config.artifact_dir)
+
+    logger.info("Playbook {} Stats: {}".format(runner.config.playbook,
+                                               final_stats(runner)))
+
+    # wake up any event streams following this play
+    job_events = event_cache.peek(runner.config.ident)
+    if job_events is not None:
+        job_events.finish(runner.status)
+
+    # readers switch to the segment once the play has finished, but those
+    # already part way through the event files are given time to finish
+    if index is not None and index.storage == STORAGE_SEGMENT:
+        defer_event_files_removal(runner.config.artifact_dir)
+
+    record_play(runner.config.ident)
+
     prune_runner_cache(runner.config.ident)
 
 
+def final_stats(runner):
+    """ Return the final stats of a play, as ansible_runner's Runner.stats
+
+    ansible_runner reads them from the play's event files, which aren't
+    written when the events go to the play's log, so the play's own event
+    store is used instead
+    """
+    try:
+        stats = runner.stats
+    except AnsibleRunnerException as err:
+        return err
+
+    if stats is None:
+        stats_event = play_stats(runner.config.ident, runner.config.artifact_dir)
+        if stats_event is not None:
+            event_data = stats_event.get('event_data', {})
+            stats = {key: event_data.get(key)
+                     for key in ['skipped', 'ok', 'dark', 'failures',
+                                 'processed']}
+    return stats
+
+
 def prune_runner_cache(current_runner):
     if len(runner_cache.keys()) >= configuration.settings.runner_cache_size:
         logger.debug("Maintaining runner_cache entries")
@@ -134,6 +249,43 @@ def prune_runner_cache(current_runner):
         del runner_cache[current_runner]
 
 
+def record_startup(play_uuid, start_epoc):
+    """ Account for the time a playbook took to start, up to its first event
+
+    :param play_uuid: play that has started
+    :param start_epoc: time the play was launched
+    """
+    if not start_epoc:
+        return
+
+    startup = time.time() - start_epoc
+    stats = runner_stats.job_startup
+    stats['count'] += 1
+    stats['total_secs'] += startup
+    stats['last_secs'] = startup
+    stats['max_secs'] = max(stats['max_secs'], startup)
+
+    logger.debug("Playbook {} took {:.3f}s to start".format(play_uuid,
+                                                            startup))
+
+
+def cb_status_handler(status_data, runner_config=None):
+    """ Track the state of a playbook run, as ansible_runner changes it
+
+    The first change (to 'starting') wakes up the request waiting for the run
+    to start
+
+    :param status_data: dict holding the new status and the runner_ident
+    :param runner_config: RunnerConfig of the run
+    """
+    ident = status_data.get('runner_ident')
+    if ident not in runner_cache:
+        return
+
+    runner_cache[ident]['status'] = status_data['status']
+    runner_cache[ident]['started'].set()
+
+
 def cb_event_handler(event_data):
 
     logger.debug("cb_event_handler event_data={}".format(event_data))
@@ -150,6 +302,9 @@ def cb_event_handler(event_data):
     # maintain the current state of any inflight playbook
     ident = event_data.get('runner_ident', None)
     if ident:
+        if event_type == "playbook_on_start":
+            record_startup(ident, runner_cache[ident].get('start_epoc'))
+
         if event_type == "playbook_on_task_start":
             runner_cache[ident]['current_task'] = \
                 event_data['event_data'].get('task', "Unknown task")
@@ -180,16 +335,36 @@ def cb_event_handler(event_data):
                     event_metadata = event_data['event_data']
                     runner_cache[ident]['failures'][event_metadata.get('host')] = event_data # noqa
 
+    # time the play's tasks, from the same fields the event index holds
+    profile = play_profiles.get(ident)
+    if profile is not None:
+        values = indexed_values(event_data)
+        profile.add(event_type, values['host'], values['task'],
+                    event_data.get('created'))
+
     # populate the event cache
-    if 'runner_ident' in event_data and \
-       'uuid' in event_data and ident in event_cache:
-        event_cache[ident].update({event_data['uuid']: event_data})
+    if 'runner_ident' in event_data and 'uuid' in event_data:
+        event_log = event_logs.get(ident)
+        if event_log is not None:
+            try:
+                offset, length = event_log.append(event_data)
+            except (IOError, OSError) as err:
+                logger.error("Unable to log event {} of play {}: "
+                             "{}".format(event_data['counter'], ident, err))
+            else:
+                event_cache.add_event(ident, event_data, offset, length)
+                # the event is in the play's log, so ansible_runner doesn't
+                # need to write an event file
+                return False
 
-    # regardless return true to ensure the data is written to artifacts dir
+        event_cache.add_event(ident, event_data)
+
+    # otherwise return true to ensure the data is written to artifacts dir
     return True
 
 
-def start_playbook(playbook_name, vars=None, filter=None, tags=None):
+def start_playbook(playbook_name, vars=None, filter=None, tags=None,
+                   client=None):
     """ Initiate a playbook run """
 
     r = APIResponse()
@@ -202,16 +377,18 @@ def start_playbook(playbook_name, vars=None, filter=None, tags=None):
     # this should just be run_async, using 'run' hangs the root logger output
     # even when backgrounded
 
-    artifacts_dir = os.path.join(configuration.settings.playbooks_root_dir, "artifacts")
-    private_data_dir = os.path.join(artifacts_dir, play_uuid)
+    private_data_dir = build_pb_path(play_uuid)
     os.makedirs(private_data_dir)
     parms = {
         "private_data_dir": private_data_dir,
         "project_dir": os.path.join(configuration.settings.playbooks_root_dir, 'project'),
         "inventory": os.path.join(configuration.settings.playbooks_root_dir, 'inventory'),
-        "artifact_dir": artifacts_dir,
+        # ansible_runner appends artifacts/<ident> to the artifact_dir, so
+        # the job's artifacts land in the same directory as build_pb_path
+        "artifact_dir": configuration.settings.playbooks_root_dir,
         "settings": settings,
         "finished_callback": cb_playbook_finished,
+        "status_handler": cb_status_handler,
         "event_handler": cb_event_handler,
         "quiet": False,
         "ident": play_uuid,
@@ -248,33 +425,20 @@ def start_playbook(playbook_name, vars=None, filter=None, tags=None):
 
     parms['cmdline'] = ' '.join(cmdline)
 
-    _thread, _runner = run_async(**parms)
-
-    # Workaround for ansible_runner logging, resetting the rootlogger level
-    root_logger = logging.getLogger()
-    root_logger.setLevel(10)
-
-    delay = 0.1
-    timeout = 5 / delay
-    ctr = 0
-
-    # Wait for the play to actually start, but apply a timeout
-    while _runner.status.lower() == 'unstarted':
-        time.sleep(delay)
-        ctr += 1
-        if ctr > timeout:
-            r.status, r.msg = "TIMEOUT", "Timeout hit while waiting for " \
-                                         "playbook to start"
-            return r
-
-    logger.debug("Playbook {} started in {}s".format(play_uuid,
-                                                     ctr * delay))
+    storage = STORAGE_FILES
+    if configuration.settings.event_storage == STORAGE_LOG:
+        event_logs[play_uuid] = EventLog(private_data_dir)
+        storage = STORAGE_LOG
 
-    r.status, r.data = "OK", {"status": _runner.status,
-                              "play_uuid": play_uuid}
+    #  add uuid to cache before the run starts, so it sees all the events
+    event_cache.add(play_uuid, JobEvents(private_data_dir, storage))
+    play_profiles[play_uuid] = PlayProfile()
 
-    runner_cache[play_uuid] = {"runner": _runner,
-                               "status": _runner.status,
+    priority = filter.get('priority', DEFAULT_PRIORITY)
+    runner_cache[play_uuid] = {"runner": None,
+                               "status": "queued",
+                               "priority": priority,
+                               "started": threading.Event(),
                                "current_task": None,
                                "current_task_metadata": {
                                     "created": "",
@@ -284,21 +448,66 @@ def start_playbook(playbook_name, vars=None, filter=None, tags=None):
                                     },
                                "role": "",
                                "last_task_num": None,
-                               "start_epoc": time.time(),
+                               "start_epoc": None,
                                "skipped": 0,
                                "failed": 0,
                                "ok": 0,
                                "failures": {}
                                }
 
-    #  add uuid to cache so it can be filled with its events
-    event_cache[play_uuid] = {'time': datetime.datetime.now()}
-    #  limit event cache size
-    if len(event_cache) > configuration.settings.event_cache_size:
-        oldest = play_uuid
-        for ident in event_cache:
-            if event_cache[ident]['time'] < event_cache[oldest]['time']:
-                oldest = ident
-        del event_cache[oldest]
+    if not job_scheduler.submit(play_uuid,
+                                partial(launch_playbook, play_uuid, parms),
+                                client,
+                                priority):
+        r.status, r.data = "OK", {"status": "queued",
+                                  "play_uuid": play_uuid}
+        return r
+
+    cached = runner_cache.get(play_uuid, {})
+    _runner = cached.get('runner')
+    if _runner is None:
+        r.status, r.msg = "FAILED", "Runner thread failed to start"
+        return r
+
+    # Wait for the play to actually start, but apply a timeout. The status
+    # handler wakes us up as soon as ansible_runner starts the play
+    wait_start = time.time()
+    if not cached['started'].wait(START_TIMEOUT):
+        # the play may still start, so it can be tracked by its uuid
+        r.status, r.msg = "TIMEOUT", "Timeout hit while waiting for " \
+                                     "playbook to start"
+        r.data = {"status": cached['status'],
+                  "play_uuid": play_uuid}
+        return r
+
+    start_time = time.time() - wait_start
+    logger.debug("Playbook {} started in {:.3f}s".format(play_uuid,
+                                                         start_time))
+
+    r.status, r.data = "OK", {"status": _runner.status,
+                              "play_uuid": play_uuid}
 
     return r
+
+
+def launch_playbook(play_uuid, parms):
+    """ Start a playbook run, once the job scheduler has given it a slot
+
+    :param play_uuid: play to start
+    :param parms: dict of ansible_runner.run_async parameters
+    """
+    try:
+        _thread, _runner = run_async(**parms)
+    except Exception as err:
+        logger.error("ansible_runner failed to start play {}: "
+                     "{}".format(play_uuid, err))
+        end_unlaunched(play_uuid, "failed")
+        return
+
+    # Workaround for ansible_runner logging, resetting the rootlogger level
+    root_logger = logging.getLogger()
+    root_logger.setLevel(10)
+
+    if play_uuid in runner_cache:
+        runner_cache[play_uuid]['runner'] = _runner
+        runner_cache[play_uuid]['start_epoc'] = time.time()
@@ -0,0 +1,219 @@
+import os
+import datetime
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .utils import APIResponse, build_pb_path
+from .jobs import get_event_index
+from runner_service import codec
+
+import logging
+logger = logging.getLogger(__name__)
+
+# name of the timing profile of a finished play, held in its artifacts
+# directory
+PROFILE_FILE = "profile.json"
+
+# events starting a task, the run of a task against a host, and its result
+TASK_EVENTS = ['playbook_on_task_start', 'playbook_on_handler_task_start']
+HOST_START_EVENTS = ['runner_on_start']
+HOST_RESULT_EVENTS = ['runner_on_ok',
+                      'runner_on_failed',
+                      'runner_on_skipped',
+                      'runner_on_unreachable']
+
+# profiles of the running plays, fed by cb_event_handler
+play_profiles = {}
+
+
+def parse_time(created):
+    """ Return the datetime of an event's 'created' timestamp, or None """
+    for time_format in ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.datetime.strptime(created, time_format)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+class PlayProfile(object):
+    """ Timings of a play's tasks for each host, built as its events arrive
+
+    A task starts with its playbook_on_task_start event, and its run against
+    a host ends with the host's runner_on_* result. The run starts with the
+    host's runner_on_start event, when ansible sends one, otherwise with the
+    task itself.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = []
+        self.first = None
+        self.last = None
+        self._latest = {}
+        self._host_starts = {}
+
+    def add(self, event, host, task, created):
+        """ Account for an event, given the fields held by its index entry """
+        when = parse_time(created)
+        if when is None:
+            return
+
+        with self.lock:
+            if self.first is None:
+                self.first = when
+            self.last = max(self.last or when, when)
+
+            if event in TASK_EVENTS:
+                record = {"task": task, "start": when, "end": when,
+                          "hosts": OrderedDict()}
+                self.tasks.append(record)
+                # results are matched to the latest run of the task name
+                self._latest[task] = record
+
+            elif event in HOST_START_EVENTS and host:
+                self._host_starts[(task, host)] = when
+
+            elif event in HOST_RESULT_EVENTS and host:
+                record = self._latest.get(task)
+                if record is None:
+                    record = {"task": task, "start": when, "end": when,
+                              "hosts": OrderedDict()}
+                    self.tasks.append(record)
+                    self._latest[task] = record
+                start = self._host_starts.pop((task, host), record['start'])
+                record['hosts'][host] = (when - start).total_seconds()
+                record['end'] = max(record['end'], when)
+
+    def data(self):
+        """ Return the profile as a dict, in the form persisted on disk """
+        with self.lock:
+            duration = 0.0
+            if self.first is not None:
+                duration = (self.last - self.first).total_seconds()
+            return {
+                "duration": duration,
+                "tasks": [{"task": record['task'],
+                           "start": record['start'].isoformat(),
+                           "duration": (record['end'] - record['start'])
+                           .total_seconds(),
+                           "hosts": dict(record['hosts'])}
+                          for record in self.tasks]
+            }
+
+
+def build_profile(pb_path):
+    """ Build the profile of a play from its event index """
+    profile = PlayProfile()
+    for entry in get_event_index(pb_path).entries:
+        profile.add(entry.event, entry.host, entry.task, entry.created)
+    return profile.data()
+
+
+def load_profile(pb_path):
+    profile_path = os.path.join(pb_path, PROFILE_FILE)
+    try:
+        with open(profile_path, 'rb') as profile_fd:
+            return codec.loads(profile_fd.read())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_profile(pb_path, profile):
+    """ Persist the profile of a finished play
+
+    :param pb_path: artifacts directory of the play
+    :param profile: dict, as returned by PlayProfile.data
+    :return: True if the profile was written, False otherwise
+    """
+    try:
+        tmp_fd, tmp_file = tempfile.mkstemp(dir=pb_path, suffix='.tmp')
+        with os.fdopen(tmp_fd, 'wb') as profile_fd:
+            profile_fd.write(codec.dumps_bytes(profile))
+        os.rename(tmp_file, os.path.join(pb_path, PROFILE_FILE))
+    except (IOError, OSError) as err:
+        logger.error("Unable to write the profile for {}: "
+                     "{}".format(pb_path, err))
+        return False
+    return True
+
+
+def save_profile(play_uuid, pb_path):
+    """ Persist the profile of a play that has just finished """
+    profile = play_profiles.pop(play_uuid, None)
+    data = profile.data() if profile else build_profile(pb_path)
+    write_profile(pb_path, data)
+
+
+def profile_summary(profile, top=10):
+    """ Summarise a play's profile
+
+    :param profile: dict, as returned by PlayProfile.data
+    :param top: number of tasks and hosts to list
+    :return: dict holding the slowest tasks and hosts, and the critical path -
+             the slowest host of each task, which the other hosts wait for
+    """
+    host_totals = {}
+    for task in profile['tasks']:
+        for host, duration in task['hosts'].items():
+            host_totals[host] = host_totals.get(host, 0.0) + duration
+
+    slowest_tasks = sorted(profile['tasks'],
+                           key=lambda task: task['duration'],
+                           reverse=True)[:top]
+    slowest_hosts = sorted(host_totals.items(),
+                           key=lambda item: item[1],
+                           reverse=True)[:top]
+
+    critical_path = []
+    for task in profile['tasks']:
+        if task['hosts']:
+            host = max(task['hosts'], key=task['hosts'].get)
+            critical_path.append({"task": task['task'],
+                                  "host": host,
+                                  "duration": round(task['hosts'][host], 3)})
+
+    return {
+        "duration": round(profile['duration'], 3),
+        "tasks": [{"task": task['task'],
+                   "start": task['start'],
+                   "duration": round(task['duration'], 3),
+                   "hosts": len(task['hosts'])}
+                  for task in slowest_tasks],
+        "hosts": [{"host": host, "duration": round(duration, 3)}
+                  for host, duration in slowest_hosts],
+        "critical_path": critical_path
+    }
+
+
+def get_profile(play_uuid, top=10):
+    """ Return the timing profile of a play
+
+    Running plays use the profile built as their events arrive. The profile
+    of a finished play is read from its artifacts directory, and built from
+    its event index if the play predates the profiles.
+
+    :param play_uuid: play to look at
+    :param top: number of tasks and hosts to list
+    :return: APIResponse
+    """
+    r = APIResponse()
+
+    profile = play_profiles.get(play_uuid)
+    if profile is not None:
+        data = profile.data()
+    else:
+        pb_path = build_pb_path(play_uuid)
+        if not os.path.exists(pb_path):
+            r.status, r.msg = "NOTFOUND", "playbook uuid given does not exist"
+            return r
+
+        data = load_profile(pb_path)
+        if data is None:
+            data = build_profile(pb_path)
+            if os.path.exists(os.path.join(pb_path, "status")):
+                write_profile(pb_path, data)
+
+    r.status, r.data = "OK", profile_summary(data, top)
+    return r
@@ -0,0 +1,144 @@
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from runner_service import configuration
+
+import logging
+logger = logging.getLogger(__name__)
+
+# number of items handed to a worker at a time. Smaller chunks share the
+# workers more evenly between scans, larger ones reduce the overhead of
+# handing work to the process pool
+CHUNK_SIZE = 50
+
+
+class ScanError(Exception):
+    """ Raised when part of a scan failed, so its results are incomplete """
+
+
+class Scan(object):
+    """ Work and results of a single scan request """
+
+    def __init__(self, func, items):
+        self.func = func
+        self.chunks = deque(items[pos:pos + CHUNK_SIZE]
+                            for pos in range(0, len(items), CHUNK_SIZE))
+        self.outstanding = len(self.chunks)
+        self.total = self.outstanding
+        self.results = {}
+        self.errors = []
+        self.done = threading.Event()
+
+
+class EventScanner(object):
+    """ Process-wide pool of threads used to scan job event files
+
+    The number of worker threads is fixed by the event_threads setting, no
+    matter how many requests are scanning at the same time. Each request
+    queues its own work, and the workers take a chunk from each active scan
+    in turn, so a large scan doesn't hold up the smaller ones behind it.
+
+    When event_scan_processes is set, the workers hand their chunks to a pool
+    of processes, moving the JSON decoding away from the service's GIL. The
+    scan function (and its arguments) must then be picklable.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.scans = deque()
+        self.threads = []
+        self.busy = 0
+        self.process_pool = None
+        self.process_count = 0
+
+    def _start(self):
+        # called with the condition held, on first use so the settings
+        # have been loaded
+        processes = configuration.settings.event_scan_processes
+        if processes > 0:
+            logger.info("Starting {} event scan processes".format(processes))
+            self.process_pool = ProcessPoolExecutor(max_workers=processes)
+            self.process_count = processes
+
+        threads = configuration.settings.event_threads
+        logger.info("Starting {} event scan threads".format(threads))
+        for ctr in range(0, threads):
+            _t = threading.Thread(target=self._worker,
+                                  name="event-scanner-{}".format(ctr))
+            _t.daemon = True
+            self.threads.append(_t)
+            _t.start()
+
+    def _worker(self):
+        tname = threading.current_thread().name
+        logger.debug("[{}] Event scanner started".format(tname))
+
+        while True:
+            with self.cond:
+                while not self.scans:
+                    self.cond.wait()
+                scan = self.scans.popleft()
+                chunk = scan.chunks.popleft()
+                if scan.chunks:
+                    # back of the line, giving the other scans a turn
+                    self.scans.append(scan)
+                self.busy += 1
+
+            results, error = {}, None
+            try:
+                if self.process_pool:
+                    results = self.process_pool.submit(scan.func,
+                                                       chunk).result()
+                else:
+                    results = scan.func(chunk)
+            except Exception as err:
+                logger.error("[{}] Event scan of {} items failed: "
+                             "{}".format(tname, len(chunk), err))
+                error = err
+
+            with self.cond:
+                self.busy -= 1
+                scan.results.update(results)
+                if error is not None:
+                    scan.errors.append(error)
+                scan.outstanding -= 1
+                if scan.outstanding == 0:
+                    scan.done.set()
+
+    def scan(self, func, items):
+        """ Apply a function to a list of items, using the shared workers
+
+        :param func: function called with a chunk (list) of the items,
+                     returning a dict of results
+        :param items: list of items to process
+        :return: dict merging the results of each chunk
+        :raises ScanError: if any chunk failed, rather than returning partial
+                           results
+        """
+        scan = Scan(func, list(items))
+        if not scan.outstanding:
+            return scan.results
+
+        with self.cond:
+            if not self.threads:
+                self._start()
+            self.scans.append(scan)
+            self.cond.notify_all()
+
+        scan.done.wait()
+        if scan.errors:
+            raise ScanError("{} of {} chunks failed, first error: "
+                            "{}".format(len(scan.errors),
+                                        scan.total,
+                                        scan.errors[0]))
+        return scan.results
+
+    @property
+    def pending(self):
+        """ Number of scans waiting for a worker """
+        with self.cond:
+            return len(self.scans)
+
+
+event_scanner = EventScanner()
@@ -0,0 +1,288 @@
+import os
+import time
+import fcntl
+import heapq
+import threading
+import itertools
+
+from runner_service import configuration
+
+import logging
+logger = logging.getLogger(__name__)
+
+# weight of each priority class. A client's queued runs are launched at a
+# rate in proportion to the weight of their class, relative to the other
+# clients' runs
+PRIORITIES = {
+    'high': 4,
+    'normal': 2,
+    'low': 1
+}
+DEFAULT_PRIORITY = 'normal'
+
+# lock files in the artifacts directory, one per slot, shared by all the
+# service's processes
+SLOT_FILE = ".job-slot-{}.lock"
+
+# seconds between attempts to launch a queued run, while the slots are held
+# by other processes
+SLOT_POLL_INTERVAL = 1.0
+
+
+class Job(object):
+    """ A playbook run, waiting for or holding one of the scheduler's slots """
+
+    def __init__(self, play_uuid, launch, client=None,
+                 priority=DEFAULT_PRIORITY):
+        self.play_uuid = play_uuid
+        self.launch = launch
+        self.client = client
+        self.priority = priority
+        self.submitted = time.time()
+        self.started = None
+        # virtual start time and arrival order, which order the queue
+        self.tag = 0.0
+        self.seq = 0
+
+    def __lt__(self, other):
+        return (self.tag, self.seq) < (other.tag, other.seq)
+
+    @property
+    def wait_time(self):
+        """ Seconds the job spent in the queue """
+        return (self.started or time.time()) - self.submitted
+
+
+class JobScheduler(object):
+    """ Limit on the number of playbooks running at once
+
+    Each playbook run takes a slot while its ansible-playbook process is
+    running. Once max_concurrent_jobs slots are taken, further runs are
+    queued, and launched as the running ones finish.
+
+    A slot is an flock held on one of max_concurrent_jobs lock files in the
+    artifacts directory, so the limit holds across all the service's
+    processes (e.g. uwsgi workers). Each process keeps its own queue, and
+    polls for slots released by the other processes while it has runs
+    waiting.
+
+    The queue shares the slots between clients by weighted fair queuing. Each
+    queued run is tagged with a virtual start time - the later of the
+    scheduler's virtual clock and the tag of the previous run of the same
+    client and priority class, plus the cost of the run (1 / the weight of
+    its priority class). Runs are launched in tag order, so a client's runs
+    of a class stay in the order it sent them, a client with a burst of runs
+    doesn't hold up the others, and high priority runs overtake the bulk of
+    the queue - including the client's own lower priority runs - without
+    starving it.
+    """
+
+    def __init__(self, slots_dir=None):
+        self.lock = threading.Lock()
+        self.queue = []
+        self.running = set()
+        # slot lock file held by each running play
+        self.slots = {}
+        self._slots_dir = slots_dir
+        self.polling = False
+        self.vclock = 0.0
+        # tag of the latest queued run of each (client, priority class)
+        self.client_tags = {}
+        self._seq = itertools.count()
+        # jobs launched, and the total time they spent in the queue
+        self.started = 0
+        self.total_wait = 0.0
+
+    @property
+    def slots_dir(self):
+        if self._slots_dir:
+            return self._slots_dir
+        return os.path.join(configuration.settings.playbooks_root_dir,
+                            "artifacts")
+
+    def _take_slot(self, play_uuid):
+        # called with the lock held
+        limit = configuration.settings.max_concurrent_jobs
+        if limit <= 0:
+            self.running.add(play_uuid)
+            return True
+
+        os.makedirs(self.slots_dir, exist_ok=True)
+        for slot in range(limit):
+            slot_path = os.path.join(self.slots_dir, SLOT_FILE.format(slot))
+            slot_fd = open(slot_path, 'a')
+            try:
+                fcntl.flock(slot_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                # held by another run, in this or another process
+                slot_fd.close()
+                continue
+            self.slots[play_uuid] = slot_fd
+            self.running.add(play_uuid)
+            return True
+        return False
+
+    def _release_slot(self, play_uuid):
+        # called with the lock held
+        self.running.discard(play_uuid)
+        slot_fd = self.slots.pop(play_uuid, None)
+        if slot_fd is not None:
+            # closing the file drops the lock
+            slot_fd.close()
+
+    def _take_ready(self):
+        # called with the lock held, returns the queued jobs that now have a
+        # slot
+        ready = []
+        while self.queue and self._take_slot(self.queue[0].play_uuid):
+            ready.append(self._dequeue())
+        return ready
+
+    def _fill(self):
+        # called with the lock held, returns the jobs to launch
+        ready = self._take_ready()
+        if self.queue:
+            self._start_polling()
+        return ready
+
+    def _start_polling(self):
+        # called with the lock held
+        if not self.polling:
+            self.polling = True
+            threading.Thread(target=self._poll,
+                             name="job-slot-poll",
+                             daemon=True).start()
+
+    def _poll(self):
+        # the slots may be held by other processes, which don't tell us when
+        # they're released, so they're checked until the queue is empty
+        while True:
+            time.sleep(SLOT_POLL_INTERVAL)
+            with self.lock:
+                ready = self._take_ready()
+                done = not self.queue
+                if done:
+                    self.polling = False
+
+            for job in ready:
+                self._launch(job)
+            if done:
+                return
+
+    def _launch(self, job):
+        job.started = time.time()
+        with self.lock:
+            self.started += 1
+            self.total_wait += job.wait_time
+
+        logger.debug("Launching play {}, after {:.3f}s in the "
+                     "queue".format(job.play_uuid, job.wait_time))
+        try:
+            job.launch()
+        except Exception as err:
+            logger.error("Unable to launch play {}: "
+                         "{}".format(job.play_uuid, err))
+            self.finished(job.play_uuid)
+
+    def _enqueue(self, job):
+        # called with the lock held
+        chain = (job.client, job.priority)
+        start = max(self.vclock, self.client_tags.get(chain, 0.0))
+        job.tag = start + 1.0 / PRIORITIES[job.priority]
+        job.seq = next(self._seq)
+        self.client_tags[chain] = job.tag
+        heapq.heappush(self.queue, job)
+
+    def _dequeue(self):
+        # called with the lock held
+        job = heapq.heappop(self.queue)
+        self.vclock = job.tag
+        if not self.queue:
+            # every client is back in step with the clock
+            self.client_tags.clear()
+        return job
+
+    def submit(self, play_uuid, launch, client=None,
+               priority=DEFAULT_PRIORITY):
+        """ Launch a playbook run, or queue it if all the slots are taken
+
+        :param play_uuid: play to run
+        :param launch: function called, without arguments, to start the run.
+                       The run must call finished() once it ends
+        :param client: identity of the requester, whose runs share the slots
+                       fairly with the other clients' runs
+        :param priority: priority class of the run, a key of PRIORITIES
+        :return: True if the run was launched, False if it was queued
+        """
+        job = Job(play_uuid, launch, client, priority)
+        with self.lock:
+            # runs only start from the head of the queue, to keep it fair
+            if self.queue or not self._take_slot(play_uuid):
+                self._enqueue(job)
+                logger.info("Play {} queued for {} at {} priority, {} plays "
+                            "running, {} waiting".format(play_uuid,
+                                                         client,
+                                                         priority,
+                                                         len(self.running),
+                                                         len(self.queue)))
+                self._start_polling()
+                return False
+
+        self._launch(job)
+        return True
+
+    def finished(self, play_uuid):
+        """ Release the slot of a finished run, launching the queued runs
+        that now fit """
+        with self.lock:
+            self._release_slot(play_uuid)
+            ready = self._fill()
+
+        for job in ready:
+            self._launch(job)
+
+    def cancel(self, play_uuid):
+        """ Remove a run from the queue
+
+        :return: True if the run was queued, False otherwise
+        """
+        with self.lock:
+            for job in self.queue:
+                if job.play_uuid == play_uuid:
+                    self.queue.remove(job)
+                    heapq.heapify(self.queue)
+                    return True
+        return False
+
+    def position(self, play_uuid):
+        """ Return the 1-based position of a run in the queue, or None """
+        with self.lock:
+            for pos, job in enumerate(sorted(self.queue), 1):
+                if job.play_uuid == play_uuid:
+                    return pos
+        return None
+
+    @property
+    def depth(self):
+        """ Number of runs waiting for a slot """
+        with self.lock:
+            return len(self.queue)
+
+    def depth_by_priority(self):
+        """ Return the number of queued runs in each priority class """
+        depth = dict.fromkeys(PRIORITIES, 0)
+        with self.lock:
+            for job in self.queue:
+                depth[job.priority] += 1
+        return depth
+
+    @property
+    def oldest_wait(self):
+        """ Seconds the longest queued run has waited for """
+        with self.lock:
+            if not self.queue:
+                return 0.0
+            return max(job.wait_time for job in self.queue)
+
+
+job_scheduler = JobScheduler()
@@ -0,0 +1,204 @@
+""" Fan-out of a playbook across shards of its hosts
+
+A sharded run starts the same playbook several times, each run (shard)
+limited to a slice of the hosts, so the controller work of a large run is
+spread across several ansible-playbook processes. The shards are ordinary
+plays, queued by the job scheduler like any other. The parent play only has
+an artifacts directory holding SHARDS_FILE, which lists its shards.
+"""
+import os
+import uuid
+import datetime
+
+from .utils import APIResponse, build_pb_path
+from .playbook import get_status, start_playbook, stop_playbook
+from .jobs import list_events
+from .scanner import ScanError
+from runner_service.cache import runner_cache
+from runner_service import codec
+
+import logging
+logger = logging.getLogger(__name__)
+
+SHARDS_FILE = "shards.json"
+
+# final states of a shard, the first one held by any shard being the final
+# state of the parent
+FINISHED_STATES = ['failed', 'timeout', 'canceled', 'successful']
+
+
+def partition(hosts, count):
+    """ Split the hosts into count shards of (near) equal size
+
+    :param hosts: list of host names
+    :param count: number of shards wanted
+    :return: list of non-empty lists of hosts
+    """
+    shards = [hosts[pos::count] for pos in range(count)]
+    return [shard for shard in shards if shard]
+
+
+def load_shards(play_uuid):
+    """ Return the contents of a parent play's SHARDS_FILE, or None if the
+    play isn't sharded """
+    shards_path = os.path.join(build_pb_path(play_uuid), SHARDS_FILE)
+    try:
+        with open(shards_path, 'rb') as shards_fd:
+            return codec.loads(shards_fd.read())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def is_sharded(play_uuid):
+    return os.path.exists(os.path.join(build_pb_path(play_uuid),
+                                       SHARDS_FILE))
+
+
+def start_sharded_playbook(playbook_name, hosts, shard_count, vars=None,
+                           filter=None, tags=None, client=None):
+    """ Start a playbook as several runs, each limited to a shard of the hosts
+
+    :param playbook_name: playbook to run
+    :param hosts: list of hosts to spread across the shards
+    :param shard_count: number of shards wanted
+    :return: APIResponse, whose data holds the parent play_uuid, the uuids of
+             the shards and the parent's status
+    """
+    r = APIResponse()
+    play_uuid = str(uuid.uuid1())
+    pb_path = build_pb_path(play_uuid)
+    os.makedirs(pb_path)
+
+    shards = []
+    for shard_hosts in partition(hosts, shard_count):
+        shard_filter = dict(filter or {})
+        shard_filter['limit'] = ','.join(shard_hosts)
+        shard_filter.pop('shards', None)
+        shard_filter.pop('shard_group', None)
+
+        response = start_playbook(playbook_name, vars, shard_filter, tags,
+                                  client)
+        shard_uuid = response.data.get('play_uuid')
+        if shard_uuid is None:
+            logger.error("Shard {} of play {} failed to start: "
+                         "{}".format(len(shards), play_uuid, response.msg))
+            continue
+        shards.append({"play_uuid": shard_uuid,
+                       "hosts": shard_hosts})
+
+    record = {"playbook": playbook_name,
+              "created": datetime.datetime.now().isoformat(),
+              "shards": shards}
+    with open(os.path.join(pb_path, SHARDS_FILE), 'wb') as shards_fd:
+        shards_fd.write(codec.dumps_bytes(record))
+
+    logger.info("Play {} started as {} shards of {} "
+                "hosts".format(play_uuid, len(shards), len(hosts)))
+
+    if not shards:
+        r.status, r.msg = "FAILED", "None of the shards started"
+        return r
+
+    r.status, r.data = "OK", {"status": sharded_state(play_uuid, record)[0],
+                              "play_uuid": play_uuid,
+                              "shards": [shard['play_uuid']
+                                         for shard in shards]}
+    return r
+
+
+def sharded_state(play_uuid, record):
+    """ Work out the state of a parent play from the state of its shards
+
+    :return: tuple of (state, list of shard states)
+    """
+    states = []
+    for shard in record['shards']:
+        response = get_status(shard['play_uuid'])
+        state = response.msg if response.status == "OK" else "unknown"
+        states.append(state)
+
+    if all(state in FINISHED_STATES for state in states):
+        for state in FINISHED_STATES:
+            if state in states:
+                return state, states
+    if states and all(state == 'queued' for state in states):
+        return 'queued', states
+    return 'running', states
+
+
+def get_sharded_status(play_uuid):
+    """ Return the state of a sharded play, with the state of each shard
+
+    :param play_uuid: parent play
+    :return: APIResponse
+    """
+    r = APIResponse()
+
+    record = load_shards(play_uuid)
+    if record is None:
+        r.status, r.msg = "NOTFOUND", \
+                          "Playbook with UUID {} not found".format(play_uuid)
+        return r
+
+    state, states = sharded_state(play_uuid, record)
+    r.status, r.msg = "OK", state
+    r.data = {
+        "playbook": record['playbook'],
+        "shards": [{"play_uuid": shard['play_uuid'],
+                    "status": shard_state,
+                    "hosts": len(shard['hosts'])}
+                   for shard, shard_state in zip(record['shards'], states)]
+    }
+    return r
+
+
+def stop_sharded_playbook(play_uuid):
+    """ Cancel the active shards of a sharded play
+
+    :return: number of shards a cancel was issued to
+    """
+    record = load_shards(play_uuid) or {"shards": []}
+    canceled = 0
+    for shard in record['shards']:
+        if shard['play_uuid'] in runner_cache:
+            stop_playbook(shard['play_uuid'])
+            canceled += 1
+    return canceled
+
+
+def sharded_events(record, filter, fields):
+    # the shards are read one after the other, as the events are consumed
+    for shard in record['shards']:
+        response = list_events(shard['play_uuid'], filter, fields=fields)
+        if response.status == "FAILED":
+            raise ScanError(response.msg)
+        if response.status != "OK":
+            continue
+        for event_id, summary in response.data:
+            summary = dict(summary)
+            summary['play_uuid'] = shard['play_uuid']
+            yield event_id, summary
+
+
+def list_sharded_events(play_uuid, filter, fields=None):
+    """ Find the events of all the shards of a play that match a filter
+
+    The events are listed shard by shard, in counter order within each, and
+    their summary names the shard (play_uuid) they belong to
+
+    :param play_uuid: parent play
+    :param filter: Query an event must match
+    :param fields: list of fields to return for each event, instead of its
+                   summary
+    :return: APIResponse, with data holding a generator of (event id, summary)
+             tuples
+    """
+    r = APIResponse()
+
+    record = load_shards(play_uuid)
+    if record is None:
+        r.status, r.msg = "NOTFOUND", "playbook uuid given does not exist"
+        return r
+
+    r.status, r.data = "OK", sharded_events(record, filter, fields)
+    return r
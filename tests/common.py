@@ -36,6 +36,17 @@ def seed_dirs(seed_list):
         else:
             shutil.copyfile(src, dest)
 
+def make_event(counter, host='localhost', stdout='', rc=0):
+    """Build a runner_on_ok event, as ansible-runner writes it"""
+    return {"uuid": "event-{}".format(counter),
+            "counter": counter,
+            "event": "runner_on_ok",
+            "stdout": stdout,
+            "created": "2019-01-01T00:00:{:02d}.000000".format(counter),
+            "event_data": {"host": host,
+                           "task": "task-{}".format(counter),
+                           "res": {"rc": rc}}}
+
 def fake_ssh_client(func):
     def wrapper(self, *args, **kwargs):
         with patch('runner_service.utils.SSHClient') as MockSSHCLient:
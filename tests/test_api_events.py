@@ -1,11 +1,24 @@
 
+import os
 import sys
 import json
+import shutil
 import logging
 import unittest
+from unittest import mock
 
 sys.path.extend(["../", "./"])
 from common import APITestCase  # noqa
+from runner_service.services.jobs import (index_job_events,  # noqa
+                                          remove_event_files,
+                                          build_event_index,
+                                          cache_index)
+from runner_service.services.event_index import (index_path,    # noqa
+                                                 write_index)
+from runner_service.cache import index_cache                  # noqa
+from runner_service.services import jobs                      # noqa
+from runner_service.services.scanner import ScanError         # noqa
+from runner_service.services.playbook import final_stats      # noqa
 
 
 # turn of normal logging that the ansible_runner_service will generate
@@ -26,6 +39,47 @@ class TestJobEvents(APITestCase):
         self.assertEqual(payload['data']['total_events'],
                          49)
 
+    def test_list_job_events_streamed(self):
+        """- the event list is sent in chunks, in counter order"""
+        response = self.app.get('api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?limit=30')  # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        self.assertNotIn('Content-Length', response.headers)
+        payload = json.loads(response.data)
+        counters = [int(event_id.split('-', 1)[0])
+                    for event_id in payload['data']['events']]
+        self.assertEqual(counters, sorted(counters))
+        self.assertEqual(payload['data']['total_events'],
+                         30)
+        self.assertIn('next', payload['data'])
+
+    def test_list_job_events_not_modified(self):
+        """- events of a finished job are not resent when unchanged - 304"""
+        response = self.app.get('api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?host=con-1')  # noqa
+        etag = response.headers['ETag']
+
+        response = self.app.get('api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?host=con-1',  # noqa
+                                headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code,
+                         304)
+        self.assertEqual(response.data, b'')
+
+        # a different query is a different representation
+        response = self.app.get('api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?host=con-2',  # noqa
+                                headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code,
+                         200)
+
+    def test_fetch_event_not_modified(self):
+        """- an event of a finished job is not resent when unchanged - 304"""
+        url = "api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events/49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f"  # noqa
+        etag = self.app.get(url).headers['ETag']
+
+        response = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code,
+                         304)
+
     def test_list_invalid_job(self):
         """- list events for a playbook run that doesn't exist - error 404"""
         response = self.app.get("api/v1/jobs/93b955f2-b79a-11e8-8be9-c85b76719093/events")    # noqa
@@ -43,6 +97,72 @@ class TestJobEvents(APITestCase):
                          'application/json')
         self.assertIn("event_data", json.loads(response.data)['data'])
 
+    def test_fetch_event_passthrough(self):
+        """- a single event is returned as held in the artifacts"""
+        event_path = os.path.join(self.config.playbooks_root_dir,
+                                  "artifacts",
+                                  "53b955f2-b79a-11e8-8be9-c85b7671906d",
+                                  "job_events",
+                                  "49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f.json")   # noqa
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events/49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f")  # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        with open(event_path, 'rb') as event_fd:
+            self.assertIn(event_fd.read(), response.data)
+        self.assertEqual(int(response.headers['Content-Length']),
+                         len(response.data))
+        self.assertEqual(json.loads(response.data)['status'],
+                         "OK")
+
+    def test_fetch_event_fields(self):
+        """- fetch only the requested fields of an event"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events/49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f?fields=event,event_data.res.changed")    # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data'],
+                         {"event": "runner_on_ok",
+                          "event_data.res.changed": False})
+
+    def test_fetch_event_batch(self):
+        """- fetch several events by id or counter in one request"""
+        response = self.app.post("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events:batch?fields=counter,task",    # noqa
+                                 data=json.dumps({"events": ["49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f", 2, "99", "3-bad"]}),   # noqa
+                                 content_type="application/json")
+
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(list(payload['data']['events'].values()),
+                         [{"counter": 2}, {"counter": 49, "task": "RESULTS"}])
+        self.assertEqual(payload['data']['total_events'],
+                         2)
+        self.assertEqual(payload['data']['missing'],
+                         ["99", "3-bad"])
+
+    def test_fetch_event_batch_invalid(self):
+        """- reject a batch that isn't a list of event ids or counters"""
+        response = self.app.post("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events:batch",    # noqa
+                                 data=json.dumps({"events": [{"counter": 2}]}),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code,
+                         400)
+
+        response = self.app.post("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events:batch",    # noqa
+                                 data=json.dumps([2, 3]),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code,
+                         400)
+
+    def test_fetch_event_by_pattern(self):
+        """- event ids are not treated as patterns - error 404"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events/49-*")  # noqa
+
+        self.assertEqual(response.status_code,
+                         404)
+
     def test_fetch_invalid_event(self):
         """- attempt to fetch an invalid event - error 404"""
         response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events/49-9384d030-cd3d-4c76-a4d3-03d032c4dc93")  # noqa
@@ -77,6 +197,404 @@ class TestJobEvents(APITestCase):
         self.assertEqual(payload['data']['total_events'],
                          0)
 
+    def test_event_index_created(self):
+        """- listing events of a completed run persists an event index"""
+        index_path = os.path.join(self.config.playbooks_root_dir,
+                                  "artifacts",
+                                  "53b955f2-b79a-11e8-8be9-c85b7671906d",
+                                  "job_events.idx")
+        if os.path.exists(index_path):
+            # built by an earlier test
+            os.remove(index_path)
+        index_cache.clear()
+
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events")    # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        self.assertTrue(os.path.exists(index_path))
+
+    def test_get_event_with_multiple_filters(self):
+        """- use several indexed keys together to filter events"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?event=runner_on_ok&host=con-1") # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['total_events'],
+                         4)
+        for summary in payload['data']['events'].values():
+            self.assertEqual(summary['host'], 'con-1')
+            self.assertEqual(summary['event'], 'runner_on_ok')
+
+    def test_get_event_with_unindexed_filter(self):
+        """- use filter on a key that is not held in the event index"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?task_action=debug") # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['total_events'],
+                         1)
+        self.assertIn('49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f',
+                      payload['data']['events'])
+
+    def test_list_job_events_fields(self):
+        """- return the requested fields of each event instead of the summary"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?task=RESULTS&fields=counter,host")    # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['events']['49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f'],  # noqa
+                         {"counter": 49, "host": "con-2"})
+
+        # fields outside the index are read from the events
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?task=RESULTS&fields=task_action,event_data.res.changed,event_data.res.missing")    # noqa
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['events']['49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f'],  # noqa
+                         {"task_action": "debug",
+                          "event_data.res.changed": False})
+
+    def test_list_job_events_invalid_fields(self):
+        """- reject an empty field name"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?fields=host,")    # noqa
+
+        self.assertEqual(response.status_code,
+                         400)
+
+    def test_get_event_with_query(self):
+        """- use range, pattern and negated terms to find matching events"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?counter>=40&counter<45&event!=runner_item_on_skipped")    # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual([event_id.split('-')[0]
+                          for event_id in payload['data']['events']],
+                         ['40', '41', '42'])
+
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?created>2018-09-13T21:16:55.35&task~=^RES")    # noqa
+        payload = json.loads(response.data)
+        self.assertEqual(list(payload['data']['events']),
+                         ['49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f'])
+
+    def test_get_event_with_unindexed_query(self):
+        """- use a query on a key that is not held in the event index"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?task_action~=^deb&counter>40")    # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(list(payload['data']['events']),
+                         ['49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f'])
+
+    def test_get_event_with_invalid_query(self):
+        """- reject a query with an invalid pattern"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?task~=(")    # noqa
+
+        self.assertEqual(response.status_code,
+                         400)
+
+    def test_list_job_events_since(self):
+        """- list only the events after a given event counter"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?since=45")    # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['total_events'],
+                         5)
+        self.assertNotIn('next', payload['data'])
+
+    def test_list_job_events_paged(self):
+        """- page through the events using limit and the next cursor"""
+        url = "api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?limit=20"    # noqa
+        seen = []
+        while True:
+            response = self.app.get(url)
+            self.assertEqual(response.status_code,
+                             200)
+            payload = json.loads(response.data)
+            self.assertLessEqual(payload['data']['total_events'], 20)
+            seen.extend(payload['data']['events'].keys())
+            if 'next' not in payload['data']:
+                break
+            url = "api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?limit=20&next={}".format(payload['data']['next'])   # noqa
+
+        self.assertEqual(len(seen), 49)
+        self.assertEqual(len(set(seen)), 49)
+
+    def failing_batches(self, good_batches):
+        """ Patch the reading of events to fail after a number of batches """
+        read_batch = jobs.read_batch
+        calls = []
+
+        def failing_read_batch(*args, **kwargs):
+            calls.append(1)
+            if len(calls) > good_batches:
+                raise ScanError("1 of 1 chunks failed, first error: test")
+            return read_batch(*args, **kwargs)
+
+        return mock.patch.object(jobs, 'read_batch',
+                                 side_effect=failing_read_batch)
+
+    def test_list_job_events_read_failure(self):
+        """- events that can't be read fail the event list - error 500"""
+        with self.failing_batches(0):
+            response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?task_action=debug")  # noqa
+
+        self.assertEqual(response.status_code,
+                         500)
+
+    def test_list_job_events_read_failure_midway(self):
+        """- a read failure part way through the event list cuts it short"""
+        # the failure surfaces while the body is sent (once the first
+        # batch's response has started), rather than as a complete page
+        with self.failing_batches(1), \
+                mock.patch.object(jobs, 'MATCH_BATCH_SIZE', 10), \
+                self.assertRaises(ScanError):
+            response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?task_action~=.",  # noqa
+                                    buffered=False)
+            self.assertEqual(response.status_code,
+                             200)
+            response.get_data()
+
+    def test_list_job_events_invalid_limit(self):
+        """- use an invalid limit parameter - error 400"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events?limit=none")    # noqa
+
+        self.assertEqual(response.status_code,
+                         400)
+
+    def test_stream_job_events(self):
+        """- stream the events of a completed playbook run"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events/stream")  # noqa
+
+        self.assertEqual(response.status_code,
+                         200)
+        self.assertTrue(response.headers['Content-Type'].startswith(
+                        'text/event-stream'))
+
+        body = response.get_data(as_text=True)
+        self.assertEqual(body.count("\nid: "), 49)
+        last_message = body.rstrip('\n').split('\n\n')[-1]
+        self.assertTrue(last_message.startswith('event: end\ndata: '))
+        self.assertEqual(json.loads(last_message.split('data: ', 1)[1]),
+                         {"status": "successful"})
+
+    def test_stream_job_events_resume(self):
+        """- resume an event stream using the Last-Event-ID header"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/events/stream",  # noqa
+                                headers={"Last-Event-ID": "49"})
+
+        self.assertEqual(response.status_code,
+                         200)
+        body = response.get_data(as_text=True)
+        self.assertEqual(body.count("\nid: "), 1)
+        self.assertIn("50-906885d5-a67e-413d-914b-60b41a924192", body)
+
+    def test_stream_running_job_resume(self):
+        """- resuming a stream of an uncached running play only reads the
+        newer event files"""
+        artifacts = os.path.join(self.config.playbooks_root_dir, "artifacts")
+        pb_path = os.path.join(artifacts,
+                               "83b955f2-b79a-11e8-8be9-c85b7671906d")
+        shutil.copytree(os.path.join(artifacts,
+                                     "53b955f2-b79a-11e8-8be9-c85b7671906d"),
+                        pb_path,
+                        ignore=shutil.ignore_patterns("status",
+                                                      "job_events.*"))
+
+        def scanned(scan):
+            # number of event files read
+            return sum(len(event_paths)
+                       for (event_paths, _parser), _kw in scan.call_args_list)
+
+        with mock.patch.object(jobs, 'scan_events',
+                               wraps=jobs.scan_events) as scan:
+            response = self.app.get("api/v1/jobs/83b955f2-b79a-11e8-8be9-c85b7671906d/events/stream",  # noqa
+                                    headers={"Last-Event-ID": "45"})
+            body = response.get_data(as_text=True)
+
+            self.assertEqual(response.status_code,
+                             200)
+            self.assertEqual(body.count("\nid: "), 5)
+            self.assertNotIn("event: end", body)
+            self.assertEqual(scanned(scan), 5)
+
+            scan.reset_mock()
+            response = self.app.get("api/v1/jobs/83b955f2-b79a-11e8-8be9-c85b7671906d/events?since=45")    # noqa
+            payload = json.loads(response.data)
+            self.assertEqual(payload['data']['total_events'],
+                             5)
+            self.assertEqual(scanned(scan), 5)
+
+    def test_stream_invalid_job(self):
+        """- stream events for a playbook run that doesn't exist - error 404"""
+        response = self.app.get("api/v1/jobs/93b955f2-b79a-11e8-8be9-c85b76719093/events/stream")    # noqa
+
+        self.assertEqual(response.status_code,
+                         404)
+
+    def test_job_stdout(self):
+        """- fetch the output of a playbook run, from a byte offset"""
+        with open("samples/artifacts/53b955f2-b79a-11e8-8be9-c85b7671906d/stdout", "rb") as stdout_fd:  # noqa
+            stdout = stdout_fd.read()
+
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/stdout")    # noqa
+        self.assertEqual(response.status_code,
+                         200)
+        self.assertEqual(response.headers['Content-Type'],
+                         'text/plain; charset=utf-8')
+        self.assertEqual(response.data, stdout)
+
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/stdout?offset=1000")    # noqa
+        self.assertEqual(response.data, stdout[1000:])
+        self.assertEqual(int(response.headers['Content-Length']),
+                         len(stdout) - 1000)
+
+        # caught up with the output
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/stdout?offset={}".format(len(stdout)))    # noqa
+        self.assertEqual(response.status_code,
+                         200)
+        self.assertEqual(response.data, b'')
+
+    def test_job_stdout_invalid_offset(self):
+        """- reject an offset that isn't within the output"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/stdout?offset=-1")    # noqa
+        self.assertEqual(response.status_code,
+                         400)
+
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/stdout?offset=999999999")    # noqa
+        self.assertEqual(response.status_code,
+                         400)
+
+    def test_job_stdout_invalid_job(self):
+        """- fetch the output of a playbook run that doesn't exist"""
+        response = self.app.get("api/v1/jobs/invalid/stdout")
+
+        self.assertEqual(response.status_code,
+                         404)
+
+    def test_job_profile(self):
+        """- profile the tasks and hosts of a job"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/profile?top=2")  # noqa
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(len(payload['data']['tasks']),
+                         2)
+        self.assertEqual(payload['data']['tasks'][0]['task'],
+                         "check if disk is free")
+        self.assertEqual(len(payload['data']['hosts']),
+                         2)
+        self.assertEqual(payload['data']['hosts'][0]['host'],
+                         "con-2")
+        self.assertEqual(len(payload['data']['critical_path']),
+                         6)
+
+        profile_path = os.path.join(self.config.playbooks_root_dir,
+                                    "artifacts",
+                                    "53b955f2-b79a-11e8-8be9-c85b7671906d",
+                                    "profile.json")
+        self.assertTrue(os.path.exists(profile_path))
+
+    def test_job_profile_invalid_top(self):
+        """- reject a profile request with an invalid top value"""
+        response = self.app.get("api/v1/jobs/53b955f2-b79a-11e8-8be9-c85b7671906d/profile?top=0")  # noqa
+        self.assertEqual(response.status_code,
+                         400)
+
+    def test_job_profile_invalid_job(self):
+        """- profile of a job that doesn't exist"""
+        response = self.app.get("api/v1/jobs/00000000-b79a-11e8-8be9-c85b7671906d/profile")  # noqa
+        self.assertEqual(response.status_code,
+                         404)
+
+    def test_final_stats_without_event_files(self):
+        """- the stats of a play are found when ansible_runner has none"""
+        pb_path = os.path.join(self.config.playbooks_root_dir, "artifacts",
+                               "53b955f2-b79a-11e8-8be9-c85b7671906d")
+        runner = mock.Mock(stats=None)
+        runner.config.ident = "53b955f2-b79a-11e8-8be9-c85b7671906d"
+        runner.config.artifact_dir = pb_path
+
+        stats = final_stats(runner)
+        self.assertEqual(sorted(stats),
+                         ['dark', 'failures', 'ok', 'processed', 'skipped'])
+        self.assertIn('con-1', stats['processed'])
+
+    def test_compacted_job_events(self):
+        """- events of a compacted run are read from its segment"""
+        artifacts = os.path.join(self.config.playbooks_root_dir, "artifacts")
+        pb_path = os.path.join(artifacts,
+                               "63b955f2-b79a-11e8-8be9-c85b7671906d")
+        shutil.copytree(os.path.join(artifacts,
+                                     "53b955f2-b79a-11e8-8be9-c85b7671906d"),
+                        pb_path)
+        index_job_events(pb_path)
+        remove_event_files(pb_path)
+
+        self.assertFalse(os.path.exists(os.path.join(pb_path, "job_events")))
+        self.assertTrue(os.path.exists(os.path.join(pb_path,
+                                                    "job_events.seg")))
+
+        response = self.app.get("api/v1/jobs/63b955f2-b79a-11e8-8be9-c85b7671906d/events")  # noqa
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['total_events'],
+                         49)
+
+        response = self.app.get("api/v1/jobs/63b955f2-b79a-11e8-8be9-c85b7671906d/events?task_action=debug")  # noqa
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['total_events'],
+                         1)
+
+        response = self.app.get("api/v1/jobs/63b955f2-b79a-11e8-8be9-c85b7671906d/events/49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f")  # noqa
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['counter'],
+                         49)
+
+    def test_compacted_job_events_race(self):
+        """- a files index written while a play is compacted is not used"""
+        artifacts = os.path.join(self.config.playbooks_root_dir, "artifacts")
+        pb_path = os.path.join(artifacts,
+                               "73b955f2-b79a-11e8-8be9-c85b7671906d")
+        shutil.copytree(os.path.join(artifacts,
+                                     "53b955f2-b79a-11e8-8be9-c85b7671906d"),
+                        pb_path)
+        for leftover in ["job_events.idx", "job_events.seg"]:
+            if os.path.exists(os.path.join(pb_path, leftover)):
+                os.remove(os.path.join(pb_path, leftover))
+
+        # a reader indexes the event files as the play is compacted, and its
+        # index lands last (or is still cached by another process)
+        files_index = build_event_index(pb_path)
+        self.assertTrue(write_index(pb_path, files_index.entries))
+        with open(index_path(pb_path), 'rb') as idx_fd:
+            stale = idx_fd.read()
+
+        index_job_events(pb_path)
+        self.assertFalse(write_index(pb_path, files_index.entries))
+        with open(index_path(pb_path), 'wb') as idx_fd:
+            idx_fd.write(stale)
+        cache_index(pb_path, files_index)
+        remove_event_files(pb_path)
+
+        response = self.app.get("api/v1/jobs/73b955f2-b79a-11e8-8be9-c85b7671906d/events/49-e084d030-cd3d-4c76-a4d3-03d032c4dc8f")  # noqa
+        self.assertEqual(response.status_code,
+                         200)
+
+        index_cache.clear()
+        response = self.app.get("api/v1/jobs/73b955f2-b79a-11e8-8be9-c85b7671906d/events?task_action=debug")  # noqa
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['total_events'],
+                         1)
+
 
 if __name__ == "__main__":
 
@@ -1,10 +1,14 @@
 
 import sys
+import time
 import logging
+import tempfile
 import unittest
 
 sys.path.extend(["../", "./"])
-from common import APITestCase                  # noqa
+from common import APITestCase, make_event      # noqa
+from runner_service.cache import event_cache, JobEvents            # noqa
+from runner_service.services.playbook import record_startup        # noqa
 
 # turn of normal logging that the ansible_runner_service will generate
 nh = logging.NullHandler()
@@ -49,6 +53,68 @@ class TestAPIGeneric(APITestCase):
                 self.assertEqual(int(v.strip()), 1)
                 break
 
+    def metrics(self):
+        """ Return the values of the '/metrics' endpoint, by metric name """
+        response = self.app.get("https://localhost:5001/metrics")
+        self.assertEqual(response.status_code,
+                         200)
+
+        values = {}
+        for line in response.get_data(as_text=True).split('\n'):
+            if '{' not in line or line.startswith('#'):
+                continue
+            m_name, _ = line.split('{', 1)
+            _, v = line.rsplit('}', 1)
+            values.setdefault(m_name, float(v.strip()))
+        return values
+
+    def test_metrics_reported(self):
+        """- Test the service metrics in '/metrics' are present and track
+        the service"""
+
+        values = self.metrics()
+        for m_name in ['runner_service_event_scan_threads',
+                       'runner_service_event_scan_threads_busy',
+                       'runner_service_event_scan_processes',
+                       'runner_service_event_scans_pending',
+                       'runner_service_event_cache_hits',
+                       'runner_service_event_cache_misses',
+                       'runner_service_event_cache_evictions',
+                       'runner_service_event_cache_plays',
+                       'runner_service_event_cache_bytes',
+                       'runner_service_jobs_max_concurrent',
+                       'runner_service_job_queue_depth',
+                       'runner_service_job_queue_oldest_wait_secs',
+                       'runner_service_jobs_launched',
+                       'runner_service_job_queue_wait_secs',
+                       'runner_service_job_startups',
+                       'runner_service_job_startup_secs',
+                       'runner_service_job_startup_last_secs',
+                       'runner_service_job_startup_max_secs']:
+            self.assertIn(m_name, values)
+
+        self.assertEqual(values['runner_service_jobs_max_concurrent'],
+                         self.config.max_concurrent_jobs)
+
+        # a lookup of a cached play counts as a hit
+        event_cache.add('metrics-play', JobEvents(tempfile.gettempdir()))
+        self.addCleanup(event_cache._remove, 'metrics-play')
+        event_cache.add_event('metrics-play', make_event(1))
+        response = self.app.get("api/v1/jobs/metrics-play/events/1-event-1")
+        self.assertEqual(response.status_code,
+                         200)
+
+        # and a started play is timed
+        record_startup('metrics-play', time.time() - 2)
+
+        later = self.metrics()
+        self.assertEqual(later['runner_service_event_cache_hits'],
+                         values['runner_service_event_cache_hits'] + 1)
+        self.assertEqual(later['runner_service_job_startups'],
+                         values['runner_service_job_startups'] + 1)
+        self.assertGreaterEqual(later['runner_service_job_startup_last_secs'],
+                                2)
+
 
 if __name__ == "__main__":
 
@@ -2,6 +2,8 @@
 import os
 import sys
 import json
+import datetime
+from contextlib import closing
 import yaml
 import logging
 import unittest
@@ -9,6 +11,9 @@ import unittest
 sys.path.extend(["../", "./"])
 from common import APITestCase, fake_ssh_client  # noqa
 from runner_service.utils import fread           # noqa
+from runner_service.services.host_history import (backfill,  # noqa
+                                                   connect,
+                                                   record_play)
 
 # turn of normal logging that the ansible_runner_service will generate
 nh = logging.NullHandler()
@@ -156,6 +161,52 @@ class TestInventory(APITestCase):
         payload = json.loads(response.data)
         self.assertTrue(isinstance(payload['data']['hosts'], list))
 
+    def test_host_history(self):
+        """- show the plays that have run against a host"""
+        backfill()
+
+        response = self.app.get('api/v1/hosts/con-1/history')
+        self.assertEqual(response.status_code,
+                         200)
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['history'],
+                         [{"play_uuid": "53b955f2-b79a-11e8-8be9-c85b7671906d",   # noqa
+                           "playbook": "probe-disks.yml",
+                           "outcome": "changed",
+                           "status": "successful",
+                           "finished": "2018-09-13T21:16:55.644643"}])
+
+        response = self.app.get('api/v1/hosts/con-1/history?outcome=failed')
+        payload = json.loads(response.data)
+        self.assertEqual(payload['data']['total_plays'],
+                         0)
+
+    def test_host_history_finished_utc(self):
+        """- a play without stats is recorded as finished in UTC, like the
+        event timestamps"""
+        play_uuid = "a3b955f2-b79a-11e8-8be9-c85b7671906d"
+        pb_path = os.path.join(self.config.playbooks_root_dir, "artifacts",
+                               play_uuid)
+        os.makedirs(pb_path)
+        status_path = os.path.join(pb_path, "status")
+        with open(status_path, "w") as status_fd:
+            status_fd.write("failed")
+        os.utime(status_path, (1536873415, 1536873415))
+
+        self.assertTrue(record_play(play_uuid))
+        with closing(connect()) as conn:
+            finished, = conn.execute("SELECT finished FROM plays "
+                                     "WHERE play_uuid = ?",
+                                     (play_uuid,)).fetchone()
+        self.assertEqual(finished,
+                         datetime.datetime(2018, 9, 13, 21, 16, 55).isoformat())
+
+    def test_host_history_invalid_parms(self):
+        """- reject unsupported host history parameters"""
+        response = self.app.get('api/v1/hosts/con-1/history?task=RESULTS')
+        self.assertEqual(response.status_code,
+                         400)
+
     @fake_ssh_client
     def test_remove_valid_host(self):
         """- remove a host from a group"""
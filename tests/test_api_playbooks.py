@@ -3,10 +3,15 @@ import sys
 import json
 import time
 import logging
+import threading
 import unittest
+from unittest import mock
 
 sys.path.extend(["../", "./"])
 from common import APITestCase                # noqa
+from runner_service.services.scheduler import job_scheduler    # noqa
+from runner_service.inventory import AnsibleInventory          # noqa
+from runner_service.services import playbook                   # noqa
 
 # turn of normal logging that the ansible_runner_service will generate
 nh = logging.NullHandler()
@@ -34,6 +39,18 @@ class TestPlaybooks(APITestCase):
         payload = json.loads(response.data)
         self.assertTrue(payload['msg'] == "successful")
 
+    def test_playbook_status_cached(self):
+        """- the state of a finished run can be cached - 304 when unchanged"""
+        response = self.app.get('api/v1/playbooks/53b955f2-b79a-11e8-8be9-c85b7671906d')    # noqa
+        self.assertIn('max-age', response.headers['Cache-Control'])
+        etag = response.headers['ETag']
+
+        response = self.app.get('api/v1/playbooks/53b955f2-b79a-11e8-8be9-c85b7671906d',    # noqa
+                                headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code,
+                         304)
+        self.assertEqual(response.headers['ETag'], etag)
+
     def test_invalid_playbook_status(self):
         """- get playbook state for a non-existant playbook run"""
         response = self.app.get('api/v1/playbooks/9353b955f2-b79a-11e8-8be9-c85b76719093')  # noqa
@@ -143,6 +160,210 @@ class TestPlaybooks(APITestCase):
         self.assertEqual(response.status_code,
                          200)
 
+    def test_run_playbook_invalid_priority(self):
+        """- reject a playbook run with an unknown priority"""
+        response = self.app.post('api/v1/playbooks/testplaybook.yml?priority=urgent',   # noqa
+                                 data=json.dumps(dict()),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code,
+                         400)
+
+    def start_stubbed(self, status_delay):
+        """ POST a playbook run, with ansible_runner stubbed out. The stub
+        reports the run as starting after status_delay seconds, or never if
+        it's None """
+        started = []
+
+        def run_async(**parms):
+            stub = mock.Mock(status='starting')
+            started.append(parms['ident'])
+            if status_delay is not None:
+                status_data = {"status": "starting",
+                               "runner_ident": parms['ident']}
+                threading.Timer(status_delay, parms['status_handler'],
+                                args=(status_data,)).start()
+            return mock.Mock(), stub
+
+        with mock.patch.object(playbook, 'run_async', run_async), \
+                mock.patch.object(self.config, 'max_concurrent_jobs', 0):
+            begin = time.time()
+            response = self.app.post('api/v1/playbooks/testplaybook.yml',
+                                     data=json.dumps(dict()),
+                                     content_type="application/json")
+            elapsed = time.time() - begin
+
+        for play_uuid in started:
+            # the stub never finishes, so end the play here
+            self.addCleanup(playbook.end_unlaunched, play_uuid, "canceled")
+        return response, elapsed
+
+    def test_run_playbook_start_ack(self):
+        """- a playbook run returns as soon as ansible_runner starts it"""
+        response, elapsed = self.start_stubbed(0.2)
+        self.assertEqual(response.status_code,
+                         202)
+        payload = json.loads(response.data)
+        self.assertEqual(payload['msg'],
+                         "starting")
+        self.assertLess(elapsed, playbook.START_TIMEOUT)
+
+    def test_run_playbook_start_timeout(self):
+        """- a playbook run that doesn't start in time returns a timeout"""
+        with mock.patch.object(playbook, 'START_TIMEOUT', 0.5):
+            response, elapsed = self.start_stubbed(None)
+        self.assertEqual(response.status_code,
+                         504)
+        self.assertGreaterEqual(elapsed, 0.5)
+        payload = json.loads(response.data)
+        self.assertIn('play_uuid', payload['data'])
+
+    def test_queued_playbook(self):
+        """- queue a playbook when all the job slots are taken, and cancel it"""
+        # the slots may be held by the plays of other tests (or processes)
+        with mock.patch.object(job_scheduler, '_take_slot',
+                               return_value=False):
+            response = self.app.post('api/v1/playbooks/testplaybook.yml',
+                                     data=json.dumps(dict()),
+                                     content_type="application/json")
+            self.assertEqual(response.status_code,
+                             202)
+            payload = json.loads(response.data)
+            self.assertEqual(payload['msg'],
+                             "queued")
+
+            play_uuid = payload['data']['play_uuid']
+            response = self.app.get('api/v1/playbooks/{}'.format(play_uuid))
+            payload = json.loads(response.data)
+            self.assertEqual(payload['msg'],
+                             "queued")
+            self.assertEqual(payload['data']['queue_position'],
+                             1)
+            self.assertEqual(payload['data']['priority'],
+                             "normal")
+
+            response = self.app.delete('api/v1/playbooks/{}'.format(play_uuid))   # noqa
+            self.assertEqual(response.status_code,
+                             200)
+            self.assertEqual(job_scheduler.depth,
+                             0)
+
+            response = self.app.get('api/v1/playbooks/{}'.format(play_uuid))
+            payload = json.loads(response.data)
+            self.assertEqual(payload['msg'],
+                             "canceled")
+
+    def test_sharded_playbook(self):
+        """- run a playbook as shards of its hosts"""
+        hosts = ['shard-{}'.format(ctr) for ctr in range(5)]
+        # each change to the inventory saves and unlocks it
+        AnsibleInventory(excl=True).group_add('sharded')
+        for host in hosts:
+            AnsibleInventory(excl=True).host_add('sharded', host)
+        self.addCleanup(
+            lambda: AnsibleInventory(excl=True).group_remove('sharded'))
+
+        # hold the shards in the queue, so they don't run
+        with mock.patch.object(job_scheduler, '_take_slot',
+                               return_value=False):
+            response = self.app.post('api/v1/playbooks/testplaybook.yml?shards=2&limit={}'.format(','.join(hosts)),  # noqa
+                                     data=json.dumps(dict()),
+                                     content_type="application/json")
+            self.assertEqual(response.status_code,
+                             202)
+            payload = json.loads(response.data)
+            self.assertEqual(payload['msg'],
+                             "queued")
+            self.assertEqual(len(payload['data']['shards']),
+                             2)
+
+            play_uuid = payload['data']['play_uuid']
+            response = self.app.get('api/v1/playbooks/{}'.format(play_uuid))
+            payload = json.loads(response.data)
+            self.assertEqual(payload['msg'],
+                             "queued")
+            self.assertEqual([shard['hosts']
+                              for shard in payload['data']['shards']],
+                             [3, 2])
+
+            response = self.app.get('api/v1/jobs/{}/events'.format(play_uuid))  # noqa
+            self.assertEqual(response.status_code,
+                             200)
+            payload = json.loads(response.data)
+            self.assertEqual(payload['data']['total_events'],
+                             0)
+
+            response = self.app.get('api/v1/jobs/{}/events?limit=5'.format(play_uuid))  # noqa
+            self.assertEqual(response.status_code,
+                             400)
+
+            response = self.app.delete('api/v1/playbooks/{}'.format(play_uuid))   # noqa
+            self.assertEqual(response.status_code,
+                             200)
+
+            response = self.app.get('api/v1/playbooks/{}'.format(play_uuid))
+            payload = json.loads(response.data)
+            self.assertEqual(payload['msg'],
+                             "canceled")
+
+    def test_sharded_playbook_group(self):
+        """- run a playbook as shards of a group's members"""
+        hosts = ['group-shard-{}'.format(ctr) for ctr in range(4)]
+        AnsibleInventory(excl=True).group_add('sharded_group')
+        for host in hosts:
+            AnsibleInventory(excl=True).host_add('sharded_group', host)
+        AnsibleInventory(excl=True).group_add('unsharded')
+        AnsibleInventory(excl=True).host_add('unsharded', 'group-outsider')
+        self.addCleanup(
+            lambda: AnsibleInventory(excl=True).group_remove('sharded_group'))
+        self.addCleanup(
+            lambda: AnsibleInventory(excl=True).group_remove('unsharded'))
+
+        with mock.patch.object(job_scheduler, '_take_slot',
+                               return_value=False):
+            response = self.app.post('api/v1/playbooks/testplaybook.yml?shards=2&shard_group=sharded_group',  # noqa
+                                     data=json.dumps(dict()),
+                                     content_type="application/json")
+            self.assertEqual(response.status_code,
+                             202)
+            play_uuid = json.loads(response.data)['data']['play_uuid']
+
+            response = self.app.get('api/v1/playbooks/{}'.format(play_uuid))
+            payload = json.loads(response.data)
+            # only the group's members are spread across the shards
+            self.assertEqual([shard['hosts']
+                              for shard in payload['data']['shards']],
+                             [2, 2])
+
+            self.app.delete('api/v1/playbooks/{}'.format(play_uuid))
+
+            # a limit narrows the group down, without adding to it
+            response = self.app.post('api/v1/playbooks/testplaybook.yml?shards=2&shard_group=sharded_group&limit={},{},group-outsider'.format(hosts[0], hosts[1]),  # noqa
+                                     data=json.dumps(dict()),
+                                     content_type="application/json")
+            self.assertEqual(response.status_code,
+                             202)
+            play_uuid = json.loads(response.data)['data']['play_uuid']
+
+            response = self.app.get('api/v1/playbooks/{}'.format(play_uuid))
+            payload = json.loads(response.data)
+            self.assertEqual([shard['hosts']
+                              for shard in payload['data']['shards']],
+                             [1, 1])
+
+            self.app.delete('api/v1/playbooks/{}'.format(play_uuid))
+
+    def test_sharded_playbook_invalid(self):
+        """- reject an invalid shard count or hosts to shard"""
+        for query in ['shards=0',
+                      'shards=2',
+                      'shards=2&shard_group=missing_group',
+                      'shard_group=all']:
+            response = self.app.post('api/v1/playbooks/testplaybook.yml?{}'.format(query),   # noqa
+                                     data=json.dumps(dict()),
+                                     content_type="application/json")
+            self.assertEqual(response.status_code,
+                             400)
+
 
 if __name__ == "__main__":
 
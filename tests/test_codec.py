@@ -0,0 +1,50 @@
+import sys
+import math
+import logging
+import unittest
+from collections import OrderedDict
+
+sys.path.extend(["../", "./"])
+from runner_service import codec     # noqa E402
+
+# turn of normal logging that the ansible_runner_service will generate
+nh = logging.NullHandler()
+r = logging.getLogger()
+r.addHandler(nh)
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_round_trip(self):
+        """- documents decode to the same object they were encoded from"""
+        event = {"counter": 1,
+                 "event": "runner_on_ok",
+                 "event_data": {"res": {"msg": "café", "rc": 0}}}
+
+        self.assertEqual(codec.loads(codec.dumps(event)), event)
+        self.assertEqual(codec.loads(codec.dumps_bytes(event)), event)
+        self.assertEqual(codec.loads(memoryview(codec.dumps_bytes(event))),
+                         event)
+
+    def test_key_order(self):
+        """- the order of an OrderedDict is kept"""
+        events = OrderedDict([("10-b", {}), ("2-a", {})])
+
+        self.assertLess(codec.dumps(events).index("10-b"),
+                        codec.dumps(events).index("2-a"))
+
+    def test_stdlib_fallback(self):
+        """- documents outside the fast codec's range are still handled"""
+        self.assertEqual(codec.loads(codec.dumps({"big": 2 ** 70})),
+                         {"big": 2 ** 70})
+        self.assertTrue(math.isnan(codec.loads('{"n": NaN}')['n']))
+
+    def test_invalid_json(self):
+        """- invalid JSON raises a ValueError"""
+        with self.assertRaises(ValueError):
+            codec.loads(b'{"counter": ')
+
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
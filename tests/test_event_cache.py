@@ -0,0 +1,94 @@
+import sys
+import logging
+import unittest
+
+sys.path.extend(["../", "./"])
+from runner_service import configuration                    # noqa E402
+from runner_service.cache import EventCache, JobEvents      # noqa E402
+from common import make_event                               # noqa E402
+
+# turn of normal logging that the ansible_runner_service will generate
+nh = logging.NullHandler()
+r = logging.getLogger()
+r.addHandler(nh)
+
+
+class TestEventCache(unittest.TestCase):
+
+    def setUp(self):
+        configuration.init("dev")
+        configuration.settings.event_cache_size = 3
+        configuration.settings.event_cache_max_bytes = 64 * 1024
+
+    def test_evict_by_count(self):
+        """- the least recently used play is evicted beyond event_cache_size"""
+        cache = EventCache()
+        for play in ['a', 'b', 'c', 'd']:
+            cache.add(play, JobEvents('/tmp'))
+
+        self.assertNotIn('a', cache)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_reads_update_recency(self):
+        """- reading a play protects it from eviction"""
+        cache = EventCache()
+        for play in ['a', 'b', 'c']:
+            cache.add(play, JobEvents('/tmp'))
+        cache.get('a')
+        cache.add('d', JobEvents('/tmp'))
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+
+    def test_evict_by_size(self):
+        """- plays are evicted once the events exceed event_cache_max_bytes"""
+        cache = EventCache()
+        cache.add('small', JobEvents('/tmp'))
+        cache.add_event('small', make_event(1))
+        cache.add('large', JobEvents('/tmp'))
+        for counter in range(1, 1000):
+            cache.add_event('large', make_event(counter))
+            if 'small' not in cache:
+                break
+
+        self.assertNotIn('small', cache)
+        self.assertIn('large', cache)
+        self.assertLessEqual(cache.nbytes, 64 * 1024)
+
+        configuration.settings.event_cache_max_bytes = 1024
+        cache.add_event('large', make_event(1000))
+        self.assertNotIn('large', cache)
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_records_are_compact(self):
+        """- cached events only hold their summary fields once written"""
+        job_events = JobEvents('/tmp')
+        job_events.add(make_event(1, stdout='x' * 65536))
+        job_events.add(make_event(2))
+
+        self.assertLess(job_events.nbytes, 4096)
+        self.assertIsNone(job_events.get('event-1').data)
+        self.assertIsNotNone(job_events.get('event-2').data)
+        self.assertEqual(job_events.get('event-1').summary,
+                         {"event": "runner_on_ok",
+                          "host": "localhost",
+                          "task": "task-1"})
+
+        job_events.finish('successful')
+        self.assertIsNone(job_events.get('event-2').data)
+
+    def test_hits_and_misses(self):
+        """- lookups are counted as hits or misses"""
+        cache = EventCache()
+        cache.add('a', JobEvents('/tmp'))
+        cache.get('a')
+        cache.get('missing')
+
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
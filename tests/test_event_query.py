@@ -0,0 +1,64 @@
+import sys
+import logging
+import unittest
+
+sys.path.extend(["../", "./"])
+from runner_service.services.event_query import parse_query     # noqa E402
+from common import make_event                                   # noqa E402
+
+# turn of normal logging that the ansible_runner_service will generate
+nh = logging.NullHandler()
+r = logging.getLogger()
+r.addHandler(nh)
+
+
+def matches(query, event_info):
+    return all(condition.matches_event(event_info)
+               for condition in query.conditions)
+
+
+class TestEventQuery(unittest.TestCase):
+
+    def test_parse_terms(self):
+        """- each operator is found, whichever way the query string split"""
+        query = parse_query({"host": "con-1",
+                             "counter>": "5",
+                             "counter<10": "",
+                             "task~": "^Install",
+                             "event!": "runner_on_skipped"})
+
+        self.assertEqual(dict(query), {"host": "con-1"})
+        self.assertEqual([repr(c) for c in query.conditions],
+                         ["counter>=5", "counter<10", "task~=^Install",
+                          "event!=runner_on_skipped"])
+
+    def test_conditions(self):
+        """- conditions compare numbers as numbers, and other values as
+        strings"""
+        query = parse_query({"counter>": "9",
+                             "created<2019-01-01T00:00:30": "",
+                             "event_data.res.rc!": "2"})
+
+        self.assertFalse(matches(query, make_event(5)))
+        self.assertTrue(matches(query, make_event(10)))
+        self.assertFalse(matches(query, make_event(30)))
+        self.assertFalse(matches(query, make_event(10, rc=2)))
+
+    def test_missing_fields(self):
+        """- a missing field only satisfies a negated condition"""
+        self.assertTrue(matches(parse_query({"role!": "common"}),
+                                make_event(1)))
+        self.assertFalse(matches(parse_query({"role~": "."}),
+                                 make_event(1)))
+
+    def test_invalid_terms(self):
+        """- invalid patterns and terms without a field are rejected"""
+        with self.assertRaises(ValueError):
+            parse_query({"task~": "("})
+        with self.assertRaises(ValueError):
+            parse_query({">5": ""})
+
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
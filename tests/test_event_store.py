@@ -0,0 +1,96 @@
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+
+sys.path.extend(["../", "./"])
+from runner_service.services.event_index import (make_entry,       # noqa E402
+                                                 STORAGE_LOG,
+                                                 STORAGE_SEGMENT)
+from runner_service.services.event_store import (EventLog,         # noqa E402
+                                                 iter_log,
+                                                 iter_segment,
+                                                 read_log,
+                                                 read_events,
+                                                 write_segment)
+from runner_service.services.scanner import (event_scanner,       # noqa E402
+                                             ScanError)
+from common import make_event                                     # noqa E402
+
+# turn of normal logging that the ansible_runner_service will generate
+nh = logging.NullHandler()
+r = logging.getLogger()
+r.addHandler(nh)
+
+
+def failing_blobs(entries):
+    yield b'{}'
+    raise OSError("read failed")
+
+
+def failing_chunk(chunk):
+    raise ValueError("unreadable chunk")
+
+
+class TestEventStore(unittest.TestCase):
+
+    def setUp(self):
+        self.pb_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.pb_path)
+
+    def write_log(self, count):
+        event_log = EventLog(self.pb_path)
+        entries = []
+        for counter in range(1, count + 1):
+            offset, length = event_log.append(make_event(counter))
+            entries.append(make_entry(make_event(counter), offset, length))
+        event_log.close()
+        return entries
+
+    def test_log_reads(self):
+        """- events appended to a log are read back by offset"""
+        entries = self.write_log(5)
+
+        events = [event_info for _entry, event_info
+                  in read_events(self.pb_path, STORAGE_LOG, entries[2:4])]
+        self.assertEqual(events, [make_event(3), make_event(4)])
+
+    def test_log_rebuild(self):
+        """- a log can be read back without an index"""
+        entries = self.write_log(5)
+
+        rebuilt = [make_entry(event_info, offset, length)
+                   for offset, length, event_info in iter_log(self.pb_path)]
+        self.assertEqual(rebuilt, entries)
+
+    def test_segment_from_log(self):
+        """- a log compacted into a segment holds the same events"""
+        entries = self.write_log(5)
+        seg_entries = write_segment(self.pb_path, entries,
+                                    read_log(self.pb_path, entries))
+
+        events = [event_info for _entry, event_info
+                  in read_events(self.pb_path, STORAGE_SEGMENT, seg_entries)]
+        self.assertEqual(events, [make_event(c) for c in range(1, 6)])
+        self.assertEqual(len(list(iter_segment(self.pb_path))), 5)
+
+    def test_segment_write_failure(self):
+        """- a segment that can't be written leaves no files behind"""
+        entries = self.write_log(5)
+        self.assertIsNone(write_segment(self.pb_path, entries,
+                                        failing_blobs(entries)))
+        self.assertEqual(os.listdir(self.pb_path), ["job_events.log"])
+
+    def test_scan_failure(self):
+        """- a scan with a failed chunk raises, rather than dropping it"""
+        with self.assertRaises(ScanError):
+            event_scanner.scan(failing_chunk, list(range(10)))
+
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,151 @@
+import sys
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.extend(["../", "./"])
+from runner_service import configuration                        # noqa E402
+from runner_service.services.scheduler import JobScheduler     # noqa E402
+from runner_service.services import scheduler                  # noqa E402
+
+# turn of normal logging that the ansible_runner_service will generate
+nh = logging.NullHandler()
+r = logging.getLogger()
+r.addHandler(nh)
+
+
+class TestJobScheduler(unittest.TestCase):
+
+    def setUp(self):
+        configuration.init("dev")
+        configuration.settings.max_concurrent_jobs = 2
+        self.slots_dir = tempfile.mkdtemp()
+        self.scheduler = JobScheduler(self.slots_dir)
+        self.launched = []
+
+    def tearDown(self):
+        with self.scheduler.lock:
+            del self.scheduler.queue[:]
+        self.drain()
+        shutil.rmtree(self.slots_dir)
+
+    def submit(self, play_uuid, client=None, priority='normal'):
+        return self.scheduler.submit(play_uuid,
+                                     lambda: self.launched.append(play_uuid),
+                                     client,
+                                     priority)
+
+    def drain(self):
+        while self.scheduler.running:
+            self.scheduler.finished(next(iter(self.scheduler.running)))
+
+    def test_limit(self):
+        """- runs beyond max_concurrent_jobs are queued"""
+        self.assertTrue(self.submit('a'))
+        self.assertTrue(self.submit('b'))
+        self.assertFalse(self.submit('c'))
+        self.assertEqual(self.launched, ['a', 'b'])
+        self.assertEqual(self.scheduler.depth, 1)
+        self.assertEqual(self.scheduler.position('c'), 1)
+
+    def test_fifo(self):
+        """- queued runs are launched in order as slots are released"""
+        for play_uuid in 'abcde':
+            self.submit(play_uuid)
+        self.scheduler.finished('a')
+        self.assertEqual(self.launched, ['a', 'b', 'c'])
+        self.scheduler.finished('b')
+        self.scheduler.finished('c')
+        self.assertEqual(self.launched, ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(self.scheduler.depth, 0)
+        self.assertEqual(self.scheduler.started, 5)
+
+    def test_cancel(self):
+        """- a canceled run leaves the queue without launching"""
+        for play_uuid in 'abcd':
+            self.submit(play_uuid)
+        self.assertTrue(self.scheduler.cancel('c'))
+        self.assertFalse(self.scheduler.cancel('a'))
+        self.assertEqual(self.scheduler.position('d'), 1)
+        self.scheduler.finished('a')
+        self.assertEqual(self.launched, ['a', 'b', 'd'])
+
+    def test_failed_launch(self):
+        """- a run that fails to launch releases its slot"""
+        def broken():
+            raise RuntimeError("no ansible")
+
+        configuration.settings.max_concurrent_jobs = 1
+        self.assertTrue(self.scheduler.submit('a', broken))
+        self.assertTrue(self.submit('b'))
+        self.assertEqual(self.launched, ['b'])
+
+    def test_fair_share(self):
+        """- a burst of runs from one client doesn't hold up another"""
+        configuration.settings.max_concurrent_jobs = 1
+        self.submit('busy')
+        for ctr in range(5):
+            self.submit('bulk-{}'.format(ctr), client='nightly')
+        self.submit('fix', client='operator')
+        self.assertEqual(self.scheduler.position('fix'), 2)
+        self.drain()
+        self.assertEqual(self.launched, ['busy', 'bulk-0', 'fix', 'bulk-1',
+                                         'bulk-2', 'bulk-3', 'bulk-4'])
+
+    def test_priority(self):
+        """- high priority runs overtake the queue, without starving it"""
+        configuration.settings.max_concurrent_jobs = 1
+        self.submit('busy')
+        for ctr in range(3):
+            self.submit('low-{}'.format(ctr), client='a', priority='low')
+        for ctr in range(4):
+            self.submit('high-{}'.format(ctr), client='b', priority='high')
+        self.assertEqual(self.scheduler.depth_by_priority(),
+                         {'high': 4, 'normal': 0, 'low': 3})
+        self.drain()
+        self.assertEqual(self.launched, ['busy', 'high-0', 'high-1',
+                                         'high-2', 'low-0', 'high-3',
+                                         'low-1', 'low-2'])
+
+    def test_priority_same_client(self):
+        """- a client's high priority run overtakes its own queued runs"""
+        configuration.settings.max_concurrent_jobs = 1
+        self.submit('busy')
+        for ctr in range(5):
+            self.submit('low-{}'.format(ctr), client='a', priority='low')
+        self.submit('high', client='a', priority='high')
+        self.assertEqual(self.scheduler.position('high'), 1)
+        self.drain()
+        self.assertEqual(self.launched, ['busy', 'high', 'low-0', 'low-1',
+                                         'low-2', 'low-3', 'low-4'])
+
+    def test_shared_slots(self):
+        """- the slots are shared with the schedulers of other processes"""
+        configuration.settings.max_concurrent_jobs = 1
+        other = JobScheduler(self.slots_dir)
+        launched = threading.Event()
+
+        self.assertTrue(self.submit('a'))
+        with mock.patch.object(scheduler, 'SLOT_POLL_INTERVAL', 0.05):
+            self.assertFalse(other.submit('b', launched.set))
+            self.assertFalse(launched.wait(0.2))
+            self.scheduler.finished('a')
+            self.assertTrue(launched.wait(5))
+        self.assertEqual(other.running, {'b'})
+        self.assertFalse(self.submit('c'))
+        other.finished('b')
+
+    def test_unlimited(self):
+        """- a limit of 0 launches every run"""
+        configuration.settings.max_concurrent_jobs = 0
+        for play_uuid in 'abcde':
+            self.assertTrue(self.submit(play_uuid))
+        self.assertEqual(self.scheduler.depth, 0)
+
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
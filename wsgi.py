@@ -1,6 +1,8 @@
 import runner_service.configuration as configuration
 from runner_service.app import create_app
-from ansible_runner_service import setup_common_environment, remove_artifacts_init
+from ansible_runner_service import (setup_common_environment,
+                                    remove_artifacts_init,
+                                    host_history_init)
 
 
 """
@@ -19,5 +21,9 @@ setup_common_environment()
 # Setup remove of artifacts
 remove_artifacts_init()
 
+# Record any plays that finished while the service wasn't running
+if configuration.settings.host_history:
+    host_history_init()
+
 # The object to be managed by uwsgi
 application = create_app()